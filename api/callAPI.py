@@ -1,46 +1,125 @@
-import vertexai, os
-from vertexai.generative_models import GenerativeModel, Part, GenerationConfig
-from dotenv import load_dotenv
-from google.oauth2 import service_account
+import os
 import sys
+import time
+import threading
 import traceback
 import logging
+from typing import Optional
+
+from process.tracing import span
+
+# vertexai / google.oauth2 / dotenv được import lười khi cần để khởi động nhanh
 
 logger = logging.getLogger(__name__)
 
-# ============ QUAN TRỌNG: Xử lý đường dẫn cho PyInstaller ============
-if getattr(sys, 'frozen', False):
-    # Chạy từ file .exe (PyInstaller)
-    base_path = sys._MEIPASS  # Thư mục tạm của PyInstaller
-else:
-    # Chạy từ Python script thường
-    base_path = os.path.dirname(__file__)
+_env_loaded = False
+_env_lock = threading.Lock()
+
+# vertexai.init là cấu hình toàn cục → khóa để nhiều client (khác region/project) khởi tạo tuần tự
+_init_lock = threading.Lock()
+
+
+def load_env():
+    """Load .env một lần duy nhất (gọi lười khi cần credentials)"""
+    global _env_loaded
+    with _env_lock:
+        if _env_loaded:
+            return
+        _env_loaded = True
+
+        from dotenv import load_dotenv
+
+        # ============ QUAN TRỌNG: Xử lý đường dẫn cho PyInstaller ============
+        if getattr(sys, 'frozen', False):
+            # Chạy từ file .exe (PyInstaller)
+            base_path = sys._MEIPASS  # Thư mục tạm của PyInstaller
+        else:
+            # Chạy từ Python script thường
+            base_path = os.path.dirname(__file__)
+
+        # Đường dẫn đến file .env
+        dotenv_path = os.path.join(base_path, '.env')
 
-# Đường dẫn đến file .env
-dotenv_path = os.path.join(base_path, '.env')
+        # Load .env với explicit path
+        if os.path.exists(dotenv_path):
+            load_dotenv(dotenv_path)
+            logger.info("Loaded .env from: %s", dotenv_path)
+        else:
+            logger.warning(".env not found at %s", dotenv_path)
+            logger.info("Base path: %s", base_path)
+            if os.path.exists(base_path):
+                logger.info("Files in base_path: %s", os.listdir(base_path))
 
-# Load .env với explicit path
-if os.path.exists(dotenv_path):
-    load_dotenv(dotenv_path)
-    logger.info(f"Loaded .env from: {dotenv_path}")
-else:
-    logger.warning(f".env not found at {dotenv_path}")
-    logger.info(f"Base path: {base_path}")
-    if os.path.exists(base_path):
-        logger.info(f"Files in base_path: {os.listdir(base_path)}")
+
+def finish_reason_name(reason) -> Optional[str]:
+    """Tên finish_reason: SDK trả IntEnum, str() trên Python 3.11 ra '2' thay vì 'MAX_TOKENS'"""
+    if reason is None or reason == '':
+        return None
+    return getattr(reason, 'name', None) or str(reason)
+
+
+def is_truncated(reason) -> bool:
+    """Output bị cắt do hết max_output_tokens (dùng chung cho chế độ đồng bộ và batch)"""
+    return finish_reason_name(reason) == 'MAX_TOKENS'
 
 
 class VertexClient:
     """Client để tương tác với Vertex AI - PHIÊN BẢN CẢI TIẾN"""
     
+    # Hỗ trợ response_mime_type="application/json" + response_schema (Gemini 1.5+)
+    supports_structured_output = True
+    
     def __init__(self, project_id, creds, model, region="us-central1"):
-        vertexai.init(
-            project=project_id,
-            location=region,
-            credentials=creds
-        )
-        self.model = GenerativeModel(model)
-        logger.info(f"✅ Initialized VertexClient with model: {model}")
+        import vertexai
+        from vertexai.generative_models import GenerativeModel
+
+        with _init_lock:
+            vertexai.init(
+                project=project_id,
+                location=region,
+                credentials=creds
+            )
+            self.model = GenerativeModel(model)
+            # GenerativeModel ghi nhớ project/region khi khởi tạo nhưng tạo prediction client lười
+            # từ cấu hình toàn cục → tạo ngay trong lock để client gắn với đúng credentials/region này
+            # (SDK không có API công khai tương đương; lỗi ở đây nghĩa là client sẽ dùng cấu hình
+            # toàn cục lúc gọi lần đầu → có thể sai project/credentials khi chạy nhiều endpoint)
+            try:
+                self.model._prediction_client
+            except Exception as e:
+                logger.warning("⚠️ Không tạo sẵn prediction client cho %s/%s: %s", project_id, region, e)
+        self.project_id = project_id
+        self.region = region
+        self.model_name = model
+        self._local = threading.local()
+        logger.info("✅ Initialized VertexClient with model: %s (%s/%s)", model, project_id, region)
+
+    def last_call_info(self):
+        """
+        Thông tin lần gọi gần nhất của thread hiện tại:
+        model, latency, prompt_tokens, output_tokens, finish_reason, error
+        """
+        return getattr(self._local, 'info', None)
+
+    def _record_call(self, started, response=None, error=None):
+        """Lưu usage/finish_reason của lần gọi vào thread-local"""
+        info = {
+            'model': self.model_name,
+            'latency': time.perf_counter() - started,
+            'prompt_tokens': None,
+            'output_tokens': None,
+            'finish_reason': None,
+            'error': str(error) if error else None,
+        }
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            info['prompt_tokens'] = getattr(usage, 'prompt_token_count', None)
+            info['output_tokens'] = getattr(usage, 'candidates_token_count', None)
+        candidates = getattr(response, 'candidates', None)
+        if candidates:
+            info['finish_reason'] = finish_reason_name(getattr(candidates[0], 'finish_reason', None))
+        self._local.info = info
+        return info
     
     def _safe_extract_text(self, response):
         """Xử lý response an toàn, tránh lỗi multiple content parts"""
@@ -61,15 +140,15 @@ class VertexClient:
                                 text_parts.append(part.text.strip())
                         if text_parts:
                             full_text = '\n'.join(text_parts)
-                            logger.info(f"📄 Extracted {len(full_text)} chars from {len(text_parts)} parts")
+                            logger.info("📄 Extracted %s chars from %s parts", len(full_text), len(text_parts))
                             return full_text
             
             # Nếu vẫn không có text, thử lấy từ finish_reason
             if hasattr(response, 'candidates') and response.candidates:
                 candidate = response.candidates[0]
                 if hasattr(candidate, 'finish_reason'):
-                    reason = str(candidate.finish_reason)
-                    logger.warning(f"Response finished with reason: {reason}")
+                    reason = finish_reason_name(candidate.finish_reason) or ''
+                    logger.warning("Response finished with reason: %s", reason)
                     
                     # Nếu bị SAFETY hoặc MAX_TOKENS, log chi tiết
                     if 'SAFETY' in reason:
@@ -83,11 +162,12 @@ class VertexClient:
             return "Không thể lấy được nội dung từ AI response"
             
         except Exception as e:
-            logger.error(f"Lỗi xử lý response: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Lỗi xử lý response: %s", e)
+            logger.error("Traceback: %s", traceback.format_exc())
             return f"Lỗi xử lý response: {str(e)}"
 
-    def send_data_to_AI(self, prompt, file_paths=None, temperature=0.7, top_p=0.8, max_output_tokens=8192):
+    def send_data_to_AI(self, prompt, file_paths=None, temperature=0.7, top_p=0.8, max_output_tokens=8192,
+                        response_mime_type=None, response_schema=None):
         """
         Gửi prompt và files đến AI để sinh nội dung
         
@@ -97,10 +177,14 @@ class VertexClient:
             temperature: Temperature (0.0-1.0)
             top_p: Top-p sampling (0.0-1.0)
             max_output_tokens: Số tokens tối đa cho output (QUAN TRỌNG cho HTML dài)
+            response_mime_type: "application/json" để model trả về JSON thuần
+            response_schema: OpenAPI schema ràng buộc cấu trúc JSON trả về
             
         Returns:
             str: Response text từ AI
         """
+        from vertexai.generative_models import Part, GenerationConfig
+
         parts = []
         
         # Thêm files nếu có
@@ -120,43 +204,57 @@ class VertexClient:
                     parts.append(
                         Part.from_data(data=file_bytes, mime_type=mime_type)
                     )
-                    logger.info(f"📎 Loaded file: {os.path.basename(file_path)}")
+                    logger.info("📎 Loaded file: %s", os.path.basename(file_path))
                 except Exception as e:
-                    logger.error(f"❌ Error loading file {file_path}: {e}")
+                    logger.error("❌ Error loading file %s: %s", file_path, e)
         
         # Thêm prompt text
         parts.append(Part.from_text(prompt))
         
+        # Structured output: chỉ truyền khi được yêu cầu
+        structured = {}
+        if response_mime_type:
+            structured['response_mime_type'] = response_mime_type
+        if response_schema:
+            structured['response_schema'] = response_schema
+        
         # Generation config với max_output_tokens cao
         generation_config = GenerationConfig(
             temperature=temperature,
             top_p=top_p,
             max_output_tokens=max_output_tokens,  # QUAN TRỌNG: Đủ lớn cho HTML dài
-            candidate_count=1
+            candidate_count=1,
+            **structured
         )
         
-        logger.info(f"🤖 Calling AI with: temp={temperature}, top_p={top_p}, max_tokens={max_output_tokens}")
+        logger.info("🤖 Calling AI with: temp=%s, top_p=%s, max_tokens=%s%s", temperature, top_p, max_output_tokens,
+                    f", mime={response_mime_type}" if response_mime_type else "")
         
+        started = time.perf_counter()
         try:
-            response = self.model.generate_content(
-                parts, 
-                generation_config=generation_config,
-                stream=False
-            )
+            with span("vertex.generate_content", "api", model=self.model_name, region=self.region) as sp:
+                response = self.model.generate_content(
+                    parts, 
+                    generation_config=generation_config,
+                    stream=False
+                )
+                info = self._record_call(started, response)
+                sp.set(prompt_tokens=info['prompt_tokens'], output_tokens=info['output_tokens'])
             
             # Extract text
             result = self._safe_extract_text(response)
             
             if result:
-                logger.info(f"✅ AI responded with {len(result)} chars")
+                logger.info("✅ AI responded with %s chars", len(result))
             else:
                 logger.error("❌ AI response is empty!")
             
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error calling AI: {str(e)}")
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            self._record_call(started, error=e)
+            logger.error("❌ Error calling AI: %s", e)
+            logger.error("Traceback: %s", traceback.format_exc())
             return None
         
     def send_data_to_check(self, prompt, temperature=0.5, top_p=0.8, max_output_tokens=8192):
@@ -172,6 +270,8 @@ class VertexClient:
         Returns:
             str: Response text từ AI
         """
+        from vertexai.generative_models import Part, GenerationConfig
+
         parts = [Part.from_text(prompt)]
 
         generation_config = GenerationConfig(
@@ -181,30 +281,45 @@ class VertexClient:
             candidate_count=1
         )
 
-        logger.info(f"🔍 Calling AI for check: temp={temperature}, top_p={top_p}")
+        logger.info("🔍 Calling AI for check: temp=%s, top_p=%s", temperature, top_p)
         
         try:
-            response = self.model.generate_content(
-                parts, 
-                generation_config=generation_config,
-                stream=False
-            )
+            with span("vertex.generate_content", "api", model=self.model_name, region=self.region, check=True):
+                response = self.model.generate_content(
+                    parts, 
+                    generation_config=generation_config,
+                    stream=False
+                )
             
             result = self._safe_extract_text(response)
             
             if result:
-                logger.info(f"✅ Check response: {len(result)} chars")
+                logger.info("✅ Check response: %s chars", len(result))
             
             return result
             
         except Exception as e:
-            logger.error(f"❌ Error calling AI for check: {str(e)}")
+            logger.error("❌ Error calling AI for check: %s", e)
             return None
 
 
-def get_vertex_ai_credentials():
-    """Tạo credentials từ service account info trong .env"""
+def get_vertex_ai_credentials(service_account_file=None):
+    """
+    Tạo credentials từ service account info trong .env
+    
+    Args:
+        service_account_file: (tùy chọn) file JSON của service account khác, dùng cho project khác
+    """
     try:
+        load_env()
+        from google.oauth2 import service_account
+        
+        if service_account_file:
+            return service_account.Credentials.from_service_account_file(
+                service_account_file,
+                scopes=["https://www.googleapis.com/auth/cloud-platform"]
+            )
+        
         # Kiểm tra các biến môi trường cần thiết
         required_vars = [
             "TYPE", "PROJECT_ID", "PRIVATE_KEY_ID", "PRIVATE_KEY",
@@ -213,7 +328,7 @@ def get_vertex_ai_credentials():
         
         missing_vars = [var for var in required_vars if not os.getenv(var)]
         if missing_vars:
-            logger.error(f"❌ Missing environment variables: {', '.join(missing_vars)}")
+            logger.error("❌ Missing environment variables: %s", ', '.join(missing_vars))
             return None
         
         # Tạo service account data
@@ -241,6 +356,6 @@ def get_vertex_ai_credentials():
         return credentials
         
     except Exception as e:
-        logger.error(f"❌ Lỗi khi tạo credentials: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("❌ Lỗi khi tạo credentials: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         return None
\ No newline at end of file
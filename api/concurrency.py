@@ -0,0 +1,202 @@
+# api/concurrency.py
+
+import time
+import threading
+import statistics
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lỗi cho thấy backend đang quá tải (giảm giới hạn); lỗi khác (safety, prompt sai...) không tính
+OVERLOAD_MARKERS = ('429', 'resource exhausted', 'resource_exhausted', 'quota', 'rate limit',
+                    '503', 'unavailable', 'deadline', 'timed out', 'timeout')
+
+
+# Lỗi do chính request (schema/tham số sai): endpoint nào cũng trả lỗi y hệt → không thử lại, không tính là endpoint lỗi
+CLIENT_ERROR_MARKERS = ('400', 'invalid argument', 'invalid_argument', 'invalidargument')
+
+
+def is_overload(error: Optional[str]) -> bool:
+    return bool(error) and any(m in str(error).lower() for m in OVERLOAD_MARKERS)
+
+
+def is_client_error(error: Optional[str]) -> bool:
+    return bool(error) and not is_overload(error) and any(m in str(error).lower() for m in CLIENT_ERROR_MARKERS)
+
+
+class _Ticket:
+    __slots__ = ('started', 'saturated')
+
+    def __init__(self, started: float, saturated: bool):
+        self.started = started
+        self.saturated = saturated
+
+
+class AIMDLimiter:
+    """
+    Giới hạn số request đang chạy, tự điều chỉnh theo AIMD (additive-increase / multiplicative-decrease):
+    - Thành công khi đang dùng hết giới hạn → tăng thêm increase/limit (≈ +increase mỗi "vòng" limit request)
+    - 429/503/timeout hoặc độ trễ (chuẩn hóa theo số token output) vượt latency_tolerance × mức nền
+      → nhân giới hạn với decrease
+    Mỗi đợt quá tải chỉ giảm 1 lần: lỗi của các request đã gửi trước lần giảm gần nhất bị bỏ qua.
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 increase: float = 1.0, decrease: float = 0.5, latency_tolerance: float = 2.0,
+                 baseline_window: int = 200, history_size: int = 1000):
+        """
+        Args:
+            initial: Giới hạn ban đầu
+            min_limit, max_limit: Biên của giới hạn
+            increase: Mức tăng cộng mỗi vòng thành công
+            decrease: Hệ số nhân khi quá tải (0 < decrease < 1)
+            latency_tolerance: Độ trễ > tolerance × mức nền thì coi là nghẽn (None = chỉ dùng lỗi)
+            baseline_window: Số mẫu gần nhất để lấy mức nền (trung vị, không nhạy với dao động ngẫu nhiên)
+            history_size: Số lần thay đổi giới hạn giữ lại cho metrics
+        """
+        if not 0 < decrease < 1:
+            raise ValueError("decrease phải trong khoảng (0, 1)")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.counters = {'calls': 0, 'errors': 0, 'overloads': 0, 'slow': 0, 'increases': 0, 'decreases': 0,
+                         'max_in_flight': 0, 'wait_time': 0.0}
+        self.history = deque(maxlen=history_size)
+        self._samples = deque(maxlen=baseline_window)
+        self._last_decrease = float('-inf')
+        self._t0 = time.monotonic()
+        self._cond = threading.Condition()
+        self._record('init')
+
+    def _record(self, reason: str):
+        self.history.append({'t': round(time.monotonic() - self._t0, 3), 'limit': round(self.limit, 2),
+                             'in_flight': self.in_flight, 'reason': reason})
+
+    @property
+    def slots(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def baseline(self) -> Optional[float]:
+        """Mức nền: trung vị độ trễ chuẩn hóa trong cửa sổ gần nhất"""
+        return statistics.median(self._samples) if self._samples else None
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[_Ticket]:
+        """Chờ tới khi còn chỗ; trả về ticket để release (None nếu hết timeout)"""
+        waited = time.monotonic()
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < self.slots, timeout):
+                return None
+            self.in_flight += 1
+            self.counters['max_in_flight'] = max(self.counters['max_in_flight'], self.in_flight)
+            self.counters['wait_time'] += time.monotonic() - waited
+            return _Ticket(time.monotonic(), self.in_flight >= self.slots)
+
+    def release(self, ticket: _Ticket, latency: float, ok: bool, overloaded: bool = False,
+                output_tokens: Optional[int] = None):
+        """
+        Args:
+            ticket: Giá trị acquire() trả về
+            latency: Thời gian request (giây)
+            ok: Request thành công
+            overloaded: Lỗi do backend quá tải (429/503/timeout)
+            output_tokens: Số token output (để độ trễ của bài dài không bị coi là nghẽn)
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self.counters['calls'] += 1
+            self.counters['errors'] += 0 if ok else 1
+
+            congested = overloaded
+            if overloaded:
+                self.counters['overloads'] += 1
+            elif ok:
+                # Độ trễ mỗi 1k token output: so sánh được giữa bài ngắn và bài dài
+                sample = latency / max(1.0, (output_tokens or 0) / 1000)
+                base = self.baseline()
+                self._samples.append(sample)
+                if self.latency_tolerance and base and sample > base * self.latency_tolerance:
+                    self.counters['slow'] += 1
+                    congested = True
+
+            if congested and ticket.started >= self._last_decrease:
+                old = self.limit
+                self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                self._last_decrease = time.monotonic()
+                self.counters['decreases'] += 1
+                self._record('overload' if overloaded else 'latency')
+                logger.warning("📉 Giảm số request đồng thời %.1f → %.1f (%s)", old, self.limit,
+                               'quá tải' if overloaded else 'độ trễ tăng')
+            elif ok and not congested and ticket.saturated and self.limit < self.max_limit:
+                self.limit = min(float(self.max_limit), self.limit + self.increase / self.limit)
+                self.counters['increases'] += 1
+                if int(self.limit) != int(self.history[-1]['limit']):
+                    self._record('increase')
+            self._cond.notify_all()
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            return {'limit': round(self.limit, 2), 'slots': self.slots, 'in_flight': self.in_flight,
+                    'baseline': self.baseline(), **self.counters}
+
+    def limit_history(self) -> List[Dict]:
+        with self._cond:
+            return list(self.history)
+
+
+class AdaptiveClient:
+    """
+    Bọc VertexClient / VertexClientPool / FakeVertexClient (cùng giao diện) bằng AIMDLimiter:
+    mọi luồng dùng chung client này bị giới hạn số request đồng thời theo tình trạng backend.
+    """
+
+    def __init__(self, client, limiter: Optional[AIMDLimiter] = None, **limiter_kwargs):
+        self.client = client
+        self.limiter = limiter or AIMDLimiter(**limiter_kwargs)
+        self.model_name = getattr(client, 'model_name', None)
+        self.name = getattr(client, 'name', self.model_name)
+        self.supports_structured_output = getattr(client, 'supports_structured_output', False)
+        self._local = threading.local()
+
+    def _dispatch(self, method: str, prompt, **kwargs):
+        ticket = self.limiter.acquire()
+        started = time.monotonic()
+        error = None
+        try:
+            result = getattr(self.client, method)(prompt, **kwargs)
+        except Exception as e:
+            logger.error("❌ %s: %s", self.name, e)
+            result, error = None, str(e)
+        info = self.client.last_call_info() if hasattr(self.client, 'last_call_info') else None
+        error = error or (info or {}).get('error')
+        ok = result is not None and not error
+        self.limiter.release(ticket, time.monotonic() - started, ok, overloaded=is_overload(error),
+                             output_tokens=(info or {}).get('output_tokens'))
+        self._local.info = dict(info or {}, error=error) if (info or error) else None
+        return result
+
+    def send_data_to_AI(self, prompt, **kwargs):
+        return self._dispatch('send_data_to_AI', prompt, **kwargs)
+
+    def send_data_to_check(self, prompt, **kwargs):
+        return self._dispatch('send_data_to_check', prompt, **kwargs)
+
+    def last_call_info(self):
+        return getattr(self._local, 'info', None)
+
+    def metrics(self) -> Dict:
+        return self.limiter.metrics()
+
+    def health_table(self) -> str:
+        m = self.metrics()
+        lines = [f"AIMD: giới hạn {m['limit']:.1f} (đang chạy {m['in_flight']}, tối đa {m['max_in_flight']}), "
+                 f"{m['calls']} lần gọi, {m['overloads']} quá tải, {m['slow']} chậm, "
+                 f"+{m['increases']}/-{m['decreases']} lần điều chỉnh, chờ {m['wait_time']:.1f}s"]
+        if hasattr(self.client, 'health_table'):
+            lines.append(self.client.health_table())
+        return "\n".join(lines)
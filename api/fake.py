@@ -0,0 +1,110 @@
+# api/fake.py
+
+import json
+import time
+import random
+import threading
+import logging
+
+from process.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Response mẫu hợp lệ theo format {html, css, js} mà ExperimentGenerator mong đợi
+FAKE_EXPERIMENT = {
+    "html": "<div id='experiment-container' class='p-4'><canvas id='mainCanvas' width='400' height='200'></canvas>"
+            "<button id='btnStart' class='px-4 py-2 bg-green-500 text-white rounded'>Bắt đầu</button></div>",
+    "css": "@keyframes glow { 0% { opacity: .6; } 100% { opacity: 1; } }",
+    "js": "const canvas = document.getElementById('mainCanvas'); const ctx = canvas.getContext('2d'); "
+          "const state = { running: false }; function draw() { ctx.clearRect(0, 0, canvas.width, canvas.height); } "
+          "function init() { document.getElementById('btnStart').onclick = () => { state.running = true; draw(); }; draw(); } init();",
+}
+
+
+class FakeVertexClient:
+    """
+    Client giả lập cùng giao diện với VertexClient để chạy offline / test:
+    độ trễ ngẫu nhiên, tỉ lệ lỗi cấu hình được, có thể bật/tắt "sập" endpoint.
+    Với `capacity`: quá số request đồng thời thì trả 429 ngay, gần ngưỡng thì độ trễ tăng
+    (đổi client.capacity lúc chạy để giả lập tải Gemini thay đổi trong ngày).
+    """
+
+    supports_structured_output = True
+
+    def __init__(self, model="fake-model", name="fake", latency=(0.05, 0.2), error_rate=0.0,
+                 response=None, output_tokens=2000, seed=None, capacity=None, reject_latency=0.01):
+        """
+        Args:
+            model: Tên model giả lập
+            name: Tên endpoint (hiển thị trong log/thống kê)
+            latency: (min, max) giây cho mỗi lần gọi
+            error_rate: Xác suất một lần gọi lỗi (trả về None như VertexClient)
+            response: Text trả về (mặc định FAKE_EXPERIMENT dạng JSON)
+            output_tokens: Số token output báo cáo trong usage
+            capacity: Số request đồng thời tối đa backend chịu được (None = không giới hạn)
+            reject_latency: Thời gian trả lỗi 429 khi vượt capacity (giây)
+        """
+        self.model_name = model
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.response = response or "```json\n" + json.dumps(FAKE_EXPERIMENT, ensure_ascii=False) + "\n```"
+        self.output_tokens = output_tokens
+        self.down = False
+        self.capacity = capacity
+        self.reject_latency = reject_latency
+        self.in_flight = 0
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._local = threading.local()
+
+    def last_call_info(self):
+        return getattr(self._local, 'info', None)
+
+    def _call(self, prompt, max_output_tokens, structured=False):
+        with self._rng_lock:
+            delay = self._rng.uniform(*self.latency)
+            failed = self.down or self._rng.random() < self.error_rate
+            self.in_flight += 1
+            load = self.in_flight
+        rejected = self.capacity is not None and load > self.capacity
+        if rejected:
+            delay = self.reject_latency
+        elif self.capacity:
+            # Xếp hàng phía backend: quá nửa capacity thì mỗi request chạy chậm dần
+            delay *= 1 + max(0, load - self.capacity / 2) / self.capacity
+        try:
+            with span("vertex.generate_content", "api", model=self.model_name, endpoint=self.name):
+                time.sleep(delay)
+        finally:
+            with self._rng_lock:
+                self.in_flight -= 1
+
+        info = {'model': self.model_name, 'latency': delay, 'prompt_tokens': len(prompt) // 3,
+                'output_tokens': None, 'finish_reason': None, 'error': None}
+        if rejected:
+            info['error'] = f"429 Resource exhausted ({self.name})"
+            self._local.info = info
+            logger.error("❌ Error calling AI: %s", info['error'])
+            return None
+        if failed:
+            info['error'] = f"503 Service Unavailable ({self.name})"
+            self._local.info = info
+            logger.error("❌ Error calling AI: %s", info['error'])
+            return None
+
+        tokens = min(self.output_tokens, max_output_tokens)
+        info['output_tokens'] = tokens
+        info['finish_reason'] = 'MAX_TOKENS' if tokens < self.output_tokens else 'STOP'
+        self._local.info = info
+        if structured and self.response.startswith("```json"):
+            # Structured output: JSON thuần, không có code fence
+            return self.response[len("```json"):].strip().rstrip("`").strip()
+        return self.response
+
+    def send_data_to_AI(self, prompt, file_paths=None, temperature=0.7, top_p=0.8, max_output_tokens=8192,
+                        response_mime_type=None, response_schema=None):
+        return self._call(prompt, max_output_tokens, structured=response_mime_type == "application/json")
+
+    def send_data_to_check(self, prompt, temperature=0.5, top_p=0.8, max_output_tokens=8192):
+        return self._call(prompt, max_output_tokens)
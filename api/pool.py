@@ -0,0 +1,226 @@
+# api/pool.py
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from api.concurrency import is_client_error
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """Một client độc lập (project + region) cùng trạng thái tải và sức khỏe"""
+
+    def __init__(self, name: str, client, rpm: Optional[int] = None, weight: float = 1.0):
+        """
+        Args:
+            name: Tên hiển thị (vd: my-project/us-central1)
+            client: VertexClient hoặc FakeVertexClient
+            rpm: Quota request/phút của endpoint (None = không giới hạn)
+            weight: Trọng số chia tải (endpoint mạnh hơn → weight lớn hơn)
+        """
+        self.name = name
+        self.client = client
+        self.rpm = rpm
+        self.weight = weight
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.latency_ewma = None
+        self.cooldown_until = 0.0
+        self._recent = deque()  # thời điểm các request trong 60s gần nhất
+
+    def remaining_quota(self, now: float) -> float:
+        """Tỉ lệ quota còn lại trong cửa sổ 60s (1.0 nếu không giới hạn)"""
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if not self.rpm:
+            return 1.0
+        return max(0.0, (self.rpm - len(self._recent)) / self.rpm)
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def stats(self) -> Dict:
+        return {
+            'endpoint': self.name,
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': self.errors / self.calls if self.calls else 0.0,
+            'latency_ewma': self.latency_ewma,
+            'healthy': self.healthy(time.monotonic()),
+        }
+
+
+class VertexClientPool:
+    """
+    Pool các VertexClient độc lập ở nhiều region/project, cùng giao diện với VertexClient:
+    - Chia tải theo số request đang chạy và quota còn lại của từng endpoint
+    - Endpoint lỗi liên tiếp bị tạm ngắt (cooldown) và request được chuyển sang endpoint khác
+    - Thống kê sức khỏe theo endpoint
+    """
+
+    def __init__(self, endpoints: List[Endpoint], max_attempts: Optional[int] = None,
+                 error_threshold: int = 3, cooldown: float = 30.0, ewma_alpha: float = 0.3):
+        """
+        Args:
+            endpoints: Danh sách Endpoint
+            max_attempts: Số endpoint thử tối đa cho 1 request (mặc định: tất cả)
+            error_threshold: Số lỗi liên tiếp trước khi tạm ngắt endpoint
+            cooldown: Thời gian tạm ngắt (giây)
+        """
+        if not endpoints:
+            raise ValueError("VertexClientPool cần ít nhất 1 endpoint")
+        self.endpoints = endpoints
+        self.max_attempts = max_attempts or len(endpoints)
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self.model_name = getattr(endpoints[0].client, 'model_name', None)
+        self.supports_structured_output = all(
+            getattr(ep.client, 'supports_structured_output', False) for ep in endpoints)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ============ Khởi tạo ============
+
+    @classmethod
+    def from_spec(cls, spec: str, model: str, creds=None, default_project: Optional[str] = None, **kwargs):
+        """
+        Tạo pool từ chuỗi cấu hình, vd biến môi trường VERTEX_ENDPOINTS:
+            "us-central1:60,europe-west4:60,other-project/asia-southeast1:30"
+        Mỗi phần tử: [project/]region[:rpm]. Project khác có thể dùng service account riêng
+        qua biến môi trường VERTEX_CREDS_<PROJECT> (đường dẫn file JSON, '-' thay bằng '_').
+        """
+        from api.callAPI import VertexClient, get_vertex_ai_credentials
+
+        endpoints = []
+        for item in filter(None, (x.strip() for x in spec.split(','))):
+            location, _, rpm = item.partition(':')
+            project, _, region = location.rpartition('/')
+            project = project or default_project
+            if not project:
+                raise ValueError(f"Endpoint '{item}' thiếu project: dùng dạng project/region hoặc truyền default_project")
+            ep_creds = creds
+            creds_file = os.getenv(f"VERTEX_CREDS_{project.upper().replace('-', '_')}")
+            if creds_file:
+                ep_creds = get_vertex_ai_credentials(creds_file)
+            client = VertexClient(project, ep_creds, model, region=region)
+            endpoints.append(Endpoint(f"{project}/{region}", client, rpm=int(rpm) if rpm else None))
+        return cls(endpoints, **kwargs)
+
+    @classmethod
+    def fake(cls, model: str = "fake-model", regions=("fake-us", "fake-eu", "fake-asia"), **client_kwargs):
+        """Pool toàn endpoint giả lập để chạy offline / test failover"""
+        from api.fake import FakeVertexClient
+
+        endpoints = [Endpoint(name, FakeVertexClient(model=model, name=name, **client_kwargs)) for name in regions]
+        return cls(endpoints)
+
+    # ============ Chọn endpoint ============
+
+    def _pick(self, exclude) -> Optional[Endpoint]:
+        now = time.monotonic()
+        candidates = [ep for ep in self.endpoints if ep not in exclude]
+        if not candidates:
+            return None
+
+        healthy = [ep for ep in candidates if ep.healthy(now) and ep.remaining_quota(now) > 0]
+        if not healthy:
+            # Tất cả đang cooldown / hết quota → chọn endpoint sắp hồi phục nhất
+            return min(candidates, key=lambda ep: ep.cooldown_until)
+
+        def load(ep):
+            quota = max(ep.remaining_quota(now), 0.05)
+            latency = ep.latency_ewma or 1.0
+            return (ep.in_flight + 1) * latency / (ep.weight * quota)
+
+        return min(healthy, key=load)
+
+    def _acquire(self, exclude) -> Optional[Endpoint]:
+        with self._lock:
+            ep = self._pick(exclude)
+            if ep:
+                ep.in_flight += 1
+                ep._recent.append(time.monotonic())
+            return ep
+
+    def _release(self, ep: Endpoint, ok: bool, latency: float, client_error: bool = False):
+        with self._lock:
+            ep.in_flight -= 1
+            ep.calls += 1
+            if client_error:
+                return  # lỗi của request, endpoint vẫn khỏe
+            if ok:
+                ep.consecutive_errors = 0
+                ep.latency_ewma = latency if ep.latency_ewma is None else \
+                    self.ewma_alpha * latency + (1 - self.ewma_alpha) * ep.latency_ewma
+            else:
+                ep.errors += 1
+                ep.consecutive_errors += 1
+                if ep.consecutive_errors >= self.error_threshold:
+                    ep.cooldown_until = time.monotonic() + self.cooldown
+                    logger.warning("🚧 Tạm ngắt %s trong %.0fs sau %s lỗi liên tiếp",
+                                   ep.name, self.cooldown, ep.consecutive_errors)
+
+    # ============ Giao diện giống VertexClient ============
+
+    def _dispatch(self, method: str, prompt, **kwargs):
+        tried = []
+        for _ in range(self.max_attempts):
+            ep = self._acquire(tried)
+            if ep is None:
+                break
+            tried.append(ep)
+
+            started = time.monotonic()
+            error = None
+            try:
+                result = getattr(ep.client, method)(prompt, **kwargs)
+            except Exception as e:
+                logger.error("❌ %s: %s", ep.name, e)
+                result, error = None, str(e)
+            info = ep.client.last_call_info() if hasattr(ep.client, 'last_call_info') else None
+            error = error or (info or {}).get('error')
+            ok = result is not None and not error
+            client_error = not ok and is_client_error(error)
+            self._release(ep, ok, time.monotonic() - started, client_error=client_error)
+
+            self._local.info = dict(info or {}, endpoint=ep.name, error=error)
+            if ok:
+                return result
+            if client_error:
+                # 4xx do request (vd schema bị từ chối): endpoint khác cũng trả y hệt → trả về ngay cho caller xử lý
+                return None
+            if len(tried) < self.max_attempts:
+                logger.warning("🔀 %s lỗi, chuyển sang endpoint khác", ep.name)
+        return None
+
+    def send_data_to_AI(self, prompt, **kwargs):
+        return self._dispatch('send_data_to_AI', prompt, **kwargs)
+
+    def send_data_to_check(self, prompt, **kwargs):
+        return self._dispatch('send_data_to_check', prompt, **kwargs)
+
+    def last_call_info(self):
+        return getattr(self._local, 'info', None)
+
+    # ============ Thống kê ============
+
+    def health(self) -> List[Dict]:
+        with self._lock:
+            return [ep.stats() for ep in self.endpoints]
+
+    def health_table(self) -> str:
+        lines = [f"{'Endpoint':<36}{'Calls':>7}{'Err':>6}{'Err%':>7}{'EWMA s':>8}{'Busy':>6}  Status"]
+        for st in self.health():
+            ewma = f"{st['latency_ewma']:.2f}" if st['latency_ewma'] is not None else "-"
+            lines.append(f"{st['endpoint']:<36}{st['calls']:>7}{st['errors']:>6}{st['error_rate'] * 100:>6.1f}%"
+                         f"{ewma:>8}{st['in_flight']:>6}  {'OK' if st['healthy'] else 'COOLDOWN'}")
+        return "\n".join(lines)
@@ -0,0 +1,151 @@
+# api/router.py
+
+import os
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from process.budget import lesson_features
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelTier:
+    """Một tầng model: bài có điểm phức tạp <= max_score được gửi tới model này"""
+    model: str
+    max_score: float
+    input_price: float   # USD / 1M token đầu vào
+    output_price: float  # USD / 1M token đầu ra
+
+
+# Giá tham khảo (USD / 1M token), có thể ghi đè khi khởi tạo router
+DEFAULT_TIERS = [
+    ModelTier("gemini-2.5-flash", max_score=6.0, input_price=0.30, output_price=2.50),
+    ModelTier("gemini-2.5-pro", max_score=float("inf"), input_price=1.25, output_price=10.0),
+]
+
+
+class ModelRouter:
+    """
+    Định tuyến bài học tới tầng model phù hợp theo độ phức tạp:
+    bài đơn giản → model nhanh, bài phức tạp → model pro.
+    Nếu kết quả không qua validate thì leo thang lên tầng cao hơn.
+    Mỗi model có 1 client dùng chung (tạo lười khi cần).
+    """
+
+    def __init__(self, project_id=None, creds=None, tiers: Optional[List[ModelTier]] = None,
+                 region="us-central1", client_factory: Optional[Callable] = None):
+        """
+        Args:
+            project_id: GCP project
+            creds: Credentials của service account
+            tiers: Danh sách tầng theo thứ tự tăng dần (mặc định DEFAULT_TIERS)
+            region: Vùng Vertex AI
+            client_factory: Hàm model_name -> client (mặc định tạo VertexClient)
+        """
+        self.tiers = sorted(tiers or DEFAULT_TIERS, key=lambda t: t.max_score)
+        self.project_id = project_id
+        self.creds = creds
+        self.region = region
+        self.client_factory = client_factory or self._default_factory
+        self._clients: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.stats = {t.model: {'calls': 0, 'failures': 0, 'escalations': 0, 'latency': 0.0,
+                                'prompt_tokens': 0, 'output_tokens': 0} for t in self.tiers}
+
+    def _default_factory(self, model: str):
+        """
+        VERTEX_FAKE=1 → pool endpoint giả lập (offline)
+        VERTEX_ENDPOINTS=... → pool nhiều region/project (xem VertexClientPool.from_spec)
+        Mặc định → 1 VertexClient ở self.region
+        VERTEX_ADAPTIVE=4[:32] → bọc thêm AdaptiveClient: số request đồng thời tự điều chỉnh (AIMD),
+        bắt đầu từ 4, tối đa 32
+        """
+        client = self._base_client(model)
+        adaptive = os.getenv("VERTEX_ADAPTIVE")
+        if adaptive:
+            from api.concurrency import AdaptiveClient
+            initial, _, max_limit = adaptive.partition(':')
+            client = AdaptiveClient(client, initial=int(initial), max_limit=int(max_limit) if max_limit else 64)
+        return client
+
+    def _base_client(self, model: str):
+        from api.pool import VertexClientPool
+        if os.getenv("VERTEX_FAKE"):
+            return VertexClientPool.fake(model)
+        spec = os.getenv("VERTEX_ENDPOINTS")
+        if spec:
+            return VertexClientPool.from_spec(spec, model, self.creds, default_project=self.project_id)
+
+        from api.callAPI import VertexClient
+        return VertexClient(self.project_id, self.creds, model, region=self.region)
+
+    def client_for(self, model: str):
+        """Lấy client của model từ pool (tạo nếu chưa có)"""
+        with self._lock:
+            if model not in self._clients:
+                self._clients[model] = self.client_factory(model)
+            return self._clients[model]
+
+    @staticmethod
+    def score(exp_data: Dict) -> float:
+        """Điểm phức tạp: số bước + độ dài mô tả (mỗi 400 ký tự ~ 1 bước)"""
+        steps, desc_len = lesson_features(exp_data)
+        return steps + desc_len / 400
+
+    def route(self, exp_data: Dict) -> int:
+        """Chỉ số tầng thấp nhất đủ sức xử lý bài học"""
+        score = self.score(exp_data)
+        for idx, tier in enumerate(self.tiers):
+            if score <= tier.max_score:
+                return idx
+        return len(self.tiers) - 1
+
+    def candidates(self, exp_data: Dict) -> List[ModelTier]:
+        """Chuỗi tầng để thử lần lượt: tầng được định tuyến rồi leo thang dần"""
+        return self.tiers[self.route(exp_data):]
+
+    def record(self, tier: ModelTier, info: Optional[Dict], ok: bool, escalated: bool = False):
+        """Ghi nhận kết quả một lần gọi vào thống kê của tầng"""
+        with self._lock:
+            st = self.stats[tier.model]
+            st['calls'] += 1
+            st['failures'] += 0 if ok else 1
+            st['escalations'] += 1 if escalated else 0
+            if info:
+                st['latency'] += info.get('latency') or 0.0
+                st['prompt_tokens'] += info.get('prompt_tokens') or 0
+                st['output_tokens'] += info.get('output_tokens') or 0
+
+    @staticmethod
+    def _cost(tier: ModelTier, prompt_tokens: int, output_tokens: int) -> float:
+        return (prompt_tokens * tier.input_price + output_tokens * tier.output_price) / 1e6
+
+    def summary(self) -> str:
+        """Bảng tóm tắt độ trễ, chi phí và phần tiết kiệm so với chạy toàn bộ bằng tầng cao nhất"""
+        top = self.tiers[-1]
+        top_stats = self.stats[top.model]
+        top_latency = top_stats['latency'] / top_stats['calls'] if top_stats['calls'] else None
+
+        lines = [f"{'Model':<22}{'Calls':>7}{'Fail':>6}{'Esc':>5}{'Avg s':>8}{'Cost $':>10}{'Saved $':>10}{'Saved s':>10}"]
+        total_saved = 0.0
+        for tier in self.tiers:
+            st = self.stats[tier.model]
+            if not st['calls']:
+                continue
+            avg = st['latency'] / st['calls']
+            cost = self._cost(tier, st['prompt_tokens'], st['output_tokens'])
+            saved = self._cost(top, st['prompt_tokens'], st['output_tokens']) - cost
+            saved_s = (top_latency - avg) * st['calls'] if top_latency and tier is not top else 0.0
+            total_saved += saved
+            lines.append(f"{tier.model:<22}{st['calls']:>7}{st['failures']:>6}{st['escalations']:>5}"
+                         f"{avg:>8.1f}{cost:>10.4f}{saved:>10.4f}{saved_s:>10.1f}")
+        lines.append(f"Tổng tiết kiệm so với {top.model}: ${total_saved:.4f}")
+        
+        # Sức khỏe endpoint nếu client của tầng là pool nhiều region
+        for model, client in self._clients.items():
+            if hasattr(client, 'health_table'):
+                lines.append(f"\n[{model}]\n{client.health_table()}")
+        return "\n".join(lines)
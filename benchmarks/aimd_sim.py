@@ -0,0 +1,102 @@
+# benchmarks/aimd_sim.py
+"""
+Giả lập điều khiển số request đồng thời trên backend có capacity thay đổi theo thời gian
+(FakeVertexClient(capacity=...): vượt capacity → 429 ngay, gần ngưỡng → chậm dần).
+
+So sánh giới hạn cố định với AIMD (api.concurrency.AdaptiveClient):
+thông lượng thành công, số lỗi 429, p50/p95 độ trễ các lần thành công, giới hạn cuối.
+
+Chạy từ thư mục gốc repo:
+    python benchmarks/aimd_sim.py --workers 32 --phases 8,24,6 --phase_seconds 4
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.concurrency import AIMDLimiter, AdaptiveClient  # noqa: E402
+from api.fake import FakeVertexClient  # noqa: E402
+
+
+def run(limiter: AIMDLimiter, workers: int, phases, phase_seconds: float, latency, seed: int = 0):
+    backend = FakeVertexClient(latency=latency, capacity=phases[0], seed=seed)
+    client = AdaptiveClient(backend, limiter)
+    ok_latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def demand():
+        while not stop.is_set():
+            started = time.monotonic()
+            result = client.send_data_to_AI("prompt", max_output_tokens=2000)
+            with lock:
+                if result is None:
+                    errors[0] += 1
+                else:
+                    ok_latencies.append(time.monotonic() - started)
+
+    logging.disable(logging.ERROR)  # mỗi 429 giả lập đều log lỗi → tắt cho gọn
+    threads = [threading.Thread(target=demand, daemon=True) for _ in range(workers)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for capacity in phases:
+        backend.capacity = capacity
+        time.sleep(phase_seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    logging.disable(logging.NOTSET)
+    elapsed = time.monotonic() - started
+
+    ok_latencies.sort()
+    return {
+        'ok_per_s': len(ok_latencies) / elapsed,
+        'errors': errors[0],
+        'p50': statistics.median(ok_latencies) if ok_latencies else float('nan'),
+        'p95': ok_latencies[int(len(ok_latencies) * 0.95)] if ok_latencies else float('nan'),
+        'limit': limiter.metrics()['limit'],
+        'history': limiter.limit_history(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Giả lập AIMD vs giới hạn cố định trên backend capacity thay đổi")
+    parser.add_argument('--workers', type=int, default=32, help='Số luồng gửi request (nhu cầu)')
+    parser.add_argument('--phases', type=str, default='8,24,6', help='Capacity backend theo từng pha')
+    parser.add_argument('--phase_seconds', type=float, default=4.0)
+    parser.add_argument('--fixed', type=str, default='4,32', help='Các giới hạn cố định để so sánh')
+    parser.add_argument('--latency', type=str, default='0.05,0.1', help='Độ trễ min,max (giây)')
+    parser.add_argument('--json', type=str, help='Ghi kết quả (kèm lịch sử giới hạn AIMD) ra file JSON')
+    args = parser.parse_args()
+
+    phases = [int(x) for x in args.phases.split(',')]
+    latency = tuple(float(x) for x in args.latency.split(','))
+    setups = [(f"fixed={k}", lambda k=int(k): AIMDLimiter(initial=k, min_limit=k, max_limit=k))
+              for k in args.fixed.split(',')]
+    setups.append(("aimd", lambda: AIMDLimiter(initial=4, max_limit=args.workers)))
+
+    print(f"{args.workers} luồng, capacity theo pha {phases}, mỗi pha {args.phase_seconds}s")
+    print(f"{'Setup':<12}{'OK/s':>8}{'429':>8}{'p50 ms':>9}{'p95 ms':>9}{'Limit':>8}")
+    report = {}
+    for name, make_limiter in setups:
+        r = report[name] = run(make_limiter(), args.workers, phases, args.phase_seconds, latency)
+        print(f"{name:<12}{r['ok_per_s']:>8.1f}{r['errors']:>8}{r['p50'] * 1000:>9.0f}"
+              f"{r['p95'] * 1000:>9.0f}{r['limit']:>8.1f}")
+
+    trail = report['aimd']['history']
+    print("AIMD limit: " + " → ".join(f"{h['limit']:.0f}@{h['t']:.1f}s" for h in trail[:: max(1, len(trail) // 12)]))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
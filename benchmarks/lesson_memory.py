@@ -0,0 +1,128 @@
+# benchmarks/lesson_memory.py
+"""
+Đo bộ nhớ giữ danh sách bài học (mặc định 10k bài, workbook có thêm nhiều cột không dùng):
+- dict: đọc mọi cột rồi df.to_dict('records') (cách cũ)
+- record: usecols + dtype=str lúc đọc, LessonRecord (__slots__) + intern chuỗi lặp lại,
+  kèm các trường dẫn xuất (steps, title_norm, content_hash) như ExcelToJsonPipeline
+
+Mỗi cách chạy trong 1 process con riêng, đo bằng tracemalloc:
+peak = đỉnh trong lúc đọc/chuyển đổi, retained = còn giữ sau khi bỏ DataFrame (chỉ còn list bài học)
+
+Chạy từ thư mục gốc repo:
+    python benchmarks/lesson_memory.py --lessons 10000
+    python benchmarks/lesson_memory.py --source frame   # không cần openpyxl, bỏ qua I/O Excel
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VARIANTS = ("dict", "record")
+
+
+def make_frame(lessons: int, extra_columns: int):
+    """Workbook giả lập: 40 bài/chương, mô tả 5 bước, cộng thêm các cột ghi chú không dùng"""
+    import pandas as pd
+
+    rows = []
+    for i in range(lessons):
+        chapter = i // 40
+        row = {
+            'source_folder': f"Hoa_{10 + chapter % 3}",
+            'chapter_folder': f"chuong_{chapter}",
+            'Chương': chapter + 1,
+            'Bài học': f"Bài {i}: Phản ứng của kim loại số {i} với dung dịch axit",
+            'Nội dung trong bài học': "Tính chất hóa học của kim loại; dãy hoạt động hóa học. " * 4,
+            'Mô tả thí nghiệm thực hiện': "".join(f"- Bước {s}: Cho mẫu kim loại {i} vào ống nghiệm {s}, quan sát. "
+                                               for s in range(1, 6)),
+            'Ưu tiên': (i % 7) or None,
+        }
+        for c in range(extra_columns):
+            row[f"Ghi chú {c}"] = f"ghi chú {c} của bài {i}" if (i + c) % 3 else None
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _load(variant: str, source: str):
+    import pandas as pd
+    from process.records import LESSON_COLUMNS, TEXT_COLUMNS, derive_frame, records_from_frame
+
+    if variant == "dict":
+        df = pd.read_excel(source) if source.endswith(".xlsx") else pd.read_pickle(source)
+        return df.to_dict('records')
+    if source.endswith(".xlsx"):
+        df = pd.read_excel(source, usecols=lambda c: c in LESSON_COLUMNS, dtype={c: str for c in TEXT_COLUMNS})
+    else:
+        df = pd.read_pickle(source)
+        df = df[[c for c in df.columns if c in LESSON_COLUMNS]]
+    return records_from_frame(derive_frame(df))
+
+
+def _probe(variant: str, source: str):
+    """Chạy trong process con: import trước rồi mới bắt đầu đo"""
+    import pandas  # noqa: F401
+    import process.records  # noqa: F401
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    lessons = _load(variant, source)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({"lessons": len(lessons), "seconds": elapsed, "retained": retained, "peak": peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bộ nhớ: dict đủ cột vs LessonRecord chiếu cột")
+    parser.add_argument('--lessons', type=int, default=10000)
+    parser.add_argument('--extra_columns', type=int, default=15, help='Số cột không dùng trong workbook')
+    parser.add_argument('--source', choices=['excel', 'frame'], default='excel',
+                        help='excel: ghi và đọc lại file .xlsx; frame: DataFrame pickle (không cần openpyxl)')
+    parser.add_argument('--probe', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        _probe(*args.probe)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        df = make_frame(args.lessons, args.extra_columns)
+        if args.source == 'excel':
+            source = os.path.join(tmp, "lessons.xlsx")
+            try:
+                df.to_excel(source, index=False)
+            except ImportError as e:
+                sys.exit(f"❌ Cần openpyxl để ghi .xlsx ({e}); dùng --source frame")
+        else:
+            source = os.path.join(tmp, "lessons.pkl")
+            df.to_pickle(source)
+        del df
+
+        print(f"{args.lessons} bài, {args.extra_columns} cột thừa, nguồn: {args.source}")
+        print(f"{'Variant':<10}{'Retained MB':>13}{'Peak MB':>10}{'Time s':>9}")
+        results = {}
+        for variant in VARIANTS:
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe", variant, source],
+                                  cwd=ROOT, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{variant:<10}lỗi: {proc.stderr.strip().splitlines()[-1] if proc.stderr else '?'}")
+                continue
+            r = results[variant] = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{variant:<10}{r['retained'] / 2**20:>13.1f}{r['peak'] / 2**20:>10.1f}{r['seconds']:>9.2f}")
+
+    if len(results) == 2:
+        print(f"retained giảm {1 - results['record']['retained'] / results['dict']['retained']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
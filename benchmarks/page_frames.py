@@ -0,0 +1,235 @@
+# benchmarks/page_frames.py
+"""
+Đo thời gian frame của trang thí nghiệm trong Chromium headless (Playwright):
+bọc requestAnimationFrame để cộng thời gian JS chạy trong mỗi frame, ghi khoảng cách giữa các frame.
+Bấm #btnStart (nếu có) rồi đo trong --seconds giây.
+
+So sánh 2 thư mục trang (ghép theo tên file), vd output hiện tại với output sinh lại dùng runtime Sim:
+    python benchmarks/page_frames.py --baseline generated_output --candidate generated_output_sim
+
+Không truyền thư mục → demo: cùng một mô phỏng N hạt viết kiểu cũ (mảng object, vẽ lại toàn canvas,
+fill từng hạt, ghi DOM mỗi frame) và viết bằng Sim, render qua template như trang thật:
+    python benchmarks/page_frames.py --particles 3000 --seconds 5
+
+Cần: pip install playwright && playwright install chromium
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from process.fragments import render_page  # noqa: E402
+
+FRAME_MS = 1000 / 60
+
+# Cộng thời gian mọi callback rAF cùng timestamp vào 1 frame
+FRAME_PROBE = """
+window.__frames = { ts: [], work: [] };
+const __raf = window.requestAnimationFrame.bind(window);
+window.requestAnimationFrame = (cb) => __raf((t) => {
+  const s = performance.now();
+  try { cb(t); } finally {
+    const f = window.__frames, n = f.ts.length, w = performance.now() - s;
+    if (n && f.ts[n - 1] === t) f.work[n - 1] += w;
+    else { f.ts.push(t); f.work.push(w); }
+  }
+});
+"""
+
+DEMO_HTML = """
+<canvas id="mainCanvas" width="800" height="400" class="w-full h-96"></canvas>
+<div class="mt-4 flex gap-4"><button id="btnStart">Bắt đầu</button><button id="btnReset">Làm lại</button></div>
+<p>Số hạt: <span id="count">0</span> · Động năng TB: <span id="energy">0</span></p>
+"""
+
+# Kiểu các trang hiện tại: object mỗi hạt, map/filter tạo mảng mới mỗi frame, vẽ lại cả nền
+DEMO_JS_LEGACY = """
+const canvas = document.getElementById("mainCanvas");
+const ctx = canvas.getContext("2d");
+const state = { running: false, particles: [] };
+function drawScene() {
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  const g = ctx.createLinearGradient(0, 0, 0, canvas.height);
+  g.addColorStop(0, "#1e3a8a");
+  g.addColorStop(1, "#1d4ed8");
+  ctx.fillStyle = g;
+  ctx.fillRect(0, 0, canvas.width, canvas.height);
+  state.particles.forEach((p) => {
+    ctx.fillStyle = "orange";
+    ctx.beginPath();
+    ctx.arc(p.x, p.y, 3, 0, Math.PI * 2);
+    ctx.fill();
+  });
+}
+function update() {
+  if (!state.running) return;
+  state.particles = state.particles
+    .map((p) => ({ ...p, x: p.x + p.vx, y: p.y + p.vy }))
+    .map((p) => ({
+      ...p,
+      vx: p.x < 0 || p.x > canvas.width ? -p.vx : p.vx,
+      vy: p.y < 0 || p.y > canvas.height ? -p.vy : p.vy,
+    }));
+  const energy = state.particles.reduce((s, p) => s + p.vx * p.vx + p.vy * p.vy, 0) / state.particles.length;
+  document.getElementById("count").textContent = state.particles.length;
+  document.getElementById("energy").textContent = energy.toFixed(2);
+  drawScene();
+  requestAnimationFrame(update);
+}
+for (let i = 0; i < N; i++) {
+  state.particles.push({ x: Math.random() * 800, y: Math.random() * 400,
+    vx: (Math.random() - 0.5) * 4, vy: (Math.random() - 0.5) * 4 });
+}
+document.getElementById("btnStart").onclick = () => { state.running = true; update(); };
+drawScene();
+"""
+
+DEMO_JS_RUNTIME = """
+const view = Sim.canvas("mainCanvas");
+const particles = Sim.particles(N);
+const state = { running: false };
+function update(dt) {
+  particles.step(dt, view.w, view.h);
+  let energy = 0;
+  for (let i = 0; i < particles.count; i++) {
+    energy += particles.vx[i] * particles.vx[i] + particles.vy[i] * particles.vy[i];
+  }
+  Sim.setText("count", particles.count);
+  Sim.setText("energy", (energy / particles.count / 3600).toFixed(2));
+  view.invalidate();
+  view.redraw((ctx) => particles.draw(ctx, 3, "orange"));
+  return state.running;
+}
+for (let i = 0; i < N; i++) {
+  particles.spawn(Math.random() * 800, Math.random() * 400, (Math.random() - 0.5) * 240, (Math.random() - 0.5) * 240);
+}
+view.setBackground((ctx, w, h) => {
+  const g = ctx.createLinearGradient(0, 0, 0, h);
+  g.addColorStop(0, "#1e3a8a");
+  g.addColorStop(1, "#1d4ed8");
+  ctx.fillStyle = g;
+  ctx.fillRect(0, 0, w, h);
+});
+view.redraw((ctx) => particles.draw(ctx, 3, "orange"));
+Sim.on("btnStart", "click", () => { state.running = true; Sim.loop.add(update); });
+"""
+
+
+def demo_pages(out_dir: str, template_path: str, particles: int):
+    """Render 2 trang demo qua template thật → (baseline_dir, candidate_dir)"""
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template = f.read()
+    exp = {"Chương": "Benchmark", "Bài học": f"{particles} hạt", "Nội dung trong bài học": ""}
+    dirs = []
+    for name, js in (("legacy", DEMO_JS_LEGACY), ("runtime", DEMO_JS_RUNTIME)):
+        d = os.path.join(out_dir, name)
+        os.makedirs(d, exist_ok=True)
+        page = render_page(exp, template, (DEMO_HTML, "", f"const N = {particles};\n{js}"), inline_runtime=True)
+        with open(os.path.join(d, "demo.html"), 'w', encoding='utf-8') as f:
+            f.write(page)
+        dirs.append(d)
+    return dirs
+
+
+def summarize(ts, work) -> dict:
+    intervals = sorted(b - a for a, b in zip(ts, ts[1:]))
+    work = sorted(work)
+    if not intervals:
+        return {'frames': len(work)}
+    return {
+        'frames': len(work),
+        'work_mean': statistics.fmean(work),
+        'work_p95': work[int(len(work) * 0.95)],
+        'interval_p95': intervals[int(len(intervals) * 0.95)],
+        'long_frames': sum(1 for i in intervals if i > FRAME_MS * 1.5) / len(intervals),
+    }
+
+
+def measure(browser, path: str, seconds: float) -> dict:
+    page = browser.new_page(viewport={'width': 1280, 'height': 900})
+    page.add_init_script(FRAME_PROBE)
+    page.goto("file://" + os.path.abspath(path))
+    page.wait_for_load_state('load')
+    if page.query_selector('#btnStart'):
+        page.click('#btnStart')
+    page.evaluate("window.__frames = { ts: [], work: [] }")
+    page.wait_for_timeout(seconds * 1000)
+    frames = page.evaluate("window.__frames")
+    page.close()
+    return dict(summarize(frames['ts'], frames['work']), bytes=os.path.getsize(path))
+
+
+def list_pages(folder: str):
+    pages = {}
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for name in filenames:
+            if name.endswith('.html'):
+                path = os.path.join(dirpath, name)
+                pages[os.path.relpath(path, folder)] = path
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh thời gian frame của trang thí nghiệm (baseline vs candidate)")
+    parser.add_argument('--baseline', type=str, help='Thư mục trang hiện tại')
+    parser.add_argument('--candidate', type=str, help='Thư mục trang dùng runtime Sim')
+    parser.add_argument('--template', type=str, default=os.path.join(ROOT, 'resources/templates/modern.html'))
+    parser.add_argument('--particles', type=int, default=3000, help='Số hạt của trang demo')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Thời gian đo mỗi trang')
+    parser.add_argument('--limit', type=int, default=20, help='Số trang tối đa mỗi thư mục')
+    parser.add_argument('--json', type=str, help='Ghi kết quả ra file JSON')
+    args = parser.parse_args()
+
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        sys.exit("Cần Playwright: pip install playwright && playwright install chromium")
+
+    tmp = None
+    if args.baseline and args.candidate:
+        baseline, candidate = args.baseline, args.candidate
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        baseline, candidate = demo_pages(tmp.name, args.template, args.particles)
+        print(f"Demo {args.particles} hạt: kiểu cũ vs runtime Sim")
+
+    base_pages, cand_pages = list_pages(baseline), list_pages(candidate)
+    names = sorted(base_pages.keys() & cand_pages.keys())[:args.limit]
+    if not names:
+        sys.exit("Không có trang cùng tên ở hai thư mục")
+
+    report = {}
+    print(f"{'Trang':<32}{'':>10}{'Frames':>8}{'JS TB':>8}{'JS p95':>8}{'Δt p95':>8}{'Giật':>7}{'KB':>8}")
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        for name in names:
+            report[name] = {}
+            for label, path in (('baseline', base_pages[name]), ('candidate', cand_pages[name])):
+                r = report[name][label] = measure(browser, path, args.seconds)
+                if 'work_mean' not in r:
+                    print(f"{name[:31]:<32}{label:>10}{r['frames']:>8}  (không có animation)")
+                    continue
+                print(f"{name[:31]:<32}{label:>10}{r['frames']:>8}{r['work_mean']:>8.2f}{r['work_p95']:>8.2f}"
+                      f"{r['interval_p95']:>8.1f}{r['long_frames']:>7.0%}{r['bytes'] / 1024:>8.1f}")
+        browser.close()
+
+    for label in ('baseline', 'candidate'):
+        means = [r[label]['work_mean'] for r in report.values() if 'work_mean' in r[label]]
+        if means:
+            print(f"{label}: JS mỗi frame TB {statistics.fmean(means):.2f} ms trên {len(means)} trang")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
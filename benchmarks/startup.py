@@ -0,0 +1,106 @@
+# benchmarks/startup.py
+"""
+Đo thời gian khởi động:
+- GUI: từ lúc start process tới khi cửa sổ HTMLGeneratorGUI được vẽ lần đầu
+- CLI: thời gian chạy `--help` của các công cụ dòng lệnh (import + parse args)
+
+Chạy từ thư mục gốc repo:
+    python benchmarks/startup.py --runs 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLI_TOOLS = [
+    ["-m", "process.pipeline", "--help"],
+    ["-m", "process.process", "--help"],
+    ["-m", "process.batch", "--help"],
+]
+
+
+def _gui_probe():
+    """Chạy trong process con: dựng cửa sổ và in thời gian tới lần vẽ đầu tiên"""
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import tkinter as tk
+    from tkinter import ttk
+    import main
+
+    root = tk.Tk()
+    ttk.Style().theme_use('clam')
+    main.HTMLGeneratorGUI(root)
+    root.update()
+    elapsed = time.perf_counter() - started
+    root.destroy()
+    print(json.dumps({"time_to_window": elapsed}))
+
+
+def _run(cmd):
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable] + cmd, cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - started, proc
+
+
+def bench_gui(runs):
+    samples = []
+    for _ in range(runs):
+        total, proc = _run([os.path.abspath(__file__), "--gui-probe"])
+        if proc.returncode != 0:
+            return None, proc.stderr.strip().splitlines()[-1] if proc.stderr else "probe failed"
+        samples.append(total)
+    return samples, None
+
+
+def bench_cli(runs):
+    results = {}
+    for cmd in CLI_TOOLS:
+        samples = []
+        for _ in range(runs):
+            total, proc = _run(cmd)
+            samples.append(total if proc.returncode == 0 else float("nan"))
+        results[" ".join(cmd[1:2])] = samples
+    return results
+
+
+def _fmt(samples):
+    return f"median {statistics.median(samples) * 1000:8.1f} ms   min {min(samples) * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động GUI và CLI")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gui-probe', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--json', type=str, help='Ghi kết quả ra file JSON để so sánh giữa các lần chạy')
+    args = parser.parse_args()
+
+    if args.gui_probe:
+        _gui_probe()
+        return
+
+    report = {}
+    gui, err = bench_gui(args.runs)
+    if gui:
+        print(f"{'GUI time-to-window':<28}{_fmt(gui)}")
+        report["gui"] = gui
+    else:
+        print(f"{'GUI time-to-window':<28}bỏ qua ({err})")
+
+    for name, samples in bench_cli(args.runs).items():
+        print(f"{name:<28}{_fmt(samples)}")
+        report[name] = samples
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,22 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import json
 import os
 import glob
 import threading
 import logging
-import queue
-from dotenv import load_dotenv
+import multiprocessing
 
-# Import các module từ thư mục con
-from api.callAPI import VertexClient, get_vertex_ai_credentials
+# Import các module từ thư mục con (nhẹ: vertexai/pandas/bs4/esprima chỉ được import khi dùng)
+from api.callAPI import get_vertex_ai_credentials
+from api.router import ModelRouter
 from process.generate import ExperimentGenerator
-from process.pipeline import ExcelToJsonPipeline
+from process.pipeline import ExcelToJsonPipeline, iter_lessons
+from process.scheduler import POLICIES, CostModel, LessonScheduler
+from process.logs import setup_logging
 
-load_dotenv()
-
-# Thiết lập Log hiển thị lên GUI
-class QueueHandler(logging.Handler):
-    def __init__(self, log_queue):
-        super().__init__()
-        self.log_queue = log_queue
-    def emit(self, record):
-        self.log_queue.put(self.format(record))
+# Số dòng tối đa giữ trong ô log (dòng cũ bị cắt bớt để Text widget không phình ra)
+LOG_VIEW_LINES = 2000
 
 class HTMLGeneratorGUI:
     def __init__(self, root):
@@ -39,18 +33,26 @@ class HTMLGeneratorGUI:
         # Biến chọn Resource
         self.selected_prompt = tk.StringVar()
         self.selected_template = tk.StringVar()
+        self.sectioned = tk.BooleanVar(value=False)
+        self.schedule_policy = tk.StringVar(value="fifo")
+        self.watching = tk.BooleanVar(value=False)
+        self._watch_stop = None
         
-        self.log_queue = queue.Queue()
-        self.json_data = {} # Lưu dữ liệu bài học đã load
-        self.vertex_client = None
+        self.log_tail = None
+        self._log_seq = 0
+        self.json_data = {} # Lưu dữ liệu bài học đã load (LessonRecord, chỉ các cột cần dùng)
+        self.router = None  # Định tuyến Gemini theo độ phức tạp bài học
+        self.vertex_state = tk.StringVar(value="⚪ Vertex AI: chưa kết nối")
         
         self._setup_ui()
         self._setup_logging()
-        self._init_vertex()
+        
+        # Kết nối Vertex AI chạy nền, cửa sổ hiện ngay
+        self.root.after(0, self._init_vertex_async)
         
         # Tự động quét tài nguyên khi mở app
         self.root.after(500, self._scan_resources)
-        self.root.after(100, self._process_log_queue)
+        self.root.after(100, self._poll_log_tail)
 
     def _setup_ui(self):
         main_frame = ttk.Frame(self.root, padding="10")
@@ -77,6 +79,7 @@ class HTMLGeneratorGUI:
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self.progress = ttk.Progressbar(main_frame, mode='indeterminate')
         self.progress.pack(fill=tk.X, pady=2)
+        ttk.Label(main_frame, textvariable=self.vertex_state, anchor=tk.W).pack(fill=tk.X)
 
     def _build_data_tab(self):
         # Chọn file Excel
@@ -124,6 +127,11 @@ class HTMLGeneratorGUI:
         # Khu vực chọn bài học
         mid_frame = ttk.Frame(self.tab_gen); mid_frame.pack(fill=tk.X, pady=5)
         ttk.Button(mid_frame, text="📂 Quét các file JSON", command=self._scan_json).pack(side=tk.LEFT)
+        ttk.Checkbutton(mid_frame, text="Sinh HTML/CSS/JS song song", variable=self.sectioned).pack(side=tk.LEFT, padx=10)
+        ttk.Label(mid_frame, text="Thứ tự:").pack(side=tk.LEFT)
+        ttk.Combobox(mid_frame, textvariable=self.schedule_policy, values=POLICIES, state="readonly", width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(mid_frame, text="👀 Tự cập nhật khi dữ liệu/template thay đổi", variable=self.watching,
+                        command=self._toggle_watch).pack(side=tk.LEFT, padx=10)
         
         # Bảng danh sách bài học
         self.tree = ttk.Treeview(self.tab_gen, columns=("ch","ls","st"), show='headings', height=10)
@@ -135,6 +143,7 @@ class HTMLGeneratorGUI:
         # Nút hành động
         bot_frame = ttk.Frame(self.tab_gen); bot_frame.pack(fill=tk.X, pady=10)
         ttk.Button(bot_frame, text="▶️ BẮT ĐẦU SINH HTML", command=self._start_generation, style="Accent.TButton").pack(side=tk.LEFT, padx=10)
+        ttk.Button(bot_frame, text="♻️ Render lại (không gọi AI)", command=self._start_rerender).pack(side=tk.LEFT, padx=5)
         ttk.Button(bot_frame, text="🌐 Mở thư mục kết quả", command=lambda: os.startfile(self.output_dir.get())).pack(side=tk.LEFT)
 
     # === LOGIC ===
@@ -165,7 +174,7 @@ class HTMLGeneratorGUI:
                 if pipeline.load_excel():
                     pipeline.process_all()
                     self.root.after(0, self._scan_json)
-            except Exception as e: logging.error(f"Lỗi Convert: {e}")
+            except Exception as e: logging.error("Lỗi Convert: %s", e)
             finally: self.progress.stop()
         threading.Thread(target=run, daemon=True).start()
 
@@ -176,24 +185,11 @@ class HTMLGeneratorGUI:
         if not os.path.exists(json_dir): return
         
         count = 0
-        for f in os.listdir(json_dir):
-            if f.endswith('.json'):
-                try:
-                    with open(os.path.join(json_dir, f), 'r', encoding='utf-8') as file:
-                        data = json.load(file)
-                        # Xử lý format Dict hoặc List
-                        lessons = []
-                        if isinstance(data, dict):
-                            for ch_lessons in data.values(): lessons.extend(ch_lessons)
-                        elif isinstance(data, list):
-                            lessons = data
-                            
-                        for l in lessons:
-                            lid = self.tree.insert("", tk.END, values=(l.get('Chương', 'N/A'), l.get('Bài học'), "Ready"))
-                            self.json_data[lid] = l
-                            count += 1
-                except: pass
-        logging.info(f"Đã load {count} bài học.")
+        for _, l in iter_lessons(json_dir):
+            lid = self.tree.insert("", tk.END, values=(l.get('Chương', 'N/A'), l.get('Bài học'), "Ready"))
+            self.json_data[lid] = l
+            count += 1
+        logging.info("Đã load %s bài học.", count)
 
     def _start_generation(self):
         selected = self.tree.selection()
@@ -205,49 +201,116 @@ class HTMLGeneratorGUI:
         if not os.path.exists(tmpl): return messagebox.showerror("Lỗi", "Template không tồn tại!")
         if not os.path.exists(prmt): return messagebox.showerror("Lỗi", "Prompt Config không tồn tại!")
 
-        if not self.vertex_client: return messagebox.showerror("Lỗi", "Chưa kết nối Vertex AI!")
+        if not self.router: return messagebox.showerror("Lỗi", f"Chưa kết nối Vertex AI! ({self.vertex_state.get()})")
 
         def run():
             self.progress.start()
-            gen = ExperimentGenerator(self.vertex_client, self.output_dir.get())
+            gen = ExperimentGenerator(None, self.output_dir.get(), router=self.router,
+                                      strategy="sectioned" if self.sectioned.get() else "single")
             total = len(selected)
-            for i, item in enumerate(selected):
-                data = self.json_data[item]
-                logging.info(f"▶️ [{i+1}/{total}] Xử lý: {data.get('Bài học')}")
+            lessons = [self.json_data[item] for item in selected]
+            for item in selected:
                 self.tree.set(item, "st", "⏳ Working...")
-                
-                # Gọi hàm sinh code
-                res = gen.process_experiment(data, tmpl, prmt)
-                
-                self.tree.set(item, "st", "✅ Done" if res else "❌ Failed")
+            
+            def on_result(idx, res):
+                logging.info("▶️ [%s/%s] Xong: %s", idx + 1, total, lessons[idx].get('Bài học'))
+                self.tree.set(selected[idx], "st", "✅ Done" if res else "❌ Failed")
+            
+            # Gọi hàm sinh code (các bài trùng lặp chỉ gọi AI 1 lần)
+            scheduler = LessonScheduler(CostModel(gen.predictor), self.schedule_policy.get())
+            gen.generate_batch(lessons, tmpl, prmt, on_result=on_result, scheduler=scheduler)
             self.progress.stop()
             messagebox.showinfo("Hoàn tất", f"Đã xử lý xong {total} bài.")
             
         threading.Thread(target=run, daemon=True).start()
 
+    def _start_rerender(self):
+        """Render lại mọi bài đã sinh với template đang chọn, dùng fragments đã lưu"""
+        tmpl = self.selected_template.get()
+        if not os.path.exists(tmpl): return messagebox.showerror("Lỗi", "Template không tồn tại!")
+
+        def run():
+            from process.fragments import rerender
+            self.progress.start()
+            total = rerender(tmpl, self.output_dir.get())
+            self.progress.stop()
+            messagebox.showinfo("Hoàn tất", f"Đã render lại {total} trang.")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _toggle_watch(self):
+        """Bật/tắt chế độ theo dõi: chỉ sinh lại / render lại các bài bị ảnh hưởng khi đầu vào đổi"""
+        if not self.watching.get():
+            if self._watch_stop:
+                self._watch_stop.set()
+                self._watch_stop = None
+                logging.info("⏹️ Đã tắt theo dõi thay đổi.")
+            return
+
+        tmpl = self.selected_template.get()
+        if not os.path.exists(tmpl) or not self.router:
+            self.watching.set(False)
+            return messagebox.showerror("Lỗi", "Cần chọn template và kết nối Vertex AI trước khi theo dõi!")
+
+        from process.watch import LessonWatcher
+        gen = ExperimentGenerator(None, self.output_dir.get(), router=self.router,
+                                  strategy="sectioned" if self.sectioned.get() else "single")
+        watcher = LessonWatcher(gen, self.json_dir.get(), tmpl, excel_path=self.excel_path.get() or None,
+                                prompt_path=self.selected_prompt.get() or None,
+                                scheduler=LessonScheduler(CostModel(gen.predictor), self.schedule_policy.get()),
+                                on_sync=lambda stats: self.root.after(0, self._scan_json))
+        self._watch_stop = threading.Event()
+        threading.Thread(target=watcher.run, args=(self._watch_stop,), daemon=True).start()
+
     def _setup_logging(self):
-        h = QueueHandler(self.log_queue)
-        h.setFormatter(logging.Formatter('%(asctime)s - %(message)s', '%H:%M:%S'))
-        logging.getLogger().addHandler(h); logging.getLogger().setLevel(logging.INFO)
+        # Log ghi qua hàng đợi + luồng listener → luồng sinh không chờ GUI; file JSONL trong logs/
+        self.log_tail = setup_logging(level=logging.INFO, console=False, tail_size=LOG_VIEW_LINES)
 
-    def _process_log_queue(self):
-        while not self.log_queue.empty():
+    def _poll_log_tail(self):
+        self._log_seq, lines = self.log_tail.since(self._log_seq)
+        if lines:
             self.log_text.configure(state='normal')
-            self.log_text.insert(tk.END, self.log_queue.get() + "\n")
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            extra = int(self.log_text.index('end-1c').split('.')[0]) - LOG_VIEW_LINES
+            if extra > 0:
+                self.log_text.delete('1.0', f'{extra + 1}.0')
             self.log_text.see(tk.END)
             self.log_text.configure(state='disabled')
-        self.root.after(100, self._process_log_queue)
+        self.root.after(100, self._poll_log_tail)
+
+    def _set_vertex_state(self, text):
+        self.root.after(0, self.vertex_state.set, text)
+
+    def _init_vertex_async(self):
+        self.vertex_state.set("⏳ Vertex AI: đang kết nối...")
+        threading.Thread(target=self._init_vertex, daemon=True).start()
 
     def _init_vertex(self):
         try:
+            from dotenv import load_dotenv
+            load_dotenv()
+            if os.getenv("VERTEX_FAKE"):
+                # Chế độ offline: endpoint giả lập, không cần credentials
+                self.router = ModelRouter()
+                self._set_vertex_state("🟡 Vertex AI: chế độ giả lập (VERTEX_FAKE)")
+                return
             c = get_vertex_ai_credentials()
             if c: 
-                self.vertex_client = VertexClient(os.getenv("PROJECT_ID"), c, "gemini-2.5-pro")
+                router = ModelRouter(os.getenv("PROJECT_ID"), c)
+                # Khởi tạo sẵn client tầng đầu (import vertexai + vertexai.init) trong nền
+                router.client_for(router.tiers[0].model)
+                self.router = router
                 logging.info("✅ Vertex AI Connected.")
-            else: logging.error("❌ Vertex AI Creds Error.")
-        except: pass
+                self._set_vertex_state("🟢 Vertex AI: đã kết nối")
+            else:
+                logging.error("❌ Vertex AI Creds Error.")
+                self._set_vertex_state("🔴 Vertex AI: lỗi credentials (.env)")
+        except Exception as e:
+            logging.error("❌ Vertex AI init error: %s", e)
+            self._set_vertex_state(f"🔴 Vertex AI: lỗi kết nối ({e})")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # process pool trong bản đóng gói PyInstaller
     root = tk.Tk()
     ttk.Style().theme_use('clam') # Giao diện hiện đại hơn default
     app = HTMLGeneratorGUI(root)
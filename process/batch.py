@@ -0,0 +1,403 @@
+# process/batch.py
+
+import os
+import json
+import time
+import shutil
+import uuid
+import argparse
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from api.callAPI import is_truncated
+from process import tracing
+from process.dedup import LessonDeduplicator
+from process.records import LessonRecord
+from process.store import atomic_write, lesson_key
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_FILE = "requests.jsonl"
+MANIFEST_FILE = "manifest.json"
+JOB_FILE = "job.json"
+RESULTS_FILE = "results.jsonl"
+
+
+# ============ Biên dịch file request JSONL ============
+
+def compile_requests(generator, lessons: List[Dict], job_dir: str, dedup: bool = True) -> Dict:
+    """
+    Dựng prompt cho tất cả bài học (giống hệt chế độ đồng bộ) và ghi ra
+    file JSONL theo định dạng batch prediction của Vertex AI.
+
+    Args:
+        generator: ExperimentGenerator (chỉ dùng build_prompt + predictor)
+        lessons: Danh sách bài học
+        job_dir: Thư mục của batch job
+        dedup: Gộp các bài gần trùng lặp thành 1 request
+
+    Returns:
+        dict: Manifest {key: {"lesson": dữ liệu đại diện, "members": [các bài dùng chung kết quả]}}
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    clusters = LessonDeduplicator().cluster(lessons) if dedup else [[i] for i in range(len(lessons))]
+
+    structured = {}
+    if generator.structured_output:
+        from process.generate import EXPERIMENT_SCHEMA
+        structured = {"responseMimeType": "application/json", "responseSchema": EXPERIMENT_SCHEMA}
+
+    manifest = {}
+    lines = []
+    for cluster in clusters:
+        rep = lessons[cluster[0]]
+        key = base = lesson_key(rep)
+        n = 1
+        while key in manifest:
+            # Bài trùng (nguồn, chương, tên) nhưng không gộp được → giữ cả hai bằng hậu tố
+            n += 1
+            key = f"{base}-{n}"
+        if n > 1:
+            logger.warning("⚠️ Trùng khóa %s (%s), đổi thành %s", base, rep.get('Bài học'), key)
+        manifest[key] = {"lesson": dict(rep), "members": [dict(lessons[i]) for i in cluster]}
+        lines.append(json.dumps({
+            "key": key,
+            "request": {
+                "contents": [{"role": "user", "parts": [{"text": generator.build_prompt(rep)}]}],
+                "generationConfig": {
+                    "temperature": 0.1,
+                    "topP": 0.8,
+                    "maxOutputTokens": generator.predictor.predict(rep),
+                    "candidateCount": 1,
+                    **structured,
+                },
+            },
+        }, ensure_ascii=False))
+
+    atomic_write(os.path.join(job_dir, REQUESTS_FILE), "\n".join(lines) + "\n")
+    atomic_write(os.path.join(job_dir, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+    logger.info("📦 Đã biên dịch %s request cho %s bài vào %s", len(lines), len(lessons), job_dir)
+    return manifest
+
+
+def response_text(response: Dict) -> tuple[Optional[str], Optional[str]]:
+    """Lấy (text, finish_reason) từ một response JSON của batch prediction"""
+    candidates = (response or {}).get("candidates") or []
+    if not candidates:
+        return None, None
+    candidate = candidates[0]
+    parts = (candidate.get("content") or {}).get("parts") or []
+    text = "\n".join(p["text"].strip() for p in parts if p.get("text"))
+    return text or None, candidate.get("finishReason")
+
+
+# ============ Backend submit (có thể thay thế) ============
+
+class BatchSubmitter(ABC):
+    """Giao diện chung cho dịch vụ batch prediction"""
+
+    @abstractmethod
+    def submit(self, job_dir: str) -> str:
+        """Gửi requests.jsonl của job, trả về job_id"""
+
+    @abstractmethod
+    def status(self, job_id: str) -> str:
+        """Trạng thái: PENDING / RUNNING / SUCCEEDED / FAILED"""
+
+    @abstractmethod
+    def download(self, job_id: str, dest_path: str):
+        """Tải kết quả JSONL về dest_path"""
+
+
+class LocalDirectorySubmitter(BatchSubmitter):
+    """
+    Giả lập dịch vụ batch bằng thư mục cục bộ (dùng để test / chạy offline):
+    spool/<job_id>/input.jsonl → run_pending(client) → spool/<job_id>/output.jsonl
+    """
+
+    def __init__(self, spool_dir: str = "batch_spool"):
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _job_path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.spool_dir, job_id, name)
+
+    def submit(self, job_dir: str) -> str:
+        job_id = f"local-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(os.path.join(self.spool_dir, job_id))
+        shutil.copyfile(os.path.join(job_dir, REQUESTS_FILE), self._job_path(job_id, "input.jsonl"))
+        atomic_write(self._job_path(job_id, "state"), "PENDING")
+        logger.info("📤 Đã gửi job %s vào %s", job_id, self.spool_dir)
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        try:
+            with open(self._job_path(job_id, "state"), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return "FAILED"
+
+    def download(self, job_id: str, dest_path: str):
+        shutil.copyfile(self._job_path(job_id, "output.jsonl"), dest_path)
+
+    def run_pending(self, client) -> int:
+        """
+        Xử lý các job đang chờ bằng một client có send_data_to_AI
+        (VertexClient thật hoặc client giả lập). Trả về số job đã xử lý.
+        """
+        done = 0
+        for job_id in sorted(os.listdir(self.spool_dir)):
+            if self.status(job_id) != "PENDING":
+                continue
+            atomic_write(self._job_path(job_id, "state"), "RUNNING")
+            out_lines = []
+            with open(self._job_path(job_id, "input.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    request = item["request"]
+                    config = request.get("generationConfig", {})
+                    prompt = "\n".join(p.get("text", "") for c in request["contents"] for p in c["parts"])
+                    text = client.send_data_to_AI(
+                        prompt,
+                        temperature=config.get("temperature", 0.7),
+                        top_p=config.get("topP", 0.8),
+                        max_output_tokens=config.get("maxOutputTokens", 8192),
+                        response_mime_type=config.get("responseMimeType"),
+                        response_schema=config.get("responseSchema"),
+                    )
+                    info = client.last_call_info() if hasattr(client, "last_call_info") else None
+                    item["response"] = {
+                        "candidates": [{
+                            "content": {"role": "model", "parts": [{"text": text or ""}]},
+                            "finishReason": (info or {}).get("finish_reason") or "STOP",
+                        }],
+                        "usageMetadata": {
+                            "promptTokenCount": (info or {}).get("prompt_tokens"),
+                            "candidatesTokenCount": (info or {}).get("output_tokens"),
+                        },
+                    }
+                    out_lines.append(json.dumps(item, ensure_ascii=False))
+            atomic_write(self._job_path(job_id, "output.jsonl"), "\n".join(out_lines) + "\n")
+            atomic_write(self._job_path(job_id, "state"), "SUCCEEDED")
+            logger.info("✅ Job %s: %s response", job_id, len(out_lines))
+            done += 1
+        return done
+
+
+class VertexBatchSubmitter(BatchSubmitter):
+    """Gửi job lên Vertex AI Batch Prediction (input/output qua Cloud Storage)"""
+
+    def __init__(self, model: str, gcs_prefix: str):
+        """
+        Args:
+            model: Tên model Gemini (vd: gemini-2.5-pro)
+            gcs_prefix: gs://bucket/path dùng để chứa input và output
+        """
+        self.model = model
+        self.gcs_prefix = gcs_prefix.rstrip("/")
+
+    def _bucket_and_path(self, uri: str):
+        bucket, _, path = uri[len("gs://"):].partition("/")
+        return bucket, path
+
+    def submit(self, job_dir: str) -> str:
+        from google.cloud import storage
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        input_uri = f"{self.gcs_prefix}/{run_id}/{REQUESTS_FILE}"
+        bucket, path = self._bucket_and_path(input_uri)
+        storage.Client().bucket(bucket).blob(path).upload_from_filename(os.path.join(job_dir, REQUESTS_FILE))
+
+        job = BatchPredictionJob.submit(
+            source_model=self.model,
+            input_dataset=input_uri,
+            output_uri_prefix=f"{self.gcs_prefix}/{run_id}/output",
+        )
+        logger.info("📤 Đã gửi Vertex batch job: %s", job.resource_name)
+        return job.resource_name
+
+    def status(self, job_id: str) -> str:
+        from vertexai.batch_prediction import BatchPredictionJob
+        state = BatchPredictionJob(job_id).state.name
+        for name in ("SUCCEEDED", "FAILED", "RUNNING", "PENDING"):
+            if name in state:
+                return name
+        return "FAILED" if "CANCELLED" in state else "PENDING"
+
+    def download(self, job_id: str, dest_path: str):
+        from google.cloud import storage
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        bucket_name, prefix = self._bucket_and_path(BatchPredictionJob(job_id).output_location)
+        bucket = storage.Client().bucket(bucket_name)
+        with open(dest_path, "wb") as out:
+            for blob in bucket.list_blobs(prefix=prefix):
+                if blob.name.endswith(".jsonl"):
+                    out.write(blob.download_as_bytes())
+
+
+# ============ Ingest kết quả ============
+
+_PARSER = None
+
+
+def _init_worker(trace: bool):
+    tracing.enable(trace)
+
+
+def _parse_worker(text: str):
+    """
+    Chạy trong process con: parse + validate 1 response.
+    Trả về (fragments, ParseStats, span) để process cha gộp thống kê và trace.
+    """
+    global _PARSER
+    from process.generate import ExperimentGenerator, ParseStats
+    if _PARSER is None:
+        _PARSER = ExperimentGenerator(None, None)
+    _PARSER.parse_stats = ParseStats()
+    tracing.reset()
+    fragments = _PARSER._fragments_from_response(text)
+    return fragments, _PARSER.parse_stats, tracing.events()
+
+
+def ingest_results(generator, job_dir: str, template_path: str, results_path: Optional[str] = None,
+                   workers: Optional[int] = None) -> Dict:
+    """
+    Parse/validate song song toàn bộ kết quả batch rồi render cho mọi bài học
+    (kể cả các bài dùng chung kết quả do gộp trùng lặp).
+
+    Response bị cắt (finishReason=MAX_TOKENS) tính là lỗi, không xuất bản; độ dài được ghi vào
+    lịch sử token để lần compile sau cấp ngân sách lớn hơn cho các bài này.
+
+    Returns:
+        dict: Thống kê {"responses", "ok", "failed", "truncated", "pages"}
+    """
+    with open(os.path.join(job_dir, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    template = generator._load_template(template_path)
+
+    keys, texts = [], []
+    truncated = 0
+    with open(results_path or os.path.join(job_dir, RESULTS_FILE), encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            text, reason = response_text(item.get("response"))
+            if item.get("key") not in manifest:
+                logger.warning("⚠️ Bỏ qua response không có trong manifest: %s", item.get('key'))
+                continue
+            if is_truncated(reason):
+                budget = ((item.get("request") or {}).get("generationConfig") or {}).get("maxOutputTokens")
+                usage = (item.get("response") or {}).get("usageMetadata") or {}
+                logger.error("❌ %s: output bị cắt ở %s tokens, cần compile lại", item['key'], budget)
+                generator.predictor.record(manifest[item["key"]]["lesson"],
+                                           usage.get("candidatesTokenCount") or budget, truncated=True)
+                generator.parse_stats.record_result(False)
+                truncated += 1
+                continue
+            if not text:
+                logger.error("❌ %s: response rỗng (finishReason=%s)", item['key'], reason)
+            keys.append(item["key"])
+            texts.append(text or "")
+
+    stats = {"responses": len(keys) + truncated, "ok": 0, "failed": truncated, "truncated": truncated, "pages": 0}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tracing.enabled(),)) as ex:
+        for key, (fragments, parse_stats, spans) in zip(keys, ex.map(_parse_worker, texts, chunksize=8)):
+            generator.parse_stats.merge(parse_stats)
+            tracing.add_events(spans)
+            if not fragments:
+                stats["failed"] += 1
+                continue
+            stats["ok"] += 1
+            for member in manifest[key]["members"]:
+                generator._publish(LessonRecord.from_dict(member), template, fragments)
+                stats["pages"] += 1
+    generator.store.flush()
+    generator.predictor.flush()
+
+    logger.info("📊 Ingest: %s/%s response hợp lệ (%s bị cắt) → %s trang",
+                stats['ok'], stats['responses'], stats['truncated'], stats['pages'])
+    logger.info("📊 Parse: %s", generator.parse_stats.summary())
+    return stats
+
+
+# ============ CLI ============
+
+def _make_submitter(args) -> BatchSubmitter:
+    if args.backend == "vertex":
+        return VertexBatchSubmitter(args.model, args.gcs_prefix)
+    return LocalDirectorySubmitter(args.spool_dir)
+
+
+def _make_client(model: str):
+    from dotenv import load_dotenv
+    from api.callAPI import VertexClient, get_vertex_ai_credentials
+    load_dotenv()
+    creds = get_vertex_ai_credentials()
+    if not creds:
+        raise SystemExit("❌ Cannot create Vertex AI credentials. Check your .env file.")
+    return VertexClient(os.getenv("PROJECT_ID"), creds, model)
+
+
+def main():
+    from process.generate import ExperimentGenerator
+    from process.pipeline import iter_lessons
+
+    parser = argparse.ArgumentParser(description="Chế độ batch prediction: compile → submit → ingest")
+    parser.add_argument('command', choices=['compile', 'submit', 'status', 'run-local', 'ingest'])
+    parser.add_argument('--job_dir', type=str, default='batch_jobs/latest', help='Thư mục của batch job')
+    parser.add_argument('--json_dir', type=str, default='json_output', help='Thư mục JSON bài học (compile)')
+    parser.add_argument('--chapter', type=str, help='Chỉ compile các bài thuộc chương này')
+    parser.add_argument('--no_dedup', action='store_true', help='Không gộp bài trùng lặp')
+    parser.add_argument('--backend', choices=['local', 'vertex'], default='local')
+    parser.add_argument('--spool_dir', type=str, default='batch_spool', help='Thư mục giả lập dịch vụ batch')
+    parser.add_argument('--gcs_prefix', type=str, help='gs://bucket/path cho backend vertex')
+    parser.add_argument('--model', type=str, default=os.getenv("GEMINI_MODEL", "gemini-2.5-pro"))
+    parser.add_argument('--template', type=str, default='resources/templates/modern.html')
+    parser.add_argument('--output_dir', type=str, default='generated_output')
+    parser.add_argument('--workers', type=int, default=None, help='Số process khi ingest')
+    parser.add_argument('--trace', type=str, help='Ghi Chrome trace JSON + bảng thời gian theo giai đoạn')
+    args = parser.parse_args()
+    tracing.configure(args.trace)
+
+    job_file = os.path.join(args.job_dir, JOB_FILE)
+
+    if args.command == 'compile':
+        lessons = [l for _, l in iter_lessons(args.json_dir)
+                   if not args.chapter or str(l.get('Chương')) == args.chapter]
+        compile_requests(ExperimentGenerator(None, None), lessons, args.job_dir, dedup=not args.no_dedup)
+
+    elif args.command == 'submit':
+        job_id = _make_submitter(args).submit(args.job_dir)
+        atomic_write(job_file, json.dumps({"backend": args.backend, "job_id": job_id}))
+
+    elif args.command == 'run-local':
+        LocalDirectorySubmitter(args.spool_dir).run_pending(_make_client(args.model))
+
+    elif args.command in ('status', 'ingest'):
+        with open(job_file, encoding="utf-8") as f:
+            job = json.load(f)
+        args.backend = job["backend"]
+        submitter = _make_submitter(args)
+        state = submitter.status(job["job_id"])
+        logger.info("Job %s: %s", job['job_id'], state)
+        if args.command == 'ingest':
+            if state != "SUCCEEDED":
+                logger.error("❌ Job chưa hoàn thành, chưa thể ingest")
+                return
+            results_path = os.path.join(args.job_dir, RESULTS_FILE)
+            submitter.download(job["job_id"], results_path)
+            ingest_results(ExperimentGenerator(None, args.output_dir), args.job_dir,
+                           args.template, results_path, workers=args.workers)
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    main()
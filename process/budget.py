@@ -0,0 +1,192 @@
+# process/budget.py
+
+import os
+import re
+import json
+import math
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from process.store import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Tiếng Việt có dấu: trung bình ~3 ký tự / token với tokenizer của Gemini
+CHARS_PER_TOKEN = 3.0
+STEP_PATTERN = r'- Bước \d+:.*?(?=- Bước \d+:|$)'
+
+
+def estimate_tokens(text, chars_per_token: float = CHARS_PER_TOKEN) -> int:
+    """Ước lượng số token của một đoạn văn bản (không gọi API)"""
+    if not text:
+        return 0
+    return int(math.ceil(len(str(text)) / chars_per_token))
+
+
+def extract_steps(exp_data: Dict) -> List[str]:
+    """Các bước '- Bước n: ...' của mô tả thí nghiệm (dùng trường 'steps' tính sẵn nếu có)"""
+    steps = exp_data.get('steps')
+    if steps is not None:
+        return list(steps)
+    mo_ta = exp_data.get('Mô tả thí nghiệm thực hiện', '')
+    if not isinstance(mo_ta, str):
+        return []
+    return [s.strip() for s in re.findall(STEP_PATTERN, mo_ta, re.DOTALL)]
+
+
+def lesson_features(exp_data: Dict) -> Tuple[int, int]:
+    """Đặc trưng độ phức tạp của bài học: (số bước, độ dài mô tả)"""
+    mo_ta = exp_data.get('Mô tả thí nghiệm thực hiện', '')
+    return len(extract_steps(exp_data)), len(mo_ta) if isinstance(mo_ta, str) else 0
+
+
+class PromptBudgeter:
+    """
+    Cắt gọt các trường của bài học cho vừa ngân sách token đầu vào.
+    Các section được cấp ngân sách theo thứ tự ưu tiên; trong một section,
+    ngân sách được chia đều (water-filling) cho các mục thay vì cắt cứng
+    200 ký tự / 6 bước như trước.
+    """
+
+    def __init__(self, input_budget: int = 1500, min_item_chars: int = 60):
+        """
+        Args:
+            input_budget (int): Số token tối đa dành cho dữ liệu bài học trong prompt
+            min_item_chars (int): Độ dài tối thiểu giữ lại cho mỗi mục (bước)
+        """
+        self.input_budget = input_budget
+        self.min_item_chars = min_item_chars
+
+    def _fill(self, items: List[str], budget_chars: int) -> List[str]:
+        """Chia đều budget_chars cho các mục, mục ngắn nhường phần dư cho mục dài"""
+        if budget_chars <= 0 or not items:
+            return []
+
+        # Không đủ chỗ cho tất cả → bỏ bớt các mục cuối
+        max_items = max(1, budget_chars // self.min_item_chars)
+        items = items[:max_items]
+
+        caps = [0] * len(items)
+        remaining = budget_chars
+        pending = sorted(range(len(items)), key=lambda i: len(items[i]))
+        while pending:
+            share = remaining // len(pending)
+            idx = pending[0]
+            if len(items[idx]) <= share:
+                caps[idx] = len(items[idx])
+                remaining -= caps[idx]
+                pending.pop(0)
+            else:
+                for i in pending:
+                    caps[i] = share
+                break
+
+        return [item if len(item) <= cap else item[:max(cap - 1, 0)].rstrip() + "…"
+                for item, cap in zip(items, caps)]
+
+    def fit(self, sections: List[Tuple[str, List[str]]]) -> Dict[str, List[str]]:
+        """
+        Args:
+            sections: [(tên section, [các mục]), ...] theo thứ tự ưu tiên giảm dần
+
+        Returns:
+            dict: {tên section: [các mục đã cắt gọt]}
+        """
+        remaining_chars = int(self.input_budget * CHARS_PER_TOKEN)
+        fitted = {}
+        for name, items in sections:
+            kept = self._fill([i for i in items if i], remaining_chars)
+            fitted[name] = kept
+            remaining_chars -= sum(len(i) for i in kept)
+        return fitted
+
+
+class OutputBudgetPredictor:
+    """
+    Dự đoán max_output_tokens cần thiết từ lịch sử usage của các bài tương tự
+    (k láng giềng gần nhất theo số bước và độ dài mô tả).
+    Các lần bị cắt do MAX_TOKENS được ghi nhận để lần sau tăng ngân sách.
+    """
+
+    def __init__(self, history_path: Optional[str] = ".cache/output_tokens.json",
+                 default_tokens: int = 40000, min_tokens: int = 8192,
+                 max_tokens: int = 65535, margin: float = 1.3, k: int = 5,
+                 max_history: int = 2000, flush_every: int = 20):
+        """
+        Args:
+            flush_every: Ghi lịch sử xuống đĩa sau mỗi bấy nhiêu lần record (gọi flush() khi kết thúc batch)
+        """
+        self.history_path = history_path
+        self.default_tokens = default_tokens
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.margin = margin
+        self.k = k
+        self.max_history = max_history
+        self.flush_every = max(1, flush_every)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.history = self._load()
+
+    def _load(self) -> List[Dict]:
+        if not self.history_path or not os.path.exists(self.history_path):
+            return []
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning("⚠️ Không đọc được lịch sử token %s: %s", self.history_path, e)
+            return []
+
+    def _save(self):
+        if self.history_path:
+            atomic_write(self.history_path, json.dumps(self.history))
+
+    def neighbors(self, exp_data: Dict, k: Optional[int] = None) -> List[Dict]:
+        """k bản ghi lịch sử gần nhất theo (số bước, độ dài mô tả); rỗng nếu lịch sử chưa đủ"""
+        k = k or self.k
+        steps, desc_len = lesson_features(exp_data)
+        with self._lock:
+            samples = list(self.history)
+        if len(samples) < k:
+            return []
+
+        def distance(h):
+            return abs(h['steps'] - steps) + abs(h['desc_len'] - desc_len) / 500
+
+        return sorted(samples, key=distance)[:k]
+
+    def predict(self, exp_data: Dict) -> int:
+        """Dự đoán max_output_tokens cho bài học"""
+        neighbors = self.neighbors(exp_data)
+        if not neighbors:
+            return self.default_tokens
+
+        # Bài bị cắt: số token thực tế cần ít nhất gấp đôi ngân sách đã cấp
+        needed = max(h['output_tokens'] * (2 if h.get('truncated') else 1) for h in neighbors)
+        budget = int(math.ceil(needed * self.margin / 1024) * 1024)
+        return max(self.min_tokens, min(self.max_tokens, budget))
+
+    def record(self, exp_data: Dict, output_tokens: Optional[int], truncated: bool = False, **extra):
+        """Ghi nhận usage thực tế của một lần sinh"""
+        if not output_tokens:
+            return
+        steps, desc_len = lesson_features(exp_data)
+        entry = {'steps': steps, 'desc_len': desc_len,
+                 'output_tokens': int(output_tokens), 'truncated': bool(truncated)}
+        entry.update(extra)
+        with self._lock:
+            self.history.append(entry)
+            del self.history[:-self.max_history]
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._save()
+                self._pending = 0
+
+    def flush(self):
+        """Ghi các bản ghi chưa lưu xuống đĩa (gọi khi kết thúc một batch)"""
+        with self._lock:
+            if self._pending:
+                self._save()
+                self._pending = 0
@@ -0,0 +1,128 @@
+# process/dedup.py
+
+import re
+import unicodedata
+import zlib
+import random
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION_FIELD = 'Mô tả thí nghiệm thực hiện'
+
+# Số nguyên tố Mersenne 2^61 - 1 cho họ hàm băm (a*x + b) mod p
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class LessonDeduplicator:
+    """
+    Phát hiện các bài học gần trùng lặp (cùng một thí nghiệm, khác vài chữ)
+    bằng MinHash + LSH trên phần mô tả thí nghiệm đã chuẩn hóa.
+    Mỗi cụm chỉ cần sinh 1 lần rồi render lại với tiêu đề riêng của từng bài.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3, seed=42):
+        """
+        Args:
+            threshold (float): Ngưỡng Jaccard ước lượng để coi 2 mô tả là trùng
+            num_perm (int): Số hàm băm MinHash (độ dài chữ ký)
+            bands (int): Số band LSH (num_perm phải chia hết cho bands)
+            shingle_size (int): Số từ trong mỗi shingle
+            seed (int): Seed cố định để chữ ký ổn định giữa các lần chạy
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+
+    @staticmethod
+    def normalize(text) -> str:
+        """Chuẩn hóa mô tả: NFC, chữ thường, bỏ số thứ tự bước và dấu câu"""
+        if not isinstance(text, str):
+            return ""
+        text = unicodedata.normalize('NFC', text).lower()
+        text = re.sub(r'bước\s*\d+\s*:?', ' ', text)
+        text = re.sub(r'[^\w\s]', ' ', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def shingles(self, text: str) -> set:
+        """Tách văn bản đã chuẩn hóa thành tập shingle (băm 32-bit)"""
+        words = text.split()
+        if not words:
+            return set()
+        k = min(self.shingle_size, len(words))
+        return {
+            zlib.crc32(' '.join(words[i:i + k]).encode('utf-8'))
+            for i in range(len(words) - k + 1)
+        }
+
+    def signature(self, shingles: set) -> List[int]:
+        """Tính chữ ký MinHash của một tập shingle"""
+        return [
+            min(((a * s + b) % _MERSENNE_PRIME) & _MAX_HASH for s in shingles)
+            for a, b in self._perms
+        ]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """Ước lượng Jaccard từ 2 chữ ký"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+    def cluster(self, lessons: List[Dict]) -> List[List[int]]:
+        """
+        Gom nhóm các bài học gần trùng lặp
+
+        Args:
+            lessons (list): Danh sách dữ liệu bài học
+
+        Returns:
+            list: Danh sách cụm, mỗi cụm là list chỉ số trong `lessons`
+                  (phần tử đầu tiên là đại diện sẽ được sinh bằng AI)
+        """
+        signatures = {}
+        for idx, exp_data in enumerate(lessons):
+            sh = self.shingles(self.normalize(exp_data.get(DESCRIPTION_FIELD, '')))
+            # Bài không có mô tả thì không gộp (prompt chỉ dựa vào tiêu đề)
+            if sh:
+                signatures[idx] = self.signature(sh)
+
+        # Greedy leader clustering: mỗi bài so với đại diện (bài đầu tiên) của các cụm đã có.
+        # LSH chỉ lưu đại diện: bài rơi cùng bucket với đại diện ở ít nhất 1 band là ứng viên.
+        # Không lấy bao đóng bắc cầu (A~B, B~C ⇏ A~C) vì cả cụm dùng chung trang của đại diện.
+        buckets = defaultdict(list)
+        groups = {}
+        for idx in range(len(lessons)):
+            sig = signatures.get(idx)
+            if sig is None:
+                groups[idx] = [idx]
+                continue
+            keys = [(band, tuple(sig[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+            candidates = {leader for key in keys for leader in buckets.get(key, ())}
+            # Đại diện giống nhất (hòa thì cụm tạo trước)
+            best_sim, best = max(((self.similarity(signatures[l], sig), -l) for l in candidates),
+                                 default=(0.0, None))
+            if best is not None and best_sim >= self.threshold:
+                groups[-best].append(idx)
+            else:
+                groups[idx] = [idx]
+                for key in keys:
+                    buckets[key].append(idx)
+
+        clusters = sorted(groups.values(), key=lambda c: c[0])
+        saved = len(lessons) - len(clusters)
+        if saved:
+            logger.info("♻️ Phát hiện %s bài trùng lặp trong %s bài → chỉ cần %s lần gọi AI",
+                        saved, len(lessons), len(clusters))
+        return clusters
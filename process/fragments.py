@@ -0,0 +1,231 @@
+# process/fragments.py
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from process.records import SUMMARY_CHARS
+from process.store import OutputStore, atomic_write, lesson_key
+from process.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+FRAGMENTS_DIR = ".fragments"
+# Runtime JS dùng chung (Sim.loop, Sim.particles, Sim.canvas...) cho các trang có dùng `Sim.`
+RUNTIME_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "resources", "runtime", "sim.js")
+RUNTIME_PLACEHOLDER = "{{RUNTIME_JS}}"
+# Runtime ghi 1 lần vào <output_root>/runtime/sim.js; trang ở <root>/<chương>/<bài>.html tham chiếu tương đối
+RUNTIME_FILE = os.path.join("runtime", "sim.js")
+RUNTIME_SRC = "../runtime/sim.js"
+
+# Hướng dẫn dùng runtime, chèn vào prompt sinh JS (ExperimentGenerator, SectionedGenerator)
+RUNTIME_GUIDE = """Trang đã có sẵn runtime `Sim` (KHÔNG tự viết lại, KHÔNG import):
+- Sim.$(id) lấy phần tử (có cache); Sim.on(id, 'click', fn); Sim.setText(id, value) chỉ ghi DOM khi giá trị đổi
+- Sim.loop.add((dt, t) => {...}): vòng animation DUY NHẤT (dt tính bằng giây), callback trả về false để tự dừng,
+  tự tạm dừng khi tab ẩn. KHÔNG gọi requestAnimationFrame trực tiếp
+- Sim.particles(max): pool hạt dạng typed array: spawn(x, y, vx, vy, life), step(dt, w, h), draw(ctx, r, color),
+  kill(i), clear(), count, x[i]/y[i]/vx[i]/vy[i]/life[i]. KHÔNG tạo mảng object cho hạt, KHÔNG tạo object mới mỗi frame
+- Sim.canvas(id) → {ctx, w, h, dirty, setBackground(draw), invalidate(), redraw(draw)}: vẽ nền tĩnh 1 lần bằng
+  setBackground((ctx, w, h) => ...); mỗi frame dirty.markCircle(x, y, r) cho vật di chuyển (vị trí cũ và mới)
+  hoặc invalidate() khi cả cảnh đổi, rồi redraw((ctx) => ...) chỉ vẽ lại vùng bẩn"""
+
+
+@functools.lru_cache(maxsize=None)
+def load_runtime(path: str = RUNTIME_PATH) -> str:
+    """Đọc runtime, bỏ dòng comment và thụt lề (giữ xuống dòng để không phụ thuộc dấu chấm phẩy)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+    except FileNotFoundError:
+        logger.warning("Không tìm thấy runtime: %s", path)
+        return ""
+    return "\n".join(l for l in lines if l and not l.startswith(("//", "/**")))
+
+
+def publish_runtime(output_root: str) -> str:
+    """Ghi runtime dùng chung vào <output_root>/runtime/sim.js (chỉ ghi khi nội dung đổi), trả về đường dẫn"""
+    path = os.path.join(output_root, RUNTIME_FILE)
+    runtime = load_runtime()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == runtime:
+                return path
+    except FileNotFoundError:
+        pass
+    atomic_write(path, runtime)
+    return path
+
+
+def render_page(exp_data: Dict, template: str, fragments: tuple[str, str, str],
+                inline_runtime: bool = False) -> str:
+    """
+    Inject tiêu đề của bài học, runtime (nếu JS dùng) và fragments vào template.
+    Mặc định runtime là <script src> tới file dùng chung (publish_runtime);
+    inline_runtime=True nhúng cả runtime vào trang (trang 1 file độc lập).
+    """
+    html_content, css_content, js_content = fragments
+    runtime = ""
+    if "Sim." in js_content:
+        if not inline_runtime:
+            runtime = f'<script src="{RUNTIME_SRC}"></script>'
+            if RUNTIME_PLACEHOLDER not in template:
+                # Template cũ chưa có chỗ cho runtime → nạp trong <head>
+                template = template.replace("</head>", f"{runtime}\n</head>", 1)
+        elif RUNTIME_PLACEHOLDER in template:
+            runtime = f"<script>\n{load_runtime()}\n</script>"
+        else:
+            # Template cũ, trang 1 file → đặt runtime ngay trước JS của bài
+            js_content = f"{load_runtime()}\n{js_content}"
+    # summary tính sẵn lúc chuyển Excel (fragments cũ / dict tự tạo thì cắt tại chỗ)
+    summary = exp_data.get("summary") or str(exp_data.get("Nội dung trong bài học", ""))[:SUMMARY_CHARS]
+    return template \
+        .replace("{{CHAPTER_TITLE}}", str(exp_data.get("Chương", ""))) \
+        .replace("{{LESSON_TITLE}}", str(exp_data.get('Bài học', 'Unknown'))) \
+        .replace("{{CONTENT_SUMMARY}}", summary) \
+        .replace(RUNTIME_PLACEHOLDER, runtime) \
+        .replace("{{HTML_CONTENT}}", html_content) \
+        .replace("{{CSS_CONTENT}}", css_content) \
+        .replace("{{JS_CONTENT}}", js_content)
+
+
+class FragmentStore:
+    """
+    Lưu fragments (html, css, js) đã validate của từng bài học để render lại với template khác
+    mà không gọi AI:
+        objects/<sha256>.json   fragments theo hash nội dung (các bài gộp trùng lặp dùng chung)
+        lessons/<key>.json      dữ liệu bài học + hash fragments + metadata
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.lessons_dir = os.path.join(root, "lessons")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.lessons_dir, exist_ok=True)
+
+    @traced("fragments.save")
+    def save(self, exp_data: Dict, fragments: tuple[str, str, str], **meta) -> str:
+        """Lưu fragments của bài học, trả về lesson_key"""
+        blob = json.dumps(dict(zip(("html", "css", "js"), fragments)), ensure_ascii=False)
+        digest = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+        obj_path = os.path.join(self.objects_dir, f"{digest}.json")
+        if not os.path.exists(obj_path):
+            atomic_write(obj_path, blob)
+
+        key = lesson_key(exp_data)
+        record = {"lesson": dict(exp_data), "fragments": digest, "updated": time.time()}
+        record.update(meta)
+        atomic_write(os.path.join(self.lessons_dir, f"{key}.json"), json.dumps(record, ensure_ascii=False))
+        return key
+
+    def keys(self) -> List[str]:
+        return sorted(n[:-5] for n in os.listdir(self.lessons_dir) if n.endswith(".json"))
+
+    def record(self, key: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.lessons_dir, f"{key}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def fragments(self, digest: str) -> tuple[str, str, str]:
+        with open(os.path.join(self.objects_dir, f"{digest}.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        return data["html"], data["css"], data["js"]
+
+    def get(self, exp_data: Dict) -> Optional[tuple[str, str, str]]:
+        """Fragments đã lưu của bài học (None nếu chưa có)"""
+        record = self.record(lesson_key(exp_data))
+        return self.fragments(record["fragments"]) if record else None
+
+
+def _rerender_chunk(args) -> int:
+    """Chạy trong process con: render 1 nhóm bài học, ghi qua OutputStore riêng rồi gộp index"""
+    root, template, output_dir, keys, inline_runtime = args
+    fragment_store = FragmentStore(root)
+    store = OutputStore(output_dir, flush_every=len(keys) + 1)
+    cache = {}
+    done = 0
+    for key in keys:
+        record = fragment_store.record(key)
+        if not record:
+            continue
+        digest = record["fragments"]
+        if digest not in cache:
+            cache[digest] = fragment_store.fragments(digest)
+        store.write(record["lesson"], render_page(record["lesson"], template, cache[digest], inline_runtime))
+        done += 1
+    store.flush()
+    return done
+
+
+def rerender(template_path: str, output_dir: str, fragments_root: Optional[str] = None,
+             workers: Optional[int] = None, chunk_size: int = 200,
+             chapter: Optional[str] = None, keys: Optional[List[str]] = None,
+             inline_runtime: bool = False) -> int:
+    """
+    Render lại toàn bộ trang từ fragments đã lưu với template mới (không gọi AI)
+
+    Args:
+        template_path: Template HTML mới
+        output_dir: Thư mục OutputStore đích
+        fragments_root: Thư mục FragmentStore (mặc định <output_dir>/.fragments)
+        workers: Số process song song (mặc định số CPU)
+        chunk_size: Số bài mỗi process xử lý một lượt
+        chapter: Chỉ render các bài thuộc chương này
+        keys: Chỉ render các bài có lesson_key trong danh sách này
+        inline_runtime: Nhúng runtime vào từng trang thay vì dùng file runtime/sim.js chung
+
+    Returns:
+        int: Số trang đã render
+    """
+    started = time.perf_counter()
+    root = fragments_root or os.path.join(output_dir, FRAGMENTS_DIR)
+    store = FragmentStore(root)
+    wanted = set(keys) if keys is not None else None
+    keys = [k for k in store.keys() if wanted is None or k in wanted]
+    if chapter:
+        keys = [k for k in keys if str((store.record(k) or {}).get("lesson", {}).get("Chương")) == chapter]
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template = f.read()
+
+    if not inline_runtime:
+        publish_runtime(output_dir)
+    chunks = [(root, template, output_dir, keys[i:i + chunk_size], inline_runtime)
+              for i in range(0, len(keys), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        total = sum(map(_rerender_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            total = sum(ex.map(_rerender_chunk, chunks))
+
+    logger.info("♻️ Render lại %s trang với %s trong %.1fs (không gọi AI)",
+                total, os.path.basename(template_path), time.perf_counter() - started)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render lại các trang từ fragments đã lưu với template khác")
+    parser.add_argument('--template', type=str, required=True, help='Template HTML mới')
+    parser.add_argument('--output_dir', type=str, default='generated_output')
+    parser.add_argument('--fragments', type=str, help='Thư mục FragmentStore (mặc định <output_dir>/.fragments)')
+    parser.add_argument('--chapter', type=str, help='Chỉ render các bài thuộc chương này')
+    parser.add_argument('--workers', type=int, default=None, help='Số process song song')
+    parser.add_argument('--inline_runtime', action='store_true', help='Nhúng runtime Sim vào từng trang (trang 1 file)')
+    args = parser.parse_args()
+
+    rerender(args.template, args.output_dir, args.fragments, workers=args.workers, chapter=args.chapter,
+             inline_runtime=args.inline_runtime)
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    main()
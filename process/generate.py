@@ -4,16 +4,136 @@ import json
 import os
 import re
 import logging
-from typing import Dict
-from api.callAPI import VertexClient
+import threading
+from typing import Callable, Dict, List, Optional
+from api.callAPI import VertexClient, is_truncated
+from api.router import ModelRouter
+from process.dedup import LessonDeduplicator
+from process.store import OutputStore, lesson_key
+from process.fragments import FRAGMENTS_DIR, RUNTIME_GUIDE, FragmentStore, publish_runtime, render_page
+from process.tracing import traced
+from process.logs import log_context, new_run_id
+from process.budget import PromptBudgeter, OutputBudgetPredictor, extract_steps
+from process.sections import SectionedGenerator
+from process.scheduler import LessonScheduler
 
 logger = logging.getLogger(__name__)
 
+# Đánh dấu response bị cắt do MAX_TOKENS
+_TRUNCATED = object()
+
+# Schema cho structured output (response_mime_type="application/json")
+EXPERIMENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "html": {"type": "STRING", "description": "HTML fragment, không có <html>/<head>/<body>"},
+        "css": {"type": "STRING", "description": "CSS tùy chỉnh (animations, transitions)"},
+        "js": {"type": "STRING", "description": "JavaScript thuần, có const state và init()"},
+    },
+    "required": ["html", "css", "js"],
+    "propertyOrdering": ["html", "css", "js"],
+}
+
+
+class ParseStats:
+    """Thống kê parse response: tỉ lệ lỗi và throughput hiệu dụng (trang hợp lệ / lần gọi AI)"""
+
+    KINDS = ('json', 'salvaged', 'fallback')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.parsed = {kind: 0 for kind in self.KINDS}
+        self.valid = 0
+        self.invalid = 0
+        # Sinh song song (SectionedGenerator): đạt nhờ sinh lại phần lỗi / phải quay về sinh 1 lần
+        self.sectioned = {'retried': 0, 'fallback': 0}
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def record_parse(self, kind: str):
+        with self._lock:
+            self.parsed[kind] += 1
+
+    def record_sectioned(self, kind: str):
+        with self._lock:
+            self.sectioned[kind] += 1
+
+    def __getstate__(self):
+        # Lock không pickle được (ParseStats của process con gửi về khi ingest batch)
+        return {k: v for k, v in self.__dict__.items() if k != '_lock'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def merge(self, other: 'ParseStats'):
+        """Cộng thống kê của một ParseStats khác (vd từ process con khi ingest batch)"""
+        with self._lock:
+            for kind, n in other.parsed.items():
+                self.parsed[kind] += n
+            self.valid += other.valid
+            self.invalid += other.invalid
+
+    def record_result(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.valid += 1
+            else:
+                self.invalid += 1
+
+    def summary(self) -> str:
+        total = sum(self.parsed.values())
+        if not total and not self.invalid:
+            return "Chưa có response nào được parse"
+        # Mỗi lần thử tính 1 lần theo kết quả cuối (validate); fallback chỉ là cách parse
+        attempts = self.valid + self.invalid
+        failure_rate = self.invalid / attempts if attempts else 0.0
+        throughput = self.valid / self.calls if self.calls else 0.0
+        summary = (f"JSON chuẩn {self.parsed['json']}/{total}, cứu bằng regex {self.parsed['salvaged']}, "
+                   f"fallback {self.parsed['fallback']}, không hợp lệ {self.invalid} "
+                   f"→ tỉ lệ lỗi {failure_rate:.1%}, throughput hiệu dụng {throughput:.2f} trang/lần gọi")
+        if any(self.sectioned.values()):
+            summary += (f"; sinh song song: {self.sectioned['retried']} bài đạt nhờ sinh lại phần lỗi, "
+                        f"{self.sectioned['fallback']} bài quay về sinh 1 lần")
+        return summary
+
+
 class ExperimentGenerator:
-    def __init__(self, vertex_client: VertexClient, output_dir: str):
+    def __init__(self, vertex_client: VertexClient, output_dir: str,
+                 budgeter: Optional[PromptBudgeter] = None,
+                 predictor: Optional[OutputBudgetPredictor] = None,
+                 router: Optional[ModelRouter] = None,
+                 structured_output: bool = True,
+                 strategy: str = "single",
+                 inline_runtime: bool = False):
         self.client = vertex_client
+        self.router = router  # Nếu có: định tuyến model theo độ phức tạp, bỏ qua vertex_client
         self.output_dir = output_dir
-        os.makedirs(output_dir, exist_ok=True)
+        # output_dir=None: chỉ dùng để dựng prompt / parse (không ghi file)
+        self.store = OutputStore(output_dir) if output_dir else None
+        self.fragments = FragmentStore(os.path.join(output_dir, FRAGMENTS_DIR)) if output_dir else None
+        # Runtime Sim: 1 file runtime/sim.js dùng chung cho mọi trang, trừ khi muốn trang 1 file độc lập
+        self.inline_runtime = inline_runtime
+        if output_dir and not inline_runtime:
+            publish_runtime(output_dir)
+        
+        # Ngân sách token: cắt prompt theo ưu tiên, max_output_tokens theo lịch sử
+        self.budgeter = budgeter or PromptBudgeter()
+        self.predictor = predictor or OutputBudgetPredictor()
+        
+        # Structured output theo EXPERIMENT_SCHEMA nếu client hỗ trợ, parser cũ làm dự phòng
+        self.structured_output = structured_output
+        self._schema_rejected = set()  # model đã từ chối response_schema → không gửi schema nữa
+        self.parse_stats = ParseStats()
+        
+        # "single": 1 lần gọi sinh cả trang; "sectioned": hợp đồng phần tử + HTML/CSS/JS song song
+        if strategy not in ("single", "sectioned"):
+            raise ValueError(f"strategy không hợp lệ: {strategy}")
+        self.strategy = strategy
+        self.sectioned = SectionedGenerator(self) if strategy == "sectioned" else None
         
         # Load examples một lần duy nhất
         self.html_example = self._load_example("resources/examples/example.html")
@@ -25,7 +145,7 @@ class ExperimentGenerator:
             with open(path, 'r', encoding='utf-8') as f:
                 return f.read()
         except:
-            logger.warning(f"Không tìm thấy example: {path}")
+            logger.warning("Không tìm thấy example: %s", path)
             return ""
 
     def _clean_code_block(self, text: str, lang: str) -> str:
@@ -52,81 +172,254 @@ class ExperimentGenerator:
         Không tách thành nhiều bước nữa → giảm token waste
         """
         lesson = exp_data.get('Bài học', 'Unknown')
-        logger.info(f"🚀 Sinh HTML cho: {lesson}")
+        with log_context(lesson=lesson_key(exp_data)[:8]):
+            logger.info("🚀 Sinh HTML cho: %s", lesson)
+            
+            # Đọc template
+            template = self._load_template(template_path)
+            
+            fragments = self._generate_fragments(exp_data)
+        if not fragments:
+            return None
         
-        # Đọc template
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template = f.read()
+        filename = self._publish(exp_data, template, fragments)
+        self.store.flush()
+        self.predictor.flush()
+        return filename
+
+    def generate_batch(self, lessons: List[Dict], template_path: str, prompt_path: str,
+                       dedup: bool = True, on_result: Optional[Callable] = None,
+                       scheduler: Optional[LessonScheduler] = None) -> List[Optional[str]]:
+        """
+        Sinh HTML cho nhiều bài học. Các bài gần trùng lặp (cùng thí nghiệm)
+        chỉ gọi AI 1 lần rồi render lại với tiêu đề riêng của từng bài.
         
+        Args:
+            lessons: Danh sách dữ liệu bài học
+            template_path: Đường dẫn template HTML
+            prompt_path: Đường dẫn prompt config
+            dedup: Bật gộp bài trùng lặp
+            on_result: Callback(index, filename) sau mỗi bài (filename=None nếu lỗi)
+            scheduler: Sắp thứ tự sinh theo chi phí dự đoán (mặc định giữ thứ tự `lessons`)
+            
+        Returns:
+            list: Đường dẫn file kết quả theo thứ tự `lessons`
+        """
+        template = self._load_template(template_path)
+        if dedup:
+            clusters = LessonDeduplicator().cluster(lessons)
+        else:
+            clusters = [[i] for i in range(len(lessons))]
+        if scheduler:
+            # Mỗi cụm chạy ở vị trí của thành viên được xếp sớm nhất
+            rank = {idx: r for r, idx in enumerate(scheduler.order(lessons))}
+            clusters.sort(key=lambda c: min(rank[i] for i in c))
+        
+        with log_context(run=new_run_id()):
+            results = [None] * len(lessons)
+            calls = 0
+            for cluster in clusters:
+                rep = lessons[cluster[0]]
+                with log_context(lesson=lesson_key(rep)[:8]):
+                    logger.info("🚀 Sinh HTML cho: %s%s", rep.get('Bài học', 'Unknown'),
+                                f" (dùng chung cho {len(cluster)} bài)" if len(cluster) > 1 else "")
+                    fragments = self._generate_fragments(rep)
+                    calls += 1
+                    for idx in cluster:
+                        if fragments:
+                            results[idx] = self._publish(lessons[idx], template, fragments)
+                        if on_result:
+                            on_result(idx, results[idx])
+
+            self.store.flush()
+            self.predictor.flush()
+            saved = len(lessons) - calls
+            logger.info("📊 %s lần gọi AI cho %s bài, tiết kiệm %s lần nhờ gộp trùng lặp", calls, len(lessons), saved)
+            logger.info("📊 Parse: %s", self.parse_stats.summary())
+            if self.router:
+                logger.info("📊 Thống kê theo tầng model:\n%s", self.router.summary())
+        return results
+
+    def _load_template(self, template_path: str) -> str:
+        """Đọc template HTML"""
+        with open(template_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    @traced("generate.lesson")
+    def _generate_fragments(self, exp_data: Dict) -> Optional[tuple[str, str, str]]:
+        """Gọi AI, parse và validate → (html, css, js) hoặc None nếu lỗi"""
         # Tạo prompt SIÊU TỐI ƯU
         prompt = self._build_optimized_prompt(exp_data)
         
-        # Gọi AI 1 lần duy nhất với max_tokens cao
-        response = self.client.send_data_to_AI(
-            prompt, 
-            max_output_tokens=40000,  # Đủ lớn cho toàn bộ HTML+CSS+JS
-            temperature=0.1  # Giảm temperature để code ổn định hơn
-        )
+        if not self.router:
+            return self._generate_with(self.client, exp_data, prompt, strict=False)
         
+        # Thử từ tầng model được định tuyến, không qua validate thì leo thang
+        candidates = self.router.candidates(exp_data)
+        for attempt, tier in enumerate(candidates):
+            last = attempt == len(candidates) - 1
+            client = self.router.client_for(tier.model)  # tạo lười: chỉ khi thực sự leo thang
+            fragments = self._generate_with(client, exp_data, prompt, strict=not last)
+            info = client.last_call_info() if hasattr(client, 'last_call_info') else None
+            self.router.record(tier, info, ok=fragments is not None, escalated=fragments is None and not last)
+            if fragments:
+                return fragments
+            if not last:
+                logger.warning("⬆️ %s không đạt, chuyển lên %s", tier.model, candidates[attempt + 1].model)
+        return None
+
+    def _generate_with(self, client, exp_data: Dict, prompt: str, strict: bool) -> Optional[tuple[str, str, str]]:
+        """
+        Sinh fragments bằng một client cụ thể
+        
+        Args:
+            strict: True → JS lỗi (sau auto-fix) cũng coi là thất bại để leo thang model
+        """
+        # Sinh song song theo hợp đồng; vi phạm hợp đồng → quay về cách sinh 1 lần
+        if self.sectioned:
+            sections = self.sectioned.generate(client, exp_data)
+            if sections:
+                fragments = self._validate_fragments(*sections, strict=strict)
+                if fragments:
+                    return fragments
+            logger.warning("↩️ Sinh song song không đạt, chuyển sang sinh 1 lần")
+            self.parse_stats.record_sectioned('fallback')
+        
+        # Gọi AI 1 lần duy nhất, max_tokens dự đoán theo các bài tương tự
+        max_tokens = self.predictor.predict(exp_data)
+        response = self._call_ai(client, exp_data, prompt, max_tokens)
+        
+        # Bị cắt do MAX_TOKENS → thử lại 1 lần với ngân sách tối đa
+        if response is _TRUNCATED and max_tokens < self.predictor.max_tokens:
+            logger.warning("⚠️ Output bị cắt ở %s tokens, thử lại với %s", max_tokens, self.predictor.max_tokens)
+            max_tokens = self.predictor.max_tokens
+            response = self._call_ai(client, exp_data, prompt, max_tokens)
+        
+        if response is _TRUNCATED:
+            # Trang viết dở không được parse/xuất bản
+            logger.error("❌ Output vẫn bị cắt ở %s tokens, bỏ bài này", max_tokens)
+            self.parse_stats.record_result(False)
+            return None
         if not response:
             logger.error("❌ AI không trả về response")
             return None
         
+        return self._fragments_from_response(response, strict)
+
+    def _fragments_from_response(self, response: str, strict: bool = False) -> Optional[tuple[str, str, str]]:
+        """Parse + validate response của AI → (html, css, js) hoặc None nếu không hợp lệ"""
         # Parse response
-        html_content, css_content, js_content = self._parse_complete_response(response)
-        
-        # Validate trước khi lưu
+        return self._validate_fragments(*self._parse_complete_response(response), strict=strict)
+
+    @traced("validate")
+    def _validate_fragments(self, html_content: str, css_content: str, js_content: str,
+                            strict: bool = False) -> Optional[tuple[str, str, str]]:
+        """Validate (html, css, js) trước khi lưu; JS lỗi được thử auto-fix"""
         from process.validate import CodeValidator
         
         is_valid_html, msg = CodeValidator.validate_html(html_content)
         if not is_valid_html:
-            logger.error(f"❌ HTML không hợp lệ: {msg}")
+            logger.error("❌ HTML không hợp lệ: %s", msg)
+            self.parse_stats.record_result(False)
             return None
         
         is_valid_js, msg = CodeValidator.validate_js(js_content)
         if not is_valid_js:
-            logger.error(f"❌ JS không hợp lệ: {msg}")
+            logger.error("❌ JS không hợp lệ: %s", msg)
             # Thử fix tự động
             js_content = self._auto_fix_js(js_content)
+            if strict and not CodeValidator.validate_js(js_content)[0]:
+                self.parse_stats.record_result(False)
+                return None
         
-        # Inject vào template
-        output = template \
-            .replace("{{CHAPTER_TITLE}}", str(exp_data.get("Chương", ""))) \
-            .replace("{{LESSON_TITLE}}", str(lesson)) \
-            .replace("{{CONTENT_SUMMARY}}", str(exp_data.get("Nội dung trong bài học", ""))[:200]) \
-            .replace("{{HTML_CONTENT}}", html_content) \
-            .replace("{{CSS_CONTENT}}", css_content) \
-            .replace("{{JS_CONTENT}}", js_content)
+        self.parse_stats.record_result(True)
+        return html_content, css_content, js_content
+
+    @traced("ai.call")
+    def _call_ai(self, client, exp_data: Dict, prompt: str, max_tokens: int):
+        """Gọi AI và ghi nhận usage; trả về _TRUNCATED nếu output bị cắt (kể cả ở ngân sách tối đa)"""
+        model = getattr(client, 'model_name', None) or id(client)
+        structured = self.structured_output and getattr(client, 'supports_structured_output', False) \
+            and model not in self._schema_rejected
+        response = self._send(client, prompt, max_tokens, structured)
+        info = client.last_call_info() if hasattr(client, 'last_call_info') else None
         
-        # Lưu file
-        safe_name = re.sub(r'[^\w\-]', '_', lesson)
-        filename = os.path.join(self.output_dir, f"{safe_name}.html")
+        # Model không nhận response_schema → nhớ lại cho các bài sau, gọi lại kiểu cũ
+        if response is None and structured and info and re.search(r'400|schema|mime', str(info.get('error')), re.I):
+            logger.warning("⚠️ %s từ chối structured output, từ nay dùng prompt + parser cũ", model)
+            self._schema_rejected.add(model)
+            response = self._send(client, prompt, max_tokens, False)
+            info = client.last_call_info()
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(output)
+        if not info:
+            return response
         
-        logger.info(f"✅ Đã tạo: {filename}")
+        truncated = is_truncated(info.get('finish_reason'))
+        # latency + key: dữ liệu cho mô hình chi phí / mô phỏng của process.scheduler
+        self.predictor.record(exp_data, info.get('output_tokens') or (max_tokens if truncated else None),
+                              truncated=truncated, latency=info.get('latency'), key=lesson_key(exp_data))
+        if truncated:
+            return _TRUNCATED
+        return response
+
+    def _send(self, client, prompt: str, max_tokens: int, structured: bool):
+        """Một lần gọi AI (có/không structured output)"""
+        self.parse_stats.record_call()
+        kwargs = {}
+        if structured:
+            kwargs = {'response_mime_type': "application/json", 'response_schema': EXPERIMENT_SCHEMA}
+        return client.send_data_to_AI(
+            prompt, 
+            max_output_tokens=max_tokens,
+            temperature=0.1,  # Giảm temperature để code ổn định hơn
+            **kwargs
+        )
+
+    @traced("render")
+    def _render_page(self, exp_data: Dict, template: str, fragments: tuple[str, str, str]) -> str:
+        """Inject tiêu đề của bài học và fragments vào template"""
+        return render_page(exp_data, template, fragments, self.inline_runtime)
+
+    def _publish(self, exp_data: Dict, template: str, fragments: tuple[str, str, str]) -> str:
+        """Render + ghi trang, lưu fragments để sau này render lại với template khác không cần gọi AI"""
+        filename = self._write_output(exp_data, self._render_page(exp_data, template, fragments))
+        self.fragments.save(exp_data, fragments)
+        return filename
+
+    @traced("store.write")
+    def _write_output(self, exp_data: Dict, output: str) -> str:
+        """Lưu trang HTML qua OutputStore (ghi nguyên tử, theo chương, khử trùng lặp)"""
+        filename = self.store.write(exp_data, output)
+        logger.info("✅ Đã tạo: %s", filename)
         return filename
 
+    def build_prompt(self, exp_data: Dict) -> str:
+        """Prompt sinh thí nghiệm cho bài học (dùng chung cho chế độ đồng bộ và batch)"""
+        return self._build_optimized_prompt(exp_data)
+
+    @traced("prompt.build")
     def _build_optimized_prompt(self, exp_data: Dict) -> str:
         """
         Tạo prompt SIÊU TỐI ƯU - Ngắn gọn, rõ ràng, có ví dụ
         """
-        mo_ta = exp_data.get('Mô tả thí nghiệm thực hiện', '')
-        
-        # Trích xuất các bước từ mô tả
-        steps = re.findall(r'- Bước \d+:.*?(?=- Bước \d+:|$)', mo_ta, re.DOTALL)
-        steps_summary = "\n".join([s.strip()[:200] for s in steps[:6]])  # Chỉ lấy 6 bước đầu
+        # Cắt các bước + nội dung bài học cho vừa ngân sách token đầu vào
+        content = exp_data.get('Nội dung trong bài học', '')
+        fitted = self.budgeter.fit([
+            ('steps', extract_steps(exp_data)),
+            ('content', [content.strip() if isinstance(content, str) else '']),
+        ])
+        steps_summary = "\n".join(fitted['steps'])
+        content_section = f"\n**KIẾN THỨC BÀI HỌC:**\n{fitted['content'][0]}\n" if fitted['content'] else ""
         
         prompt = f"""Bạn là chuyên gia tạo thí nghiệm HTML tương tác.
 
 **THÔNG TIN:**
-• Bài: {exp_data.get('Bài học')}
+• Bài: {exp_data.get('title_norm', exp_data.get('Bài học'))}
 • Chương: {exp_data.get('Chương')}
 
 **CÁC BƯỚC THÍ NGHIỆM:**
 {steps_summary}
-
+{content_section}
 **YÊU CẦU QUAN TRỌNG:**
 1. TRẢ VỀ JSON DUY NHẤT theo format:
 ```json
@@ -151,17 +444,20 @@ class ExperimentGenerator:
    - Viết GỌN, LOGIC RÕ RÀNG
    - Khai báo: const state = {{...}}
    - Hàm init() ở cuối, tự động gọi
-   - Dùng requestAnimationFrame cho animation
+   - Animation qua Sim.loop.add (xem RUNTIME bên dưới)
    - KHÔNG DÙNG localStorage/sessionStorage
 
+**RUNTIME:**
+{RUNTIME_GUIDE}
+
 **VÍ DỤ THAM KHẢO:**
 ```json
 {{
-  "html": "<div id='canvas-container' class='relative w-full h-96 bg-gray-900'><canvas id='myCanvas' width='800' height='400'></canvas></div><div class='mt-4 flex gap-2'><button id='btnStart' class='px-4 py-2 bg-green-500 text-white rounded'>Start</button></div>",
+  "html": "<div id='canvas-container' class='relative w-full h-96 bg-gray-900'><canvas id='myCanvas' width='800' height='400'></canvas></div><div class='mt-4 flex gap-2'><button id='btnStart' class='px-4 py-2 bg-green-500 text-white rounded'>Start</button><span id='bubbleCount' class='px-4 py-2'>0</span></div>",
   
   "css": "@keyframes glow {{ 0% {{ box-shadow: 0 0 5px blue; }} 100% {{ box-shadow: 0 0 20px blue; }} }}",
   
-  "js": "const canvas = document.getElementById('myCanvas'); const ctx = canvas.getContext('2d'); const state = {{ running: false }}; function drawCircle() {{ ctx.clearRect(0,0,800,400); ctx.fillStyle='red'; ctx.arc(100,100,50,0,Math.PI*2); ctx.fill(); }} function init() {{ document.getElementById('btnStart').onclick = () => {{ state.running = true; drawCircle(); }}; }} init();"
+  "js": "const view = Sim.canvas('myCanvas'); const bubbles = Sim.particles(300); const state = {{ running: false }}; function update(dt) {{ bubbles.step(dt, view.w, view.h, false); view.invalidate(); view.redraw((ctx) => bubbles.draw(ctx, 4, '#93c5fd')); Sim.setText('bubbleCount', bubbles.count); return state.running; }} function init() {{ view.setBackground((ctx, w, h) => {{ ctx.fillStyle = '#111827'; ctx.fillRect(0, 0, w, h); }}); view.redraw(() => {{}}); Sim.on('btnStart', 'click', () => {{ state.running = true; for (let i = 0; i < 60; i++) bubbles.spawn(Math.random() * view.w, view.h, 0, -40 - Math.random() * 60, 4); Sim.loop.add(update); }}); }} init();"
 }}
 ```
 
@@ -169,23 +465,35 @@ BẮT ĐẦU TẠO JSON CHO THÍ NGHIỆM TRÊN:"""
 
         return prompt
 
+    @traced("parse")
     def _parse_complete_response(self, response: str) -> tuple[str, str, str]:
         """Parse JSON response từ AI"""
         try:
-            # Tìm JSON block
-            match = re.search(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-            else:
-                # Tìm { } đầu tiên
-                start = response.find('{')
-                end = response.rfind('}')
-                if start != -1 and end != -1:
-                    json_str = response[start:end+1]
-                else:
-                    raise ValueError("Không tìm thấy JSON")
+            data = None
+            # Structured output: toàn bộ response là JSON
+            if response.lstrip().startswith('{'):
+                try:
+                    data = json.loads(response)
+                    kind = 'json'
+                except ValueError:
+                    data = None
             
-            data = json.loads(json_str)
+            if data is None:
+                kind = 'salvaged'
+                # Tìm JSON block
+                match = re.search(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
+                if match:
+                    json_str = match.group(1)
+                else:
+                    # Tìm { } đầu tiên
+                    start = response.find('{')
+                    end = response.rfind('}')
+                    if start != -1 and end != -1:
+                        json_str = response[start:end+1]
+                    else:
+                        raise ValueError("Không tìm thấy JSON")
+                
+                data = json.loads(json_str)
             
             html = data.get('html', '')
             css = data.get('css', '')
@@ -196,11 +504,14 @@ BẮT ĐẦU TẠO JSON CHO THÍ NGHIỆM TRÊN:"""
             css = self._clean_code_block(css, 'css')
             js = self._clean_code_block(js, 'javascript')
             
+            # Ghi nhận sau khi parse xong: lỗi ở bước trên chỉ được tính 1 lần là fallback
+            self.parse_stats.record_parse(kind)
             return html, css, js
             
         except Exception as e:
-            logger.error(f"❌ Parse error: {e}")
+            logger.error("❌ Parse error: %s", e)
             # Fallback: thử tách theo markers
+            self.parse_stats.record_parse('fallback')
             return self._fallback_parse(response)
 
     def _fallback_parse(self, response: str) -> tuple[str, str, str]:
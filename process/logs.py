@@ -0,0 +1,203 @@
+# process/logs.py
+
+import os
+import json
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional, Tuple
+
+# ID tương quan: lần chạy (batch) và bài học đang xử lý, gắn vào mọi log record
+run_id: contextvars.ContextVar[str] = contextvars.ContextVar('run_id', default='-')
+lesson_id: contextvars.ContextVar[str] = contextvars.ContextVar('lesson_id', default='-')
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(run_id)s/%(lesson_id)s] %(message)s'
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:8]
+
+
+@contextmanager
+def log_context(run: Optional[str] = None, lesson: Optional[str] = None):
+    """Gắn run/lesson ID cho mọi log trong khối (kể cả thư viện con gọi bên trong)"""
+    tokens = []
+    if run is not None:
+        tokens.append((run_id, run_id.set(run)))
+    if lesson is not None:
+        tokens.append((lesson_id, lesson_id.set(lesson)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def bind_context(func, lesson: Optional[str] = None):
+    """
+    Bọc func để chạy ở thread pool với run/lesson ID của luồng gọi
+    (ThreadPoolExecutor không tự truyền contextvars sang worker thread)
+    """
+    ctx = contextvars.copy_context()
+
+    def call(*args, **kwargs):
+        def inner():
+            with log_context(lesson=lesson):
+                return func(*args, **kwargs)
+        return ctx.run(inner)
+    return call
+
+
+class _ContextFilter(logging.Filter):
+    """Gắn ID tương quan cho record chưa đi qua hàng đợi (vd: log lúc tiến trình kết thúc)"""
+
+    def filter(self, record):
+        if not hasattr(record, 'run_id'):
+            record.run_id = run_id.get()
+            record.lesson_id = lesson_id.get()
+        return True
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Đẩy record sang luồng listener mà KHÔNG format ở luồng gọi:
+    chỉ gắn ID tương quan (contextvars phải đọc ở luồng gọi), message được ghép lúc ghi.
+    Hàng đợi có giới hạn: khi đầy thì bỏ log và đếm số bản ghi bị bỏ thay vì chặn worker.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.run_id = run_id.get()
+        record.lesson_id = lesson_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Một record = một dòng JSON (ts, level, logger, run, lesson, msg, exc)"""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'run': getattr(record, 'run_id', '-'),
+            'lesson': getattr(record, 'lesson_id', '-'),
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LogTail(logging.Handler):
+    """Bộ đệm vòng giữ N dòng log gần nhất cho GUI (đọc tăng dần theo số thứ tự)"""
+
+    def __init__(self, capacity: int = 2000):
+        super().__init__()
+        self._lines = deque(maxlen=capacity)
+        self._seq = 0
+        self._tail_lock = threading.Lock()
+
+    def emit(self, record):
+        line = self.format(record)
+        with self._tail_lock:
+            self._seq += 1
+            self._lines.append((self._seq, line))
+
+    def since(self, seq: int) -> Tuple[int, List[str]]:
+        """Các dòng mới hơn `seq` → (seq mới nhất, danh sách dòng)"""
+        with self._tail_lock:
+            lines = [line for s, line in self._lines if s > seq]
+            return self._seq, lines
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[_ContextQueueHandler] = None
+_sinks: List[logging.Handler] = []
+_tail: Optional[LogTail] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level=logging.INFO, log_dir: Optional[str] = "logs", console: bool = True,
+                  tail_size: int = 2000, queue_size: int = 10000,
+                  max_bytes: int = 5 * 1024 * 1024, backups: int = 5,
+                  console_format: str = TEXT_FORMAT) -> LogTail:
+    """
+    Cấu hình logging bất đồng bộ cho toàn tiến trình (gọi lại nhiều lần không sao):
+    root logger → hàng đợi có giới hạn → QueueListener → console / file JSONL xoay vòng / tail cho GUI
+
+    Args:
+        level: Mức log của root logger
+        log_dir: Thư mục file logs/htmlgen.jsonl (None = không ghi file)
+        console: Ghi ra stderr
+        tail_size: Số dòng giữ trong bộ nhớ cho GUI
+        queue_size: Kích thước hàng đợi; đầy thì bỏ log thay vì chặn luồng sinh
+        max_bytes, backups: Xoay vòng file JSONL
+
+    Returns:
+        LogTail: Bộ đệm dòng log gần nhất
+    """
+    global _listener, _handler, _tail, _sinks
+    with _setup_lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+        if _listener:
+            return _tail
+
+        _tail = LogTail(tail_size)
+        _tail.setFormatter(logging.Formatter('%(asctime)s - [%(lesson_id)s] %(message)s', '%H:%M:%S'))
+        sinks = [_tail]
+        if console:
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter(console_format))
+            sinks.append(stream)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            rotating = RotatingFileHandler(os.path.join(log_dir, "htmlgen.jsonl"), maxBytes=max_bytes,
+                                           backupCount=backups, encoding='utf-8', delay=True)
+            rotating.setFormatter(JsonLineFormatter())
+            sinks.append(rotating)
+        for sink in sinks:
+            sink.addFilter(_ContextFilter())
+        _sinks = sinks
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        _handler = _ContextQueueHandler(log_queue)
+        for h in list(root.handlers):
+            root.removeHandler(h)  # bỏ handler mặc định (basicConfig) để không log 2 lần
+        root.addHandler(_handler)
+        _listener = QueueListener(log_queue, *sinks, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _tail
+
+
+def shutdown_logging():
+    """Dừng listener, ghi nốt các log còn trong hàng đợi; log sau đó ghi trực tiếp (đồng bộ)"""
+    global _listener
+    with _setup_lock:
+        if _listener:
+            if _handler and _handler.dropped:
+                logging.getLogger(__name__).warning("⚠️ Đã bỏ %s log do hàng đợi đầy", _handler.dropped)
+            _listener.stop()
+            _listener = None
+            root = logging.getLogger()
+            root.removeHandler(_handler)
+            for sink in _sinks:
+                root.addHandler(sink)
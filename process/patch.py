@@ -0,0 +1,161 @@
+# process/patch.py
+
+import re
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Các marker có sẵn trong resources/templates/*.html
+_SECTION_PATTERNS = {
+    'css': r'/\* ======== START OF INJECTED CSS ======== \*/ *\n(?:\s*/\*[^\n]*\*/ *\n)?(.*?)\s*/\* ======== END OF INJECTED CSS ======== \*/',
+    'js': r'// ======== START OF INJECTED JS ======== *\n(?:\s*//[^\n]*\n)?(.*?)\s*// ======== END OF INJECTED JS ========',
+    'html': r'<div id="simulation-area">\s*(?:<!--.*?-->\s*)?(.*)</div>\s*</section>',
+}
+
+# Trang không theo template: lấy <style>, <script> inline cuối cùng và nội dung <body>
+_FALLBACK_PATTERNS = {
+    'css': r'<style[^>]*>(.*?)</style>',
+    'js': r'<script(?![^>]*\bsrc=)[^>]*>(.*?)</script>',
+    'html': r'<body[^>]*>(.*?)(?:<script|</body>)',
+}
+
+
+def split_page(page: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Xác định vị trí các section html/css/js trong trang
+
+    Returns:
+        dict: {section: (start, end)} theo chỉ số ký tự trong page
+    """
+    spans = {}
+    for name, pattern in _SECTION_PATTERNS.items():
+        match = re.search(pattern, page, re.DOTALL)
+        if not match:
+            matches = list(re.finditer(_FALLBACK_PATTERNS[name], page, re.DOTALL | re.IGNORECASE))
+            match = matches[-1] if name == 'js' and matches else (matches[0] if matches else None)
+        if match:
+            spans[name] = match.span(1)
+    return spans
+
+
+def page_sections(page: str) -> Dict[str, str]:
+    """Nội dung các section html/css/js của trang"""
+    return {name: page[start:end] for name, (start, end) in split_page(page).items()}
+
+
+def _function_span(js: str, name: str) -> Optional[Tuple[int, int]]:
+    """Vị trí khai báo hàm `name` (function declaration hoặc const name = ...) trong JS"""
+    import esprima
+
+    try:
+        tree = esprima.parseScript(js, range=True)
+    except Exception:
+        return None
+
+    for node in tree.body:
+        if node.type == 'FunctionDeclaration' and node.id and node.id.name == name:
+            return tuple(node.range)
+        if node.type == 'VariableDeclaration':
+            for decl in node.declarations:
+                if decl.id.type == 'Identifier' and decl.id.name == name and decl.init is not None \
+                        and decl.init.type in ('FunctionExpression', 'ArrowFunctionExpression'):
+                    return tuple(node.range)
+    return None
+
+
+def _apply_to_section(content: str, patch: Dict) -> str:
+    """Áp dụng một patch lên nội dung của một section"""
+    target = patch['target']
+    op = patch.get('op', 'replace')
+    new = patch.get('content', '')
+
+    if target == 'js:function':
+        span = _function_span(content, patch['name'])
+        if span is None:
+            # Hàm mới: chèn trước lời gọi init() cuối cùng nếu có
+            idx = content.rfind('init();')
+            return content[:idx] + new + '\n\n' + content[idx:] if idx != -1 else content + '\n\n' + new
+        return content[:span[0]] + new + content[span[1]:]
+
+    if target == 'html:element':
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(content, 'html.parser')
+        el = soup.find(id=patch['id'])
+        if el is None:
+            raise ValueError(f"Không tìm thấy phần tử #{patch['id']}")
+        el.replace_with(BeautifulSoup(new, 'html.parser'))
+        return str(soup)
+
+    if op == 'append':
+        return content.rstrip() + '\n' + new
+    return new
+
+
+def apply_patches(page: str, patches: List[Dict]) -> Tuple[str, int, List[str]]:
+    """
+    Áp dụng danh sách patch lên trang HTML
+
+    Patch hỗ trợ:
+        {"target": "html" | "css" | "js", "op": "replace" | "append", "content": "..."}
+        {"target": "js:function", "name": "draw", "content": "function draw() {...}"}
+        {"target": "html:element", "id": "btnStart", "content": "<button ...>...</button>"}
+
+    Returns:
+        tuple: (trang mới, số patch đã áp dụng, danh sách lỗi)
+    """
+    sections = page_sections(page)
+    applied, errors = 0, []
+    for patch in patches:
+        target = str(patch.get('target', ''))
+        section = target.split(':')[0]
+        if section not in sections:
+            errors.append(f"Section không tồn tại: {target}")
+            continue
+        try:
+            sections[section] = _apply_to_section(sections[section], patch)
+            applied += 1
+        except Exception as e:
+            errors.append(f"{target}: {e}")
+
+    # Ghép lại từ cuối lên đầu để chỉ số của các section phía trước không bị lệch
+    spans = split_page(page)
+    for name, (start, end) in sorted(spans.items(), key=lambda kv: kv[1][0], reverse=True):
+        page = page[:start] + sections[name] + page[end:]
+    return page, applied, errors
+
+
+def validate_sections(page: str) -> Tuple[bool, str]:
+    """Validate lại các section sau khi vá"""
+    from process.validate import CodeValidator
+
+    sections = page_sections(page)
+    checks = [
+        ('html', CodeValidator.validate_html),
+        ('css', CodeValidator.validate_css),
+        ('js', CodeValidator.validate_js),
+    ]
+    for name, check in checks:
+        if name in sections:
+            ok, msg = check(sections[name])
+            if not ok:
+                return False, f"{name}: {msg}"
+    return True, "OK"
+
+
+def parse_patch_response(response: str) -> List[Dict]:
+    """Lấy danh sách patch từ response JSON của AI"""
+    match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
+    if match:
+        json_str = match.group(1)
+    else:
+        start = min([i for i in (response.find('{'), response.find('[')) if i != -1], default=-1)
+        end = max(response.rfind('}'), response.rfind(']'))
+        if start == -1 or end == -1:
+            raise ValueError("Không tìm thấy JSON patch")
+        json_str = response[start:end + 1]
+
+    data = json.loads(json_str)
+    patches = data.get('patches', []) if isinstance(data, dict) else data
+    return [p for p in patches if isinstance(p, dict) and p.get('target')]
@@ -1,13 +1,12 @@
 # pipeline.py
 
-import pandas as pd
 import json
 import os
-from pathlib import Path
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from process.tracing import traced
+from process.records import LESSON_COLUMNS, TEXT_COLUMNS, LessonRecord, derive_frame, records_from_frame
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +32,7 @@ class ExcelToJsonPipeline:
         # Tạo thư mục output nếu chưa tồn tại
         os.makedirs(self.output_dir, exist_ok=True)
     
+    @traced("excel.load")
     def load_excel(self):
         """
         Đọc file Excel và lấy tất cả sheet names
@@ -41,26 +41,30 @@ class ExcelToJsonPipeline:
             bool: True nếu thành công, False nếu thất bại
         """
         try:
-            logger.info(f"Đang đọc file Excel: {self.excel_file}")
+            import pandas as pd  # Import lười: pandas nặng, chỉ cần khi đọc Excel
+            
+            logger.info("Đang đọc file Excel: %s", self.excel_file)
             data = pd.ExcelFile(self.excel_file)
             self.sheet_names = data.sheet_names
-            logger.info(f"Tìm thấy {len(self.sheet_names)} sheets: {self.sheet_names}")
+            logger.info("Tìm thấy %s sheets: %s", len(self.sheet_names), self.sheet_names)
             
-            # Đọc tất cả các sheet
+            # Đọc tất cả các sheet (mở file 1 lần), chỉ lấy các cột bài học cần dùng
             for sheet in self.sheet_names:
-                df = pd.read_excel(self.excel_file, sheet_name=sheet)
+                df = pd.read_excel(data, sheet_name=sheet, usecols=lambda c: c in LESSON_COLUMNS,
+                                   dtype={c: str for c in TEXT_COLUMNS})
                 self.all_tables[sheet] = df
-                logger.info(f"  ✓ Đã đọc sheet '{sheet}': {len(df)} dòng, {len(df.columns)} cột")
+                logger.info("  ✓ Đã đọc sheet '%s': %s dòng, %s cột", sheet, len(df), len(df.columns))
             
             return True
             
         except FileNotFoundError:
-            logger.error(f"Không tìm thấy file: {self.excel_file}")
+            logger.error("Không tìm thấy file: %s", self.excel_file)
             return False
         except Exception as e:
-            logger.error(f"Lỗi khi đọc file Excel: {str(e)}")
+            logger.error("Lỗi khi đọc file Excel: %s", e)
             return False
     
+    @traced("excel.process_sheet")
     def process_sheet(self, sheet_name):
         """
         Xử lý một sheet thành cấu trúc JSON theo format yêu cầu
@@ -74,16 +78,19 @@ class ExcelToJsonPipeline:
         """
         try:
             df = self.all_tables[sheet_name]
-            logger.info(f"Đang xử lý sheet: {sheet_name}")
+            logger.info("Đang xử lý sheet: %s", sheet_name)
+            
+            # Tách bước, chuẩn hóa tên bài cho cả sheet 1 lần → ghi kèm JSON, lúc sinh không phải parse lại
+            df = derive_frame(df)
             
             # Kiểm tra các cột bắt buộc
             required_columns = ['source_folder', 'chapter_folder']
             missing_columns = [col for col in required_columns if col not in df.columns]
             
             if missing_columns:
-                logger.warning(f"Sheet '{sheet_name}' thiếu các cột: {missing_columns}")
+                logger.warning("Sheet '%s' thiếu các cột: %s", sheet_name, missing_columns)
                 # Nếu không có cột cần thiết, trả về toàn bộ data dạng list
-                result = {"Data": df.to_dict('records')}
+                result = {"Data": [r.to_dict() for r in records_from_frame(df)]}
                 return result
             
             # Nhóm theo source_folder và chapter_folder
@@ -91,20 +98,21 @@ class ExcelToJsonPipeline:
             
             result = {}
             for (source, chapter), group in grouped:
-                # Convert group thành list of dictionaries
-                chapter_data = group.to_dict('records')
+                # Convert group thành list of dictionaries (ô trống bị bỏ, không ghi NaN ra JSON)
+                chapter_data = [r.to_dict() for r in records_from_frame(group)]
                 
                 # Sử dụng chapter_folder làm key
                 result[chapter] = chapter_data
                 
-                logger.info(f"  ✓ Nhóm '{chapter}': {len(chapter_data)} bài học")
+                logger.info("  ✓ Nhóm '%s': %s bài học", chapter, len(chapter_data))
             
             return result
             
         except Exception as e:
-            logger.error(f"Lỗi khi xử lý sheet '{sheet_name}': {str(e)}")
+            logger.error("Lỗi khi xử lý sheet '%s': %s", sheet_name, e)
             return {}
     
+    @traced("excel.save_json")
     def save_to_json(self, data, sheet_name):
         """
         Lưu dữ liệu thành file JSON
@@ -125,13 +133,14 @@ class ExcelToJsonPipeline:
             with open(output_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=4)
             
-            logger.info(f"✅ Đã lưu: {output_file}")
+            logger.info("✅ Đã lưu: %s", output_file)
             return output_file
             
         except Exception as e:
-            logger.error(f"Lỗi khi lưu JSON cho sheet '{sheet_name}': {str(e)}")
+            logger.error("Lỗi khi lưu JSON cho sheet '%s': %s", sheet_name, e)
             return None
     
+    @traced("excel.process_all")
     def process_all(self):
         """
         Xử lý tất cả các sheet trong Excel và tạo file JSON tương ứng
@@ -148,12 +157,12 @@ class ExcelToJsonPipeline:
         results = {}
         total_sheets = len(self.sheet_names)
         
-        logger.info(f"\n{'='*50}")
-        logger.info(f"Bắt đầu xử lý {total_sheets} sheets")
-        logger.info(f"{'='*50}\n")
+        logger.info("\n%s", '=' * 50)
+        logger.info("Bắt đầu xử lý %s sheets", total_sheets)
+        logger.info("%s\n", '=' * 50)
         
         for idx, sheet_name in enumerate(self.sheet_names, 1):
-            logger.info(f"[{idx}/{total_sheets}] Đang xử lý sheet: {sheet_name}")
+            logger.info("[%s/%s] Đang xử lý sheet: %s", idx, total_sheets, sheet_name)
             
             # Xử lý sheet
             data = self.process_sheet(sheet_name)
@@ -164,13 +173,13 @@ class ExcelToJsonPipeline:
                 if output_file:
                     results[sheet_name] = output_file
             else:
-                logger.warning(f"⚠️  Sheet '{sheet_name}' không có dữ liệu để xử lý")
+                logger.warning("⚠️  Sheet '%s' không có dữ liệu để xử lý", sheet_name)
             
             logger.info("")  # Dòng trống để dễ đọc
         
-        logger.info(f"\n{'='*50}")
-        logger.info(f"Hoàn thành! Đã tạo {len(results)}/{total_sheets} file JSON")
-        logger.info(f"{'='*50}\n")
+        logger.info("\n%s", '=' * 50)
+        logger.info("Hoàn thành! Đã tạo %s/%s file JSON", len(results), total_sheets)
+        logger.info("%s\n", '=' * 50)
         
         return results
     
@@ -217,19 +226,60 @@ class ExcelToJsonPipeline:
         return [self.get_sheet_info(sheet) for sheet in self.sheet_names]
 
 
+def iter_lessons(json_dir, verify=False):
+    """
+    Đọc các bài học từ thư mục JSON do pipeline tạo ra
+    
+    Args:
+        json_dir (str): Thư mục chứa các file JSON
+        verify (bool): Tính lại content_hash để phát hiện JSON bị sửa tay (xem LessonRecord)
+        
+    Yields:
+        tuple: (tên file JSON, LessonRecord)
+    """
+    if not os.path.exists(json_dir):
+        return
+    
+    for f in sorted(os.listdir(json_dir)):
+        if not f.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(json_dir, f), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            logger.warning("⚠️ Bỏ qua %s: %s", f, e)
+            continue
+        
+        # Xử lý format Dict hoặc List
+        lessons = []
+        if isinstance(data, dict):
+            for ch_lessons in data.values():
+                if isinstance(ch_lessons, list):
+                    lessons.extend(ch_lessons)
+        elif isinstance(data, list):
+            lessons = data
+        
+        for lesson in lessons:
+            if isinstance(lesson, dict):
+                yield f, LessonRecord.from_dict(lesson, verify=verify)
+
+
 def main():
     """
     Hàm main để test pipeline từ command line
     """
     import argparse
+    from process import tracing
     
     parser = argparse.ArgumentParser(description="Xử lý file Excel thành các file JSON")
     parser.add_argument('excel_file', type=str, help='Đường dẫn đến file Excel')
     parser.add_argument('--output_dir', type=str, default='json_output', 
                        help='Thư mục lưu file JSON (mặc định: json_output)')
     parser.add_argument('--sheet', type=str, help='Chỉ xử lý một sheet cụ thể')
+    parser.add_argument('--trace', type=str, help='Ghi Chrome trace JSON + bảng thời gian theo giai đoạn')
     
     args = parser.parse_args()
+    tracing.configure(args.trace)
     
     # Khởi tạo pipeline
     pipeline = ExcelToJsonPipeline(args.excel_file, args.output_dir)
@@ -246,8 +296,8 @@ def main():
             data = pipeline.process_sheet(args.sheet)
             pipeline.save_to_json(data, args.sheet)
         else:
-            logger.error(f"Không tìm thấy sheet '{args.sheet}'")
-            logger.info(f"Các sheet có sẵn: {pipeline.sheet_names}")
+            logger.error("Không tìm thấy sheet '%s'", args.sheet)
+            logger.info("Các sheet có sẵn: %s", pipeline.sheet_names)
     else:
         # Xử lý tất cả
         results = pipeline.process_all()
@@ -261,4 +311,6 @@ def main():
 
 
 if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
     main()
\ No newline at end of file
@@ -0,0 +1,283 @@
+# process/planner.py
+
+import os
+import sys
+import csv
+import json
+import math
+import argparse
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from process.budget import OutputBudgetPredictor, estimate_tokens, extract_steps
+from process.dedup import DESCRIPTION_FIELD, LessonDeduplicator
+from process.scheduler import CostModel, LessonScheduler, simulate
+from process.store import lesson_key
+
+logger = logging.getLogger(__name__)
+
+# Phần riêng của bài (bước + kiến thức) ít hơn ngần này token → prompt gần như chỉ có khung chung
+MIN_LESSON_TOKENS = 40
+
+FLAGS = {
+    'no_description': "không có mô tả thí nghiệm",
+    'no_steps': "mô tả không có '- Bước n:'",
+    'thin_prompt': "prompt gần như chỉ có khung chung",
+    'no_title': "thiếu tên bài",
+    'steps_truncated': "bị cắt bớt bước cho vừa ngân sách",
+}
+# Các cờ mà lần gọi AI gần như chắc chắn cho trang chung chung / lạc đề
+DEGENERATE = ('no_description', 'thin_prompt', 'no_title')
+
+CSV_FIELDS = ['key', 'chapter', 'lesson', 'cluster_size', 'model', 'requests', 'input_tokens',
+              'lesson_tokens', 'output_tokens', 'max_output_tokens', 'latency', 'cost', 'flags']
+
+
+def quota_from_spec(spec: Optional[str]) -> Optional[int]:
+    """Tổng RPM của VERTEX_ENDPOINTS ("us-central1:60,europe-west4:60"); None nếu có endpoint không ghi RPM"""
+    if not spec:
+        return None
+    rpms = [item.partition(':')[2] for item in filter(None, (x.strip() for x in spec.split(',')))]
+    return sum(int(r) for r in rpms) if rpms and all(rpms) else None
+
+
+class BatchPlanner:
+    """
+    Lập kế hoạch cho một lượt sinh (dry-run): dựng đúng các prompt sẽ gửi nhưng không gọi AI.
+    - Token đầu vào: đếm cục bộ trên prompt đã dựng (estimate_tokens)
+    - Token đầu ra, độ trễ: CostModel (lịch sử các bài tương tự), max_output_tokens: OutputBudgetPredictor
+    - Chi phí: giá của tầng model mà router định tuyến tới
+    - Cờ cảnh báo cho bài sẽ tạo prompt suy biến (không mô tả, không bước, chỉ có tiêu đề...)
+    - Số request đồng thời gợi ý cho quota (Little's law: đồng thời = tốc độ cho phép × độ trễ)
+    """
+
+    def __init__(self, generator, cost_model: Optional[CostModel] = None,
+                 rpm: Optional[int] = 60, tpm: Optional[int] = None):
+        """
+        Args:
+            generator: ExperimentGenerator (chỉ dùng để dựng prompt, có thể output_dir=None)
+            cost_model: Mô hình token/độ trễ (mặc định dùng predictor của generator)
+            rpm: Quota request / phút cho mỗi model
+            tpm: Quota token đầu vào / phút cho mỗi model (None = không giới hạn)
+        """
+        self.generator = generator
+        self.cost_model = cost_model or CostModel(generator.predictor)
+        self.rpm = rpm
+        self.tpm = tpm
+
+    def _prompts(self, exp_data: Dict) -> List[str]:
+        """Các prompt một bài sẽ gửi: 1 prompt, hoặc hợp đồng + 3 phần với chiến lược sectioned"""
+        sectioned = self.generator.sectioned
+        if not sectioned:
+            return [self.generator.build_prompt(exp_data)]
+        # Hợp đồng thật chỉ có sau lần gọi đầu → ước lượng phần còn lại với hợp đồng rỗng
+        return [sectioned.contract_prompt(exp_data)] + \
+               [sectioned.section_prompt(s, exp_data, {}) for s in ('html', 'css', 'js')]
+
+    def _tier(self, exp_data: Dict):
+        router = self.generator.router
+        if router:
+            return router.tiers[router.route(exp_data)]
+        from api.router import DEFAULT_TIERS
+        model = getattr(self.generator.client, 'model_name', None)
+        return next((t for t in DEFAULT_TIERS if t.model == model), DEFAULT_TIERS[-1])
+
+    def flags(self, exp_data: Dict, lesson_tokens: int) -> List[str]:
+        description = exp_data.get(DESCRIPTION_FIELD)
+        steps = extract_steps(exp_data)
+        flags = []
+        if not isinstance(description, str) or not description.strip():
+            flags.append('no_description')
+        elif not steps:
+            flags.append('no_steps')
+        if lesson_tokens < MIN_LESSON_TOKENS:
+            flags.append('thin_prompt')
+        if not str(exp_data.get('Bài học') or '').strip():
+            flags.append('no_title')
+        if len(self.generator.budgeter.fit([('steps', steps)])['steps']) < len(steps):
+            flags.append('steps_truncated')
+        return flags
+
+    def plan_lesson(self, exp_data: Dict, cluster_size: int = 1) -> Dict:
+        """Ước lượng cho 1 lần sinh (bài đại diện của một cụm trùng lặp)"""
+        prompts = self._prompts(exp_data)
+        content = exp_data.get('Nội dung trong bài học')
+        lesson_tokens = estimate_tokens("\n".join(extract_steps(exp_data))) + \
+            estimate_tokens(content.strip() if isinstance(content, str) else '')
+        tier = self._tier(exp_data)
+        input_tokens = sum(estimate_tokens(p) for p in prompts)
+        output_tokens, latency = self.cost_model.estimate(exp_data)
+        output_tokens = int(output_tokens)
+        return {
+            'key': lesson_key(exp_data),
+            'chapter': str(exp_data.get('Chương', '')),
+            'lesson': str(exp_data.get('Bài học', '')),
+            'cluster_size': cluster_size,
+            'model': tier.model,
+            'requests': len(prompts),
+            'input_tokens': input_tokens,
+            'lesson_tokens': lesson_tokens,
+            'output_tokens': output_tokens,
+            'max_output_tokens': self.generator.predictor.predict(exp_data),
+            'latency': round(latency, 2),
+            'cost': round((input_tokens * tier.input_price + output_tokens * tier.output_price) / 1e6, 6),
+            'flags': self.flags(exp_data, lesson_tokens),
+        }
+
+    def _concurrency(self, rows: List[Dict]) -> Dict[str, Dict]:
+        """Theo từng model: tốc độ tối đa quota cho phép và số request đồng thời cần để đạt tốc độ đó"""
+        by_model = defaultdict(list)
+        for r in rows:
+            by_model[r['model']].append(r)
+        result = {}
+        for model, group in by_model.items():
+            requests = sum(r['requests'] for r in group)
+            latency = sum(r['latency'] for r in group) / len(group)
+            tokens_per_request = sum(r['input_tokens'] for r in group) / requests
+            limits = [self.rpm / 60 if self.rpm else math.inf,
+                      self.tpm / 60 / tokens_per_request if self.tpm else math.inf]
+            rate = min(limits)  # request / giây
+            # Mỗi bài giữ 1 slot trong suốt `latency` giây (các prompt sectioned chạy gần như song song)
+            lesson_rate = rate / (requests / len(group))
+            concurrency = len(group) if math.isinf(rate) else max(1, min(len(group), math.ceil(lesson_rate * latency)))
+            result[model] = {
+                'calls': len(group), 'requests': requests, 'mean_latency': round(latency, 2),
+                'max_rate_per_min': None if math.isinf(rate) else round(rate * 60, 1),
+                'bound': 'rpm' if limits[0] <= limits[1] else 'tpm',
+                'concurrency': concurrency,
+                'quota_time': 0.0 if math.isinf(rate) else requests / rate,
+                'cost': sum(r['cost'] for r in group),
+            }
+        return result
+
+    def plan(self, lessons: List[Dict], dedup: bool = True, policy: str = 'sjf') -> Dict:
+        """
+        Args:
+            lessons: Danh sách bài học
+            dedup: Gộp bài trùng lặp như generate_batch (mỗi cụm 1 lần gọi)
+            policy: Thứ tự sinh để mô phỏng thời gian chạy
+
+        Returns:
+            dict: {"rows": mỗi lần gọi 1 dòng, "models": theo model, "totals": tổng}
+        """
+        clusters = LessonDeduplicator().cluster(lessons) if dedup else [[i] for i in range(len(lessons))]
+        reps = [lessons[c[0]] for c in clusters]
+        rows = [self.plan_lesson(rep, len(c)) for rep, c in zip(reps, clusters)]
+        models = self._concurrency(rows)
+
+        concurrency = sum(m['concurrency'] for m in models.values())
+        durations = [r['latency'] for r in rows]
+        order = LessonScheduler(self.cost_model, policy).order(reps, costs=durations)
+        sim = simulate(reps, order, durations, workers=concurrency)
+        degenerate = [r for r in rows if set(r['flags']) & set(DEGENERATE)]
+        totals = {
+            'lessons': len(lessons),
+            'calls': len(rows),
+            'requests': sum(r['requests'] for r in rows),
+            'input_tokens': sum(r['input_tokens'] for r in rows),
+            'output_tokens': sum(r['output_tokens'] for r in rows),
+            'cost': sum(r['cost'] for r in rows),
+            'serial_time': sum(durations),
+            'concurrency': concurrency,
+            # Không nhanh hơn được giới hạn quota của model chậm nhất
+            'wall_time': max([sim['makespan']] + [m['quota_time'] for m in models.values()]),
+            'flagged': sum(1 for r in rows if r['flags']),
+            'degenerate': len(degenerate),
+            'degenerate_cost': sum(r['cost'] for r in degenerate),
+            'history': len(self.cost_model.predictor.history),
+        }
+        return {'rows': rows, 'models': models, 'totals': totals}
+
+
+def _duration(seconds: float) -> str:
+    minutes, s = divmod(int(seconds), 60)
+    h, m = divmod(minutes, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+
+def format_plan(plan: Dict, top: int = 10) -> str:
+    t = plan['totals']
+    lines = [
+        f"📋 {t['lessons']} bài → {t['calls']} lần sinh ({t['requests']} request AI), "
+        f"lịch sử {t['history']} lần chạy" + (" (chưa có lịch sử: ước lượng thô theo số bước)" if not t['history'] else ""),
+        f"{'Model':<22}{'Calls':>7}{'Avg s':>8}{'Quota/min':>11}{'Đồng thời':>11}{'Cost $':>10}",
+    ]
+    for model, m in plan['models'].items():
+        quota = f"{m['max_rate_per_min']:.0f} ({m['bound']})" if m['max_rate_per_min'] else "-"
+        lines.append(f"{model:<22}{m['calls']:>7}{m['mean_latency']:>8.1f}{quota:>11}{m['concurrency']:>11}{m['cost']:>10.2f}")
+    lines += [
+        f"Token: {t['input_tokens']:,} vào, ~{t['output_tokens']:,} ra · Chi phí ước tính ${t['cost']:.2f}",
+        f"Thời gian: {_duration(t['wall_time'])} với {t['concurrency']} request đồng thời "
+        f"(tuần tự {_duration(t['serial_time'])})",
+    ]
+    if t['degenerate']:
+        lines.append(f"⚠️ {t['degenerate']} lần sinh có prompt suy biến, tốn ~${t['degenerate_cost']:.2f}:")
+        flagged = [r for r in plan['rows'] if set(r['flags']) & set(DEGENERATE)]
+        for r in flagged[:top]:
+            lines.append(f"   - {r['chapter']} / {r['lesson'] or r['key'][:8]}: "
+                         + ", ".join(FLAGS[f] for f in r['flags']))
+        if len(flagged) > top:
+            lines.append(f"   ... và {len(flagged) - top} bài khác (xem --csv)")
+    return "\n".join(lines)
+
+
+def write_csv(rows: List[Dict], path: str):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for r in rows:
+            writer.writerow([' '.join(r[k]) if k == 'flags' else r[k] for k in CSV_FIELDS])
+
+
+def main() -> int:
+    from api.router import DEFAULT_TIERS, ModelRouter, ModelTier
+    from process.generate import ExperimentGenerator
+    from process.pipeline import iter_lessons
+
+    parser = argparse.ArgumentParser(description="Dry-run: ước lượng token, thời gian, chi phí của một lượt sinh (không gọi AI)")
+    parser.add_argument('--json_dir', type=str, default='json_output', help='Thư mục JSON bài học')
+    parser.add_argument('--history', type=str, default='.cache/output_tokens.json', help='Lịch sử usage')
+    parser.add_argument('--strategy', choices=['single', 'sectioned'], default='single')
+    parser.add_argument('--model', type=str, help='Dùng 1 model cho mọi bài (mặc định định tuyến theo độ phức tạp)')
+    parser.add_argument('--no_dedup', action='store_true', help='Không gộp bài trùng lặp')
+    parser.add_argument('--policy', type=str, default='sjf', help='Thứ tự sinh khi mô phỏng: fifo / sjf / chapter')
+    parser.add_argument('--rpm', type=int, default=None,
+                        help='Quota request/phút mỗi model (mặc định tổng RPM trong VERTEX_ENDPOINTS, hoặc 60)')
+    parser.add_argument('--tpm', type=int, default=None, help='Quota token đầu vào/phút mỗi model')
+    parser.add_argument('--csv', type=str, help='Ghi ước lượng từng lần sinh ra CSV')
+    parser.add_argument('--json', type=str, help='Ghi toàn bộ kế hoạch ra JSON')
+    parser.add_argument('--fail_on_degenerate', action='store_true', help='Thoát mã 1 nếu có prompt suy biến')
+    args = parser.parse_args()
+
+    tiers = None
+    if args.model:
+        base = next((t for t in DEFAULT_TIERS if t.model == args.model), DEFAULT_TIERS[-1])
+        tiers = [ModelTier(args.model, float('inf'), base.input_price, base.output_price)]
+    # Router không có credentials: chỉ dùng để định tuyến + bảng giá, không tạo client
+    generator = ExperimentGenerator(None, None, router=ModelRouter(tiers=tiers), strategy=args.strategy,
+                                    predictor=OutputBudgetPredictor(history_path=args.history))
+    rpm = args.rpm or quota_from_spec(os.getenv("VERTEX_ENDPOINTS")) or 60
+    planner = BatchPlanner(generator, rpm=rpm, tpm=args.tpm)
+
+    lessons = [l for _, l in iter_lessons(args.json_dir)]
+    if not lessons:
+        logger.error("❌ Không có bài học trong %s", args.json_dir)
+        return 1
+    plan = planner.plan(lessons, dedup=not args.no_dedup, policy=args.policy)
+    print(format_plan(plan))
+
+    if args.csv:
+        write_csv(plan['rows'], args.csv)
+        logger.info("📄 Đã ghi %s", args.csv)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, indent=1)
+        logger.info("📄 Đã ghi %s", args.json)
+    return 1 if args.fail_on_degenerate and plan['totals']['degenerate'] else 0
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    sys.exit(main())
@@ -1,18 +1,25 @@
 # process.py
 
 import os
+import glob
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from api.callAPI import VertexClient, get_vertex_ai_credentials
-from dotenv import load_dotenv
+from process.patch import apply_patches, page_sections, parse_patch_response, validate_sections
+from process.logs import bind_context, log_context, new_run_id, setup_logging
 import logging
 import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+REFINE_REQUIREMENTS = """**YÊU CẦU CẢI THIỆN:**
+1.  **Sửa lỗi:** Xác định và sửa bất kỳ lỗi HTML, CSS hoặc JavaScript nào (ví dụ: thiếu thẻ đóng, lỗi cú pháp JS, lỗi layout responsive).
+2.  **Tăng tính trực quan:** Cải thiện giao diện người dùng (UI) để hấp dẫn và dễ sử dụng hơn. Điều chỉnh màu sắc, bố cục, hoạt ảnh nếu cần.
+3.  **Bổ sung thông tin:** Dựa trên nội dung bài học và chương từ file JSON gốc (thông tin này có thể được bạn thêm vào prompt nếu cần, hoặc giả định là bạn biết nội dung từ tên file hoặc biến môi trường), thêm các phần giải thích, tóm tắt, hoặc kiến thức liên quan vào HTML (ví dụ: phương trình hóa học, định nghĩa, công thức tính toán).
+4.  **Tăng tính tương tác (nếu có thể):** Thêm các yếu tố tương tác nhỏ như tooltip, thông báo, hoặc hiệu ứng khi người dùng thao tác nếu phù hợp với nội dung mô tả thí nghiệm.
+5.  **Tối ưu hóa:** Đảm bảo code HTML, CSS, JS được viết gọn gàng, hiệu quả và dễ đọc.
+"""
+
 
 def read_file(file_path):
     """Helper to read file content."""
@@ -21,67 +28,21 @@ def read_file(file_path):
 
 def write_file(file_path, content):
     """Helper to write file content."""
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(content)
 
-def main():
-    parser = argparse.ArgumentParser(description="Process and refine generated HTML files using Vertex AI.")
-    parser.add_argument('--input_html', type=str, required=True, help='Path to the initial HTML file to refine.')
-    parser.add_argument('--output_html', type=str, help='Path to save the refined HTML file (default: input_html with _refined suffix).')
-    parser.add_argument('--prompt_file', type=str, default='prompt_refine.txt', help='Path to the refinement prompt file.')
-    parser.add_argument('--max_tokens', type=int, default=8192, help='Max output tokens for the AI call.')
-    
-    args = parser.parse_args()
-
-    if not args.output_html:
-        # Default output name: input file name with _refined before .html
-        base, ext = os.path.splitext(args.input_html)
-        args.output_html = f"{base}_refined{ext}"
-
-    credentials = get_vertex_ai_credentials()
-    if not credentials:
-        logger.error("❌ Cannot create Vertex AI credentials. Check your .env file.")
-        return
-
-    PROJECT_ID = os.getenv("PROJECT_ID")
-    if not PROJECT_ID:
-        logger.error("❌ PROJECT_ID not found in .env")
-        return
-
-    vertex_client = VertexClient(PROJECT_ID, credentials, "gemini-2.5-pro")
-
-    try:
-        initial_html_content = read_file(args.input_html)
-        logger.info(f"✅ Loaded initial HTML: {args.input_html}")
-    except FileNotFoundError:
-        logger.error(f"❌ {args.input_html} not found.")
-        return
-    except Exception as e:
-        logger.error(f"❌ Error reading {args.input_html}: {e}")
-        return
-
-    try:
-        refinement_prompt = read_file(args.prompt_file)
-        logger.info(f"✅ Loaded refinement prompt: {args.prompt_file}")
-    except FileNotFoundError:
-        logger.error(f"❌ {args.prompt_file} not found.")
-        return
-    except Exception as e:
-        logger.error(f"❌ Error reading {args.prompt_file}: {e}")
-        return
 
-    # Construct the full prompt for refinement
-    full_prompt = f"""
+def build_full_prompt(html_content, extra_prompt):
+    """Prompt for the legacy mode: the model returns the complete refined document."""
+    return f"""
 Bạn là một chuyên gia phát triển web giáo dục. Nhiệm vụ của bạn là nhận một file HTML mô phỏng thí nghiệm hóa học và cải thiện nó theo các yêu cầu sau:
 
-**YÊU CẦU CẢI THIỆN:**
-1.  **Sửa lỗi:** Xác định và sửa bất kỳ lỗi HTML, CSS hoặc JavaScript nào (ví dụ: thiếu thẻ đóng, lỗi cú pháp JS, lỗi layout responsive).
-2.  **Tăng tính trực quan:** Cải thiện giao diện người dùng (UI) để hấp dẫn và dễ sử dụng hơn. Điều chỉnh màu sắc, bố cục, hoạt ảnh nếu cần.
-3.  **Bổ sung thông tin:** Dựa trên nội dung bài học và chương từ file JSON gốc (thông tin này có thể được bạn thêm vào prompt nếu cần, hoặc giả định là bạn biết nội dung từ tên file hoặc biến môi trường), thêm các phần giải thích, tóm tắt, hoặc kiến thức liên quan vào HTML (ví dụ: phương trình hóa học, định nghĩa, công thức tính toán).
-4.  **Tăng tính tương tác (nếu có thể):** Thêm các yếu tố tương tác nhỏ như tooltip, thông báo, hoặc hiệu ứng khi người dùng thao tác nếu phù hợp với nội dung mô tả thí nghiệm.
-5.  **Tối ưu hóa:** Đảm bảo code HTML, CSS, JS được viết gọn gàng, hiệu quả và dễ đọc.
+{REFINE_REQUIREMENTS}
+{extra_prompt}
 
 **HTML CẦN CẢI THIỆN:**
+{html_content}
 
 **LƯU Ý:**
 - Trả về MÃ HTML HOÀN CHỈNH (<!DOCTYPE html> ... </html>), KHÔNG CÓ GÌ KHÁC (không lời dẫn, không giải thích, không dấu ```html).
@@ -89,14 +50,51 @@ Bạn là một chuyên gia phát triển web giáo dục. Nhiệm vụ của b
 - Chỉ trả về mã HTML cuối cùng đã được cải thiện.
 """
 
-    logger.info(f"Sending refinement request for {args.input_html}...")
-    refined_html_content = vertex_client.send_data_to_AI(full_prompt, max_output_tokens=args.max_tokens)
 
-    if not refined_html_content:
-        logger.error("❌ Failed to get refined HTML content from AI.")
-        return
+def build_patch_prompt(sections, extra_prompt):
+    """Prompt for patch mode: the model only returns targeted section patches."""
+    return f"""
+Bạn là một chuyên gia phát triển web giáo dục. Dưới đây là các phần HTML, CSS, JS của một trang mô phỏng thí nghiệm hóa học. Hãy cải thiện nó theo các yêu cầu sau:
+
+{REFINE_REQUIREMENTS}
+{extra_prompt}
+
+**HTML:**
+```html
+{sections.get('html', '')}
+```
+
+**CSS:**
+```css
+{sections.get('css', '')}
+```
 
-    # Post-process: Remove any potential markdown code block wrappers if AI adds them despite the prompt
+**JS:**
+```javascript
+{sections.get('js', '')}
+```
+
+**ĐỊNH DẠNG TRẢ VỀ - CHỈ TRẢ VỀ CÁC THAY ĐỔI (PATCH), KHÔNG TRẢ VỀ TOÀN BỘ TRANG:**
+```json
+{{
+  "patches": [
+    {{"target": "js:function", "name": "draw", "content": "function draw() {{ ... }}"}},
+    {{"target": "html:element", "id": "btnStart", "content": "<button id='btnStart' ...>...</button>"}},
+    {{"target": "css", "op": "append", "content": ".glow {{ ... }}"}},
+    {{"target": "html", "op": "append", "content": "<div id='info'>...</div>"}}
+  ]
+}}
+```
+- "js:function": thay toàn bộ khai báo hàm theo tên (hàm chưa có sẽ được thêm mới)
+- "html:element": thay phần tử theo id
+- "html" / "css" / "js" với op "append" (thêm vào cuối) hoặc "replace" (thay cả phần, chỉ dùng khi thật cần)
+- Giữ nguyên các id mà JS đang dùng. Không dùng localStorage/sessionStorage.
+- Không thay đổi gì thì trả về {{"patches": []}}
+"""
+
+
+def _strip_code_fence(refined_html_content):
+    """Remove any potential markdown code block wrappers if AI adds them despite the prompt."""
     if refined_html_content.startswith("```html\n") and refined_html_content.endswith("\n```"):
         refined_html_content = refined_html_content[8:-4] # Remove ```html\n and \n```
     elif refined_html_content.startswith("```") and refined_html_content.endswith("```"):
@@ -107,17 +105,154 @@ Bạn là một chuyên gia phát triển web giáo dục. Nhiệm vụ của b
         end_idx = refined_html_content.rfind("</html>")
         if start_idx != -1 and end_idx != -1:
             refined_html_content = refined_html_content[start_idx:end_idx+7] # +7 for "</html>"
+    return refined_html_content
+
+
+def refine_page(vertex_client, input_html, output_html, extra_prompt, mode='patch', max_tokens=8192):
+    """
+    Refine one page and write the result.
+
+    Returns:
+        bool: True if a refined page was written.
+    """
+    try:
+        initial_html_content = read_file(input_html)
+        logger.info("✅ Loaded initial HTML: %s", input_html)
+    except FileNotFoundError:
+        logger.error("❌ %s not found.", input_html)
+        return False
+    except Exception as e:
+        logger.error("❌ Error reading %s: %s", input_html, e)
+        return False
+
+    started = time.perf_counter()
+    sections = page_sections(initial_html_content)
+    if mode == 'patch' and sections:
+        logger.info("Sending patch request for %s...", input_html)
+        response = vertex_client.send_data_to_AI(build_patch_prompt(sections, extra_prompt),
+                                                 max_output_tokens=max_tokens, temperature=0.2)
+        if not response:
+            logger.error("❌ Failed to get patches from AI for %s.", input_html)
+            return False
+        try:
+            patches = parse_patch_response(response)
+        except Exception as e:
+            logger.error("❌ Invalid patch response for %s: %s", input_html, e)
+            return False
+
+        refined_html_content, applied, errors = apply_patches(initial_html_content, patches)
+        for err in errors:
+            logger.warning("⚠️ %s: patch skipped - %s", input_html, err)
+
+        # Re-validate locally; never write a page the patches broke
+        ok, msg = validate_sections(refined_html_content)
+        if not ok:
+            logger.error("❌ Patched page failed validation (%s): %s", msg, input_html)
+            return False
+        logger.info("🩹 Applied %s/%s patches to %s (%s chars returned vs %s page chars)",
+                    applied, len(patches), input_html, len(response), len(initial_html_content))
+    else:
+        logger.info("Sending refinement request for %s...", input_html)
+        refined_html_content = vertex_client.send_data_to_AI(build_full_prompt(initial_html_content, extra_prompt),
+                                                             max_output_tokens=max_tokens)
+        if not refined_html_content:
+            logger.error("❌ Failed to get refined HTML content from AI.")
+            return False
+        refined_html_content = _strip_code_fence(refined_html_content)
 
     if not refined_html_content:
         logger.error("❌ Refined HTML content is empty after post-processing.")
+        return False
+
+    try:
+        write_file(output_html, refined_html_content)
+        logger.info("✅ Refined HTML saved: %s (%.1fs)", output_html, time.perf_counter() - started)
+        return True
+    except Exception as e:
+        logger.error("❌ Error writing refined HTML to %s: %s", output_html, e)
+        return False
+
+
+def _default_output(input_html):
+    # Default output name: input file name with _refined before .html
+    base, ext = os.path.splitext(input_html)
+    return f"{base}_refined{ext}"
+
+
+def collect_pages(input_dir, output_dir=None):
+    """List (input, output) pairs for every page under input_dir, skipping already-refined ones."""
+    pairs = []
+    for path in sorted(glob.glob(os.path.join(input_dir, '**', '*.html'), recursive=True)):
+        rel = os.path.relpath(path, input_dir)
+        if rel.startswith('.') or path.endswith('_refined.html'):
+            continue
+        pairs.append((path, os.path.join(output_dir, rel) if output_dir else _default_output(path)))
+    return pairs
+
+
+def main():
+    # Load environment variables (lazily, so importing this module stays cheap)
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Process and refine generated HTML files using Vertex AI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input_html', type=str, help='Path to the initial HTML file to refine.')
+    source.add_argument('--input_dir', type=str, help='Refine every .html page under this directory.')
+    parser.add_argument('--output_html', type=str, help='Path to save the refined HTML file (default: input_html with _refined suffix).')
+    parser.add_argument('--output_dir', type=str, help='Mirror refined pages into this directory (default: _refined suffix next to each page).')
+    parser.add_argument('--prompt_file', type=str, default='prompt_refine.txt', help='Path to the refinement prompt file.')
+    parser.add_argument('--max_tokens', type=int, default=8192, help='Max output tokens for the AI call.')
+    parser.add_argument('--model', type=str, default=os.getenv("GEMINI_MODEL", "gemini-2.5-pro"), help='Gemini model used for refinement.')
+    parser.add_argument('--mode', choices=['patch', 'full'], default='patch', help='patch: model returns section patches; full: model returns the whole page.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of pages refined concurrently in --input_dir mode.')
+
+    args = parser.parse_args()
+
+    if args.input_html:
+        pages = [(args.input_html, args.output_html or _default_output(args.input_html))]
+    else:
+        pages = collect_pages(args.input_dir, args.output_dir)
+        if not pages:
+            logger.error("❌ No .html pages found in %s", args.input_dir)
+            return
+
+    credentials = get_vertex_ai_credentials()
+    if not credentials:
+        logger.error("❌ Cannot create Vertex AI credentials. Check your .env file.")
         return
 
+    PROJECT_ID = os.getenv("PROJECT_ID")
+    if not PROJECT_ID:
+        logger.error("❌ PROJECT_ID not found in .env")
+        return
+
+    # One client shared by all workers
+    vertex_client = VertexClient(PROJECT_ID, credentials, args.model)
+
     try:
-        write_file(args.output_html, refined_html_content)
-        logger.info(f"✅ Refined HTML saved: {args.output_html}")
+        refinement_prompt = read_file(args.prompt_file)
+        logger.info("✅ Loaded refinement prompt: %s", args.prompt_file)
+    except FileNotFoundError:
+        logger.error("❌ %s not found.", args.prompt_file)
+        return
     except Exception as e:
-        logger.error(f"❌ Error writing refined HTML to {args.output_html}: {e}")
+        logger.error("❌ Error reading %s: %s", args.prompt_file, e)
+        return
+
+    started = time.perf_counter()
+    ok = 0
+    with log_context(run=new_run_id()), ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+        futures = [ex.submit(bind_context(refine_page, lesson=os.path.basename(src)),
+                             vertex_client, src, dst, refinement_prompt, args.mode, args.max_tokens)
+                   for src, dst in pages]
+        for future in as_completed(futures):
+            ok += 1 if future.result() else 0
+
+    if len(pages) > 1:
+        logger.info("📊 Refined %s/%s pages in %.1fs", ok, len(pages), time.perf_counter() - started)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    setup_logging()
+    main()
@@ -0,0 +1,258 @@
+# process/records.py
+
+import re
+import sys
+import json
+import math
+import hashlib
+import unicodedata
+from array import array
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+from process.budget import STEP_PATTERN
+
+# Cột Excel/JSON → thuộc tính của LessonRecord. Chỉ các cột này được đọc từ Excel
+# (usecols) và giữ trong bộ nhớ; các cột khác của workbook bị bỏ ngay lúc đọc.
+LESSON_FIELDS = {
+    'source_folder': 'source_folder',
+    'chapter_folder': 'chapter_folder',
+    'Chương': 'chapter',
+    'Bài học': 'title',
+    'Nội dung trong bài học': 'content',
+    'Mô tả thí nghiệm thực hiện': 'description',
+    'Ưu tiên': 'priority',
+}
+LESSON_COLUMNS = tuple(LESSON_FIELDS)
+# Cột văn bản: đọc với dtype=str để số chương/mã bài không bị pandas đổi thành float (1 → 1.0)
+TEXT_COLUMNS = tuple(c for c in LESSON_COLUMNS if c != 'Ưu tiên')
+# Giá trị lặp lại giữa rất nhiều bài → intern để các bài dùng chung 1 object chuỗi
+_INTERNED = ('source_folder', 'chapter_folder', 'chapter')
+
+# Trường dẫn xuất, tính 1 lần lúc chuyển Excel → JSON (derive_frame) và ghi kèm vào JSON:
+# steps (các '- Bước n: ...'), title_norm (tên bài NFC, gộp khoảng trắng), content_hash (hash các cột gốc),
+# summary (đoạn đầu nội dung cho {{CONTENT_SUMMARY}}).
+# steps và summary không giữ bản sao trong bộ nhớ: steps là vị trí (đầu, cuối) trong description, summary là lát cắt content
+DERIVED_FIELDS = ('steps', 'title_norm', 'content_hash', 'summary')
+RECORD_FIELDS = {**LESSON_FIELDS, **{f: f for f in DERIVED_FIELDS}}
+SUMMARY_CHARS = 200
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def clean_text(value) -> Optional[str]:
+    """Chuẩn hóa ô văn bản: NaN/None/chuỗi rỗng → None, số nguyên dạng float → '1' thay vì '1.0'"""
+    if _is_missing(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value)
+    return text if text.strip() else None
+
+
+def clean_number(value) -> Optional[float]:
+    if _is_missing(value) or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_title(title: Optional[str]) -> Optional[str]:
+    if title is None:
+        return None
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', title)).strip() or None
+
+
+def derive_fields(title: Optional[str], description: Optional[str]) -> Tuple[tuple, Optional[str]]:
+    """(steps, title_norm) của 1 bài; cùng kết quả với derive_frame"""
+    steps = tuple(s.strip() for s in re.findall(STEP_PATTERN, description, re.DOTALL)) if description else ()
+    return steps, normalize_title(title)
+
+
+def step_spans(description: Optional[str], steps=None) -> Optional[array]:
+    """
+    Vị trí [đầu0, cuối0, đầu1, cuối1, ...] của các bước trong description (None nếu không có bước).
+    Có `steps` tính sẵn thì chỉ dò lại vị trí từng bước; không khớp (hoặc không có) thì tách lại bằng regex.
+    """
+    if not description:
+        return None
+    spans = array('I')
+    if steps is not None:
+        pos = 0
+        for step in steps:
+            start = description.find(step, pos)
+            if start < 0:
+                return step_spans(description)
+            pos = start + len(step)
+            spans.extend((start, pos))
+    else:
+        for m in re.finditer(STEP_PATTERN, description, re.DOTALL):
+            text = m.group()
+            start = m.start() + len(text) - len(text.lstrip())
+            spans.extend((start, m.start() + len(text.rstrip())))
+    return spans or None
+
+
+class LessonRecord(Mapping):
+    """
+    Bài học gọn nhẹ (__slots__, không có __dict__ riêng cho mỗi bài).
+    Vẫn dùng được như dict chỉ-đọc theo tên cột gốc: record.get('Bài học'), record['Chương'],
+    dict(record) → nên các hàm đang nhận `exp_data: Dict` không phải đổi.
+    Ô trống / NaN được lưu là None và coi như cột không có (get trả về default).
+    Trường dẫn xuất (DERIVED_FIELDS) lấy từ JSON, tin content_hash đã lưu; JSON cũ chưa có thì tính lại.
+    verify=True: tính lại hash và so với hash đã lưu, lệch (JSON bị sửa tay) thì tính lại trường dẫn xuất.
+    """
+
+    # steps, summary là property
+    __slots__ = tuple(a for a in RECORD_FIELDS.values() if a not in ('steps', 'summary')) + ('_step_spans',)
+
+    def __init__(self, source_folder=None, chapter_folder=None, chapter=None, title=None,
+                 content=None, description=None, priority=None,
+                 steps=None, title_norm=None, content_hash=None, summary=None, verify: bool = False):
+        for attr, value in (('source_folder', source_folder), ('chapter_folder', chapter_folder),
+                            ('chapter', chapter), ('title', title), ('content', content),
+                            ('description', description)):
+            value = clean_text(value)
+            if value is not None and attr in _INTERNED:
+                value = sys.intern(value)
+            object.__setattr__(self, attr, value)
+        object.__setattr__(self, 'priority', clean_number(priority))
+
+        if content_hash is None or verify:
+            digest = self._digest()
+            if content_hash is not None and content_hash != digest:
+                steps = title_norm = None
+        else:
+            digest = content_hash
+        if steps is None:
+            title_norm = normalize_title(self.title)
+        title_norm = clean_text(title_norm)
+        object.__setattr__(self, '_step_spans', step_spans(self.description, steps))
+        # Tên bài thường đã chuẩn → dùng chung object chuỗi với title
+        object.__setattr__(self, 'title_norm', self.title if title_norm == self.title else title_norm)
+        object.__setattr__(self, 'content_hash', digest)
+
+    @property
+    def steps(self) -> tuple:
+        spans = self._step_spans
+        if spans is None:
+            return ()
+        return tuple(self.description[spans[i]:spans[i + 1]] for i in range(0, len(spans), 2))
+
+    @property
+    def summary(self) -> Optional[str]:
+        return clean_text(self.content[:SUMMARY_CHARS]) if self.content else None
+
+    def _digest(self) -> str:
+        """Hash các cột gốc (không gồm trường dẫn xuất): đổi nội dung bài nào → hash bài đó đổi"""
+        source = {col: getattr(self, attr) for col, attr in LESSON_FIELDS.items() if getattr(self, attr) is not None}
+        blob = json.dumps(source, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def from_dict(cls, data: Mapping, verify: bool = False) -> 'LessonRecord':
+        """Tạo từ dict bài học (JSON cũ có thể có thêm cột khác → bỏ qua)"""
+        if isinstance(data, cls) and not verify:
+            return data
+        return cls(**{attr: data.get(col) for col, attr in RECORD_FIELDS.items()}, verify=verify)
+
+    def to_dict(self) -> Dict:
+        """Dict theo tên cột gốc + trường dẫn xuất, bỏ các ô trống (JSON hợp lệ, không có NaN)"""
+        return {k: list(v) if k == 'steps' else v for k, v in self.items()}
+
+    def __getitem__(self, key):
+        attr = RECORD_FIELDS.get(key)
+        value = getattr(self, attr) if attr else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (col for col, attr in RECORD_FIELDS.items() if getattr(self, attr) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LessonRecord là bất biến")
+
+    def __reduce__(self):
+        # Bất biến nên pickle (ProcessPool) cần dựng lại qua __init__ (hash đã tính → không tính lại)
+        return self.__class__, tuple(getattr(self, attr) for attr in RECORD_FIELDS.values())
+
+    def __repr__(self):
+        return f"LessonRecord({self.chapter!r}, {self.title!r})"
+
+
+# Escape chuỗi JSON như json.dumps(ensure_ascii=False): \\ và " trước, rồi ký tự điều khiển
+_JSON_ESCAPES = (('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t'),
+                 ('\b', '\\b'), ('\f', '\\f'))
+_JSON_CONTROL = re.compile(r'[\x00-\x1f]')
+
+
+def _text_cells(series):
+    """Cột văn bản → Series 'string' với đúng giá trị LessonRecord giữ (clean_text), ô trống = <NA>"""
+    import pandas as pd
+
+    if pd.api.types.is_numeric_dtype(series):
+        series = series.map(clean_text)  # hiếm: cột số (1.0 → '1'), không phải đường đọc Excel chuẩn
+    text = series.astype('string')
+    return text.where(text.str.strip().fillna('').ne(''))
+
+
+def _json_string(text):
+    for old, new in _JSON_ESCAPES:
+        text = text.str.replace(old, new, regex=False)
+    text = text.str.replace(_JSON_CONTROL, lambda m: f"\\u{ord(m.group()):04x}", regex=True)
+    return '"' + text + '"'
+
+
+def _content_hashes(df) -> list:
+    """
+    content_hash cả sheet: dựng JSON các cột gốc (như LessonRecord._digest) bằng thao tác chuỗi
+    vector hóa, chỉ bước sha256 còn chạy theo từng dòng (hashlib, không có bản vector hóa)
+    """
+    import pandas as pd
+
+    blob = pd.Series('', index=df.index, dtype='string')
+    for col in sorted(LESSON_FIELDS):
+        if col not in df.columns:
+            continue
+        if col == 'Ưu tiên':
+            value = pd.to_numeric(df[col], errors='coerce').astype('string')  # repr của float
+        else:
+            value = _json_string(_text_cells(df[col]))
+        pair = (json.dumps(col, ensure_ascii=False) + ': ' + value).fillna('')
+        blob = blob + blob.ne('').where(pair.ne(''), False).map({True: ', ', False: ''}) + pair
+    return [hashlib.sha256(f"{{{b}}}".encode('utf-8')).hexdigest()[:16] for b in blob]
+
+
+def derive_frame(df):
+    """
+    Thêm các cột dẫn xuất cho cả sheet bằng thao tác chuỗi vector hóa của pandas
+    (cột văn bản được đọc với dtype=str như ExcelToJsonPipeline.load_excel)
+    """
+    text = df.reindex(columns=['Bài học', 'Mô tả thí nghiệm thực hiện']).astype('string')
+    title, description = text['Bài học'], text['Mô tả thí nghiệm thực hiện']
+    filled = description.str.strip().fillna('').ne('')  # ô trống / chỉ khoảng trắng = không có
+
+    steps = description.where(filled).str.findall(STEP_PATTERN, flags=re.DOTALL)
+    title_norm = title.str.normalize('NFC').str.replace(r'\s+', ' ', regex=True).str.strip()
+    return df.assign(
+        steps=steps.map(lambda found: tuple(s.strip() for s in found) if isinstance(found, list) else ()),
+        title_norm=title_norm.where(title_norm.fillna('').ne('')),
+        content_hash=_content_hashes(df),
+    )
+
+
+def records_from_frame(df) -> List[LessonRecord]:
+    """DataFrame (đã chiếu cột) → danh sách LessonRecord, NaN → None"""
+    columns = [c for c in df.columns if c in RECORD_FIELDS]
+    attrs = [RECORD_FIELDS[c] for c in columns]
+    frame = df[columns]
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [LessonRecord(**dict(zip(attrs, row))) for row in frame.itertuples(index=False, name=None)]
@@ -0,0 +1,227 @@
+# process/report.py
+
+import os
+import sys
+import csv
+import gzip
+import html
+import json
+import argparse
+import logging
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ngân sách mặc định cho máy tính bảng trong lớp học (byte / số phần tử)
+DEFAULT_BUDGETS = {
+    'raw_bytes': 300_000,
+    'gzip_bytes': 100_000,
+    'dom_nodes': 1500,
+    'inline_js_bytes': 150_000,
+    'inline_css_bytes': 50_000,
+    'external_scripts': 5,
+}
+
+METRICS = ['raw_bytes', 'gzip_bytes', 'dom_nodes', 'inline_js_bytes', 'inline_css_bytes', 'external_scripts']
+
+
+class _PageStats(HTMLParser):
+    """Đếm phần tử DOM, byte JS/CSS inline và script ngoài trong một lượt parse (html.parser chuẩn)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.dom_nodes = 0
+        self.inline_js = 0
+        self.inline_css = 0
+        self.external_scripts = 0
+        self._in = None  # 'script' / 'style' khi đang ở trong thẻ inline
+
+    def handle_starttag(self, tag, attrs):
+        self.dom_nodes += 1
+        attrs = dict(attrs)
+        if attrs.get('style'):
+            self.inline_css += len(attrs['style'].encode('utf-8'))
+        if tag == 'script':
+            if attrs.get('src'):
+                self.external_scripts += 1
+            else:
+                self._in = 'script'
+        elif tag == 'style':
+            self._in = 'style'
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self._in = None
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._in = None
+
+    def handle_data(self, data):
+        if self._in == 'script':
+            self.inline_js += len(data.encode('utf-8'))
+        elif self._in == 'style':
+            self.inline_css += len(data.encode('utf-8'))
+
+
+def measure_page(path: str) -> Dict:
+    """Đo một trang HTML"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    parser = _PageStats()
+    parser.feed(raw.decode('utf-8', errors='replace'))
+    parser.close()
+    return {
+        'raw_bytes': len(raw),
+        'gzip_bytes': len(gzip.compress(raw, compresslevel=6)),
+        'dom_nodes': parser.dom_nodes,
+        'inline_js_bytes': parser.inline_js,
+        'inline_css_bytes': parser.inline_css,
+        'external_scripts': parser.external_scripts,
+    }
+
+
+def find_pages(root: str) -> List[str]:
+    """Các file .html trong thư mục đầu ra (bỏ qua .objects/, .fragments/...)"""
+    pages = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        pages.extend(os.path.join(dirpath, n) for n in sorted(filenames) if n.endswith('.html'))
+    return pages
+
+
+def build_report(root: str, budgets: Optional[Dict] = None, workers: Optional[int] = None) -> List[Dict]:
+    """
+    Đo toàn bộ trang trong thư mục và đối chiếu với ngân sách
+
+    Returns:
+        list: Mỗi trang một dict: path + các chỉ số + violations (tên chỉ số vượt ngân sách)
+    """
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    pages = find_pages(root)
+
+    # Trang giống hệt nhau được OutputStore hardlink về cùng 1 blob → chỉ đo 1 lần mỗi inode
+    by_inode: Dict[tuple, List[str]] = {}
+    for path in pages:
+        st = os.stat(path)
+        by_inode.setdefault((st.st_dev, st.st_ino), []).append(path)
+    unique = [paths[0] for paths in by_inode.values()]
+
+    if workers == 1 or len(unique) < 64:
+        measured = list(map(measure_page, unique))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            measured = list(ex.map(measure_page, unique, chunksize=32))
+
+    rows = []
+    for paths, metrics in zip(by_inode.values(), measured):
+        violations = [m for m in METRICS if budgets.get(m) is not None and metrics[m] > budgets[m]]
+        for path in paths:
+            rows.append({'path': os.path.relpath(path, root), **metrics, 'violations': violations})
+    rows.sort(key=lambda r: -r['raw_bytes'])
+    logger.info("📏 Đo %s trang (%s nội dung khác nhau), %s trang vượt ngân sách",
+                len(pages), len(unique), sum(1 for r in rows if r['violations']))
+    return rows
+
+
+def write_csv(rows: List[Dict], path: str):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['path'] + METRICS + ['violations'])
+        for r in rows:
+            writer.writerow([r['path']] + [r[m] for m in METRICS] + [' '.join(r['violations'])])
+
+
+_HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="vi"><head><meta charset="utf-8"><title>Báo cáo dung lượng trang</title>
+<style>
+body {{ font-family: sans-serif; margin: 1.5rem; }}
+table {{ border-collapse: collapse; font-size: 13px; }}
+th, td {{ border: 1px solid #ddd; padding: 4px 8px; text-align: right; }}
+th {{ background: #f3f4f6; cursor: pointer; position: sticky; top: 0; }}
+td:first-child, th:first-child {{ text-align: left; }}
+td.over {{ background: #fee2e2; color: #b91c1c; font-weight: bold; }}
+</style></head><body>
+<h2>Báo cáo dung lượng trang</h2>
+<p>{summary}</p>
+<table id="report"><thead><tr>{header}</tr>
+<tr><th>Ngân sách</th>{budget_row}</tr></thead>
+<tbody>{body}</tbody></table>
+<script>
+document.querySelectorAll('#report thead tr:first-child th').forEach((th, col) => {{
+  let asc = false;
+  th.onclick = () => {{
+    const tbody = document.querySelector('#report tbody');
+    const rows = Array.from(tbody.rows);
+    asc = !asc;
+    rows.sort((a, b) => {{
+      const x = a.cells[col].dataset.v ?? a.cells[col].textContent;
+      const y = b.cells[col].dataset.v ?? b.cells[col].textContent;
+      const d = isNaN(x) || isNaN(y) ? x.localeCompare(y) : x - y;
+      return asc ? d : -d;
+    }});
+    rows.forEach(r => tbody.appendChild(r));
+  }};
+}});
+</script></body></html>
+"""
+
+
+def write_html(rows: List[Dict], path: str, budgets: Dict):
+    budgets = {**DEFAULT_BUDGETS, **budgets}
+    header = "".join(f"<th>{h}</th>" for h in ['path'] + METRICS)
+    budget_row = "".join(f"<th>{budgets.get(m, '-')}</th>" for m in METRICS)
+    body = []
+    for r in rows:
+        cells = [f"<td>{html.escape(r['path'])}</td>"]
+        for m in METRICS:
+            cls = ' class="over"' if m in r['violations'] else ''
+            cells.append(f'<td{cls} data-v="{r[m]}">{r[m]:,}</td>')
+        body.append(f"<tr>{''.join(cells)}</tr>")
+    over = sum(1 for r in rows if r['violations'])
+    summary = f"{len(rows)} trang, {over} trang vượt ngân sách (click tiêu đề cột để sắp xếp)"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_HTML_TEMPLATE.format(summary=summary, header=header, budget_row=budget_row, body="\n".join(body)))
+
+
+def _parse_budgets(args) -> Dict:
+    budgets = {}
+    if args.budgets:
+        with open(args.budgets, encoding='utf-8') as f:
+            budgets.update(json.load(f))
+    for item in args.budget or []:
+        name, _, value = item.partition('=')
+        if name not in METRICS:
+            raise SystemExit(f"❌ Chỉ số không hợp lệ: {name} (chọn: {', '.join(METRICS)})")
+        budgets[name] = int(float(value))
+    return budgets
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Báo cáo dung lượng / độ nặng của các trang đã sinh")
+    parser.add_argument('--output_dir', type=str, default='generated_output', help='Thư mục trang HTML')
+    parser.add_argument('--budgets', type=str, help='File JSON {chỉ số: ngưỡng}')
+    parser.add_argument('--budget', action='append', help='Ghi đè một ngưỡng, vd: --budget dom_nodes=1200')
+    parser.add_argument('--csv', type=str, default='page_report.csv')
+    parser.add_argument('--html', type=str, default='page_report.html')
+    parser.add_argument('--workers', type=int, default=None, help='Số process song song')
+    args = parser.parse_args()
+
+    budgets = _parse_budgets(args)
+    rows = build_report(args.output_dir, budgets, workers=args.workers)
+    write_csv(rows, args.csv)
+    write_html(rows, args.html, budgets)
+    logger.info("📄 Đã ghi %s và %s", args.csv, args.html)
+
+    violations = [r for r in rows if r['violations']]
+    for r in violations[:10]:
+        logger.warning("⚠️ %s: vượt %s", r['path'], ', '.join(r['violations']))
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# process/scheduler.py
+
+import heapq
+import argparse
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from process.budget import OutputBudgetPredictor, lesson_features
+from process.store import lesson_key
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('fifo', 'sjf', 'chapter')
+# Cột tùy chọn trong Excel/JSON: số càng lớn càng được sinh trước
+PRIORITY_FIELD = 'Ưu tiên'
+
+
+def chapter_of(exp_data: Dict) -> tuple:
+    return str(exp_data.get('source_folder', '')), str(exp_data.get('Chương', ''))
+
+
+class CostModel:
+    """
+    Dự đoán thời gian sinh (giây) của một bài học:
+    - Có lịch sử: trung bình độ trễ / số token của k bài tương tự (theo OutputBudgetPredictor)
+    - Chưa có lịch sử: ước lượng thô theo số bước và độ dài mô tả
+    """
+
+    def __init__(self, predictor: Optional[OutputBudgetPredictor] = None,
+                 tokens_per_second: Optional[float] = None, overhead: float = 2.0):
+        """
+        Args:
+            predictor: Nguồn lịch sử usage (mặc định đọc .cache/output_tokens.json)
+            tokens_per_second: Tốc độ sinh token (mặc định ước lượng từ lịch sử, 50 nếu chưa có)
+            overhead: Thời gian cố định mỗi lần gọi (giây)
+        """
+        self.predictor = predictor or OutputBudgetPredictor()
+        self.overhead = overhead
+        timed = [h for h in self.predictor.history if h.get('latency') and h.get('output_tokens')]
+        if tokens_per_second:
+            self.tokens_per_second = tokens_per_second
+        elif timed:
+            self.tokens_per_second = sum(h['output_tokens'] for h in timed) / sum(h['latency'] for h in timed)
+        else:
+            self.tokens_per_second = 50.0
+
+    def _tokens(self, exp_data: Dict, neighbors: List[Dict]) -> float:
+        if neighbors:
+            return sum(h['output_tokens'] * (2 if h.get('truncated') else 1) for h in neighbors) / len(neighbors)
+        steps, desc_len = lesson_features(exp_data)
+        return 4000 + 1500 * steps + desc_len
+
+    def estimate(self, exp_data: Dict) -> Tuple[float, float]:
+        """(số token output, thời gian sinh giây) dự kiến; tìm láng giềng trong lịch sử 1 lần"""
+        neighbors = self.predictor.neighbors(exp_data)
+        tokens = self._tokens(exp_data, neighbors)
+        timed = [h['latency'] for h in neighbors if h.get('latency')]
+        if timed:
+            return tokens, sum(timed) / len(timed)
+        return tokens, self.overhead + tokens / self.tokens_per_second
+
+    def tokens(self, exp_data: Dict) -> float:
+        """Số token output dự kiến"""
+        return self._tokens(exp_data, self.predictor.neighbors(exp_data))
+
+    def predict(self, exp_data: Dict) -> float:
+        """Thời gian sinh dự kiến (giây)"""
+        return self.estimate(exp_data)[1]
+
+
+class LessonScheduler:
+    """
+    Sắp thứ tự sinh cho một batch bài học:
+    - fifo: giữ nguyên thứ tự chọn
+    - sjf: bài ngắn trước → có kết quả sớm, giảm thời gian chờ trung bình
+    - chapter: chương rẻ nhất hoàn thành trước; trong chương bài dài trước để chạy song song cân tải
+    Ưu tiên tường minh (cột 'Ưu tiên' hoặc tham số priorities) luôn được xét trước policy.
+    """
+
+    def __init__(self, cost_model: Optional[CostModel] = None, policy: str = 'sjf'):
+        if policy not in POLICIES:
+            raise ValueError(f"policy không hợp lệ: {policy} (chọn {', '.join(POLICIES)})")
+        self.cost_model = cost_model or CostModel()
+        self.policy = policy
+
+    @staticmethod
+    def _priority(exp_data: Dict) -> float:
+        try:
+            return float(exp_data.get(PRIORITY_FIELD) or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def order(self, lessons: List[Dict], priorities: Optional[Dict[int, float]] = None,
+              costs: Optional[List[float]] = None) -> List[int]:
+        """
+        Args:
+            lessons: Danh sách bài học
+            priorities: {chỉ số bài: ưu tiên} ghi đè cột 'Ưu tiên'
+            costs: Chi phí dự đoán sẵn (mặc định tính bằng cost_model)
+
+        Returns:
+            list: Chỉ số bài học theo thứ tự nên sinh
+        """
+        priorities = priorities or {}
+        if self.policy != 'fifo':
+            costs = costs or [self.cost_model.predict(l) for l in lessons]
+        prio = [priorities.get(i, self._priority(l)) for i, l in enumerate(lessons)]
+
+        if self.policy == 'fifo':
+            rank = {i: (i,) for i in range(len(lessons))}
+        elif self.policy == 'sjf':
+            rank = {i: (costs[i], i) for i in range(len(lessons))}
+        else:
+            chapter_cost = defaultdict(float)
+            for i, l in enumerate(lessons):
+                chapter_cost[chapter_of(l)] += costs[i]
+            rank = {i: (chapter_cost[chapter_of(l)], chapter_of(l), -costs[i], i) for i, l in enumerate(lessons)}
+
+        return sorted(range(len(lessons)), key=lambda i: (-prio[i],) + rank[i])
+
+
+def simulate(lessons: List[Dict], order: List[int], durations: List[float], workers: int = 1) -> Dict:
+    """
+    Mô phỏng chạy batch theo thứ tự `order` trên `workers` luồng song song
+
+    Returns:
+        dict: makespan, time-to-first-result, thời gian hoàn thành trung bình theo bài và theo chương
+    """
+    free = [0.0] * max(1, workers)
+    heapq.heapify(free)
+    finish = {}
+    for i in order:
+        start = heapq.heappop(free)
+        finish[i] = start + durations[i]
+        heapq.heappush(free, finish[i])
+
+    chapters = defaultdict(float)
+    for i, t in finish.items():
+        chapters[chapter_of(lessons[i])] = max(chapters[chapter_of(lessons[i])], t)
+    return {
+        'makespan': max(finish.values(), default=0.0),
+        'first_result': min(finish.values(), default=0.0),
+        'mean_completion': sum(finish.values()) / len(finish) if finish else 0.0,
+        'mean_chapter_completion': sum(chapters.values()) / len(chapters) if chapters else 0.0,
+    }
+
+
+def recorded_durations(lessons: List[Dict], cost_model: CostModel) -> tuple[List[float], int]:
+    """Thời gian thực tế từ lịch sử (lần ghi gần nhất theo lesson_key), thiếu thì dùng dự đoán"""
+    latest = {}
+    for h in cost_model.predictor.history:
+        if h.get('key') and h.get('latency'):
+            latest[h['key']] = h['latency']
+    durations, recorded = [], 0
+    for l in lessons:
+        actual = latest.get(lesson_key(l))
+        recorded += actual is not None
+        durations.append(actual if actual is not None else cost_model.predict(l))
+    return durations, recorded
+
+
+def compare_policies(lessons: List[Dict], cost_model: CostModel, workers: int = 1) -> str:
+    """Bảng so sánh các policy: sắp theo chi phí dự đoán, đánh giá bằng thời gian thực tế đã ghi"""
+    durations, recorded = recorded_durations(lessons, cost_model)
+    costs = [cost_model.predict(l) for l in lessons]
+    lines = [f"{len(lessons)} bài, {recorded} có thời gian thực tế, {workers} worker",
+             f"{'Policy':<10}{'Makespan s':>12}{'First s':>10}{'Mean s':>10}{'Chapter s':>12}"]
+    for policy in POLICIES:
+        order = LessonScheduler(cost_model, policy).order(lessons, costs=costs)
+        r = simulate(lessons, order, durations, workers)
+        lines.append(f"{policy:<10}{r['makespan']:>12.1f}{r['first_result']:>10.1f}"
+                     f"{r['mean_completion']:>10.1f}{r['mean_chapter_completion']:>12.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    from process.pipeline import iter_lessons
+
+    parser = argparse.ArgumentParser(description="So sánh các policy sắp lịch trên lịch sử chạy đã ghi")
+    parser.add_argument('--json_dir', type=str, default='json_output', help='Thư mục JSON bài học')
+    parser.add_argument('--history', type=str, default='.cache/output_tokens.json', help='Lịch sử usage')
+    parser.add_argument('--workers', type=int, default=1, help='Số luồng sinh song song giả lập')
+    args = parser.parse_args()
+
+    lessons = [l for _, l in iter_lessons(args.json_dir)]
+    cost_model = CostModel(OutputBudgetPredictor(history_path=args.history))
+    print(compare_policies(lessons, cost_model, args.workers))
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    main()
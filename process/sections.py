@@ -0,0 +1,269 @@
+# process/sections.py
+
+import re
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from process.budget import extract_steps
+from process.fragments import RUNTIME_GUIDE
+from process.tracing import traced
+from process.logs import bind_context
+
+logger = logging.getLogger(__name__)
+
+# Schema của "hợp đồng phần tử" dùng chung cho 3 lần sinh HTML/CSS/JS song song
+CONTRACT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "elements": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "id": {"type": "STRING"},
+                    "tag": {"type": "STRING"},
+                    "purpose": {"type": "STRING"},
+                },
+                "required": ["id", "tag"],
+            },
+        },
+        "classes": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "state": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": {"type": "STRING"},
+                    "type": {"type": "STRING"},
+                    "initial": {"type": "STRING"},
+                },
+                "required": ["name"],
+            },
+        },
+        "functions": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"name": {"type": "STRING"}, "purpose": {"type": "STRING"}},
+                "required": ["name"],
+            },
+        },
+    },
+    "required": ["elements", "state", "functions"],
+}
+
+_SECTION_RULES = {
+    'html': """- CHỈ trả về HTML fragment trong ```html ... ```
+- KHÔNG có <html>, <head>, <body>, <script>, <style>, không inline style, không onclick="..."
+- Dùng Tailwind classes; PHẢI có đủ mọi phần tử trong hợp đồng với đúng id và tag""",
+    'css': """- CHỈ trả về CSS trong ```css ... ```
+- Chỉ @keyframes, transitions và các class tùy chỉnh trong hợp đồng; không lặp lại Tailwind""",
+    'js': """- CHỈ trả về JavaScript trong ```javascript ... ```
+- Chỉ truy cập DOM qua các id trong hợp đồng (Sim.$(id) / Sim.on / Sim.setText / Sim.canvas)
+- Khai báo const state = {...} đúng các biến trạng thái trong hợp đồng
+- Cài đặt đủ các hàm trong hợp đồng, hàm init() ở cuối và tự gọi init();
+- Animation qua Sim.loop.add, KHÔNG DÙNG localStorage/sessionStorage
+""" + RUNTIME_GUIDE,
+}
+
+_LANGS = {'html': 'html', 'css': 'css', 'js': 'javascript'}
+
+
+def html_ids(html: str) -> set:
+    return set(re.findall(r'\bid\s*=\s*["\']([^"\']+)["\']', html))
+
+
+def js_dom_targets(js: str) -> set:
+    """Các id mà JS truy cập: getElementById('x'), querySelector('#x'), Sim.$('x') / on / setText / canvas"""
+    targets = set(re.findall(r'getElementById\(\s*["\'`]([^"\'`]+)["\'`]\s*\)', js))
+    targets |= set(re.findall(r'Sim\.(?:\$|on|setText|canvas)\(\s*["\'`]([^"\'`]+)["\'`]', js))
+    targets |= set(re.findall(r'querySelector(?:All)?\(\s*["\'`]#([\w-]+)["\'`]\s*\)', js))
+    return targets
+
+
+def check_contract(html: str, js: str, contract: Dict) -> List[str]:
+    """
+    Kiểm tra cục bộ 3 phần được sinh song song có khớp hợp đồng không
+
+    Returns:
+        list: Danh sách vi phạm (rỗng nếu khớp)
+    """
+    problems = []
+    ids = html_ids(html)
+
+    missing_dom = js_dom_targets(js) - ids
+    if missing_dom:
+        problems.append(f"JS truy cập id không có trong HTML: {sorted(missing_dom)}")
+
+    missing_elements = {e.get('id') for e in contract.get('elements', []) if e.get('id')} - ids
+    if missing_elements:
+        problems.append(f"HTML thiếu phần tử của hợp đồng: {sorted(missing_elements)}")
+
+    for name in missing_functions(js, contract):
+        problems.append(f"JS thiếu hàm của hợp đồng: {name}")
+    return problems
+
+
+def missing_functions(js: str, contract: Dict) -> List[str]:
+    names = (fn.get('name', '') for fn in contract.get('functions', []))
+    return [n for n in names if n and not re.search(rf'\b(function\s+{re.escape(n)}\b|{re.escape(n)}\s*=)', js)]
+
+
+def blame_sections(html: str, js: str, contract: Dict) -> List[str]:
+    """
+    Phần nào gây vi phạm hợp đồng (chỉ sinh lại phần đó):
+    HTML thiếu phần tử của hợp đồng → html; JS truy cập id ngoài hợp đồng hoặc thiếu hàm → js
+    """
+    ids = html_ids(html)
+    contract_ids = {e.get('id') for e in contract.get('elements', []) if e.get('id')}
+    failed = []
+    if contract_ids - ids:
+        failed.append('html')
+    if js_dom_targets(js) - ids - contract_ids or missing_functions(js, contract):
+        failed.append('js')
+    return failed
+
+
+class SectionedGenerator:
+    """
+    Chiến lược sinh song song:
+    1. Một lần gọi ngắn tạo hợp đồng phần tử (id, class, state, functions)
+    2. Sinh HTML, CSS, JS đồng thời theo hợp đồng
+    3. Kiểm tra hợp đồng cục bộ (mọi id JS truy cập đều có phần tử tương ứng)
+    Kết quả tương thích với template injection hiện tại (html, css, js).
+    """
+
+    def __init__(self, generator, contract_tokens: int = 2048,
+                 section_tokens: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            generator: ExperimentGenerator (dùng lại budgeter, predictor, parse helpers)
+            contract_tokens: max_output_tokens cho lần gọi tạo hợp đồng
+            section_tokens: max_output_tokens cho từng phần (mặc định html 8192, css 4096, js theo predictor)
+        """
+        self.generator = generator
+        self.contract_tokens = contract_tokens
+        self.section_tokens = section_tokens or {'html': 8192, 'css': 4096}
+
+    def _lesson_block(self, exp_data: Dict) -> str:
+        fitted = self.generator.budgeter.fit([('steps', extract_steps(exp_data))])
+        steps = "\n".join(fitted['steps'])
+        return f"""**THÔNG TIN:**
+• Bài: {exp_data.get('title_norm', exp_data.get('Bài học'))}
+• Chương: {exp_data.get('Chương')}
+
+**CÁC BƯỚC THÍ NGHIỆM:**
+{steps}"""
+
+    def contract_prompt(self, exp_data: Dict) -> str:
+        return f"""Bạn là kiến trúc sư của một thí nghiệm HTML tương tác.
+
+{self._lesson_block(exp_data)}
+
+Hãy thiết kế HỢP ĐỒNG PHẦN TỬ (chưa viết code) dạng JSON:
+- elements: các phần tử DOM cần có (id, tag, purpose) - canvas, nút điều khiển, vùng hiển thị số liệu
+- classes: các class CSS tùy chỉnh cần có (ngoài Tailwind)
+- state: các biến trong const state = {{...}} (name, type, initial)
+- functions: các hàm JS (name, purpose), bắt buộc có init
+
+CHỈ TRẢ VỀ JSON."""
+
+    def section_prompt(self, section: str, exp_data: Dict, contract: Dict,
+                       problems: Optional[List[str]] = None) -> str:
+        prompt = self._section_prompt(section, exp_data, contract)
+        if problems:
+            prompt += "\n\n**LẦN TRƯỚC VI PHẠM HỢP ĐỒNG, HÃY SỬA:**\n" + "\n".join(f"- {p}" for p in problems)
+        return prompt
+
+    def _section_prompt(self, section: str, exp_data: Dict, contract: Dict) -> str:
+        return f"""Bạn là chuyên gia tạo thí nghiệm HTML tương tác. Ba phần HTML, CSS, JS đang được viết song song
+bởi 3 người khác nhau theo cùng một HỢP ĐỒNG PHẦN TỬ; bạn chỉ viết phần {section.upper()}.
+
+{self._lesson_block(exp_data)}
+
+**HỢP ĐỒNG PHẦN TỬ:**
+```json
+{json.dumps(contract, ensure_ascii=False, indent=1)}
+```
+
+**YÊU CẦU:**
+{_SECTION_RULES[section]}"""
+
+    def _parse_contract(self, response: Optional[str]) -> Optional[Dict]:
+        if not response:
+            return None
+        try:
+            start, end = response.find('{'), response.rfind('}')
+            contract = json.loads(response[start:end + 1])
+        except ValueError:
+            return None
+        if not isinstance(contract, dict) or not contract.get('elements'):
+            return None
+        return contract
+
+    def _call(self, client, prompt: str, max_tokens: int, schema: Optional[Dict] = None) -> Optional[str]:
+        self.generator.parse_stats.record_call()
+        kwargs = {}
+        if schema and self.generator.structured_output and getattr(client, 'supports_structured_output', False):
+            kwargs = {'response_mime_type': "application/json", 'response_schema': schema}
+        return client.send_data_to_AI(prompt, max_output_tokens=max_tokens, temperature=0.1, **kwargs)
+
+    def _sections(self, client, exp_data: Dict, contract: Dict, budgets: Dict[str, int],
+                  sections, problems: Optional[List[str]] = None) -> Dict[str, Optional[str]]:
+        """Sinh song song các phần `sections` theo cùng hợp đồng"""
+        with ThreadPoolExecutor(max_workers=len(sections)) as ex:
+            futures = {
+                section: ex.submit(bind_context(self._call), client,
+                                   self.section_prompt(section, exp_data, contract, problems), budgets[section])
+                for section in sections
+            }
+            return {section: f.result() for section, f in futures.items()}
+
+    @traced("sections.generate")
+    def generate(self, client, exp_data: Dict) -> Optional[tuple[str, str, str]]:
+        """
+        Sinh (html, css, js) theo 3 bước; None nếu không tạo được hợp đồng hoặc hợp đồng bị vi phạm.
+        Phần lỗi (không có response / vi phạm hợp đồng) được sinh lại 1 lần theo hợp đồng sẵn có
+        trước khi bỏ cuộc → tệ nhất 1 + 3 + 2 lần gọi, không phải làm lại từ đầu.
+        """
+        contract = self._parse_contract(
+            self._call(client, self.contract_prompt(exp_data), self.contract_tokens, CONTRACT_SCHEMA))
+        if not contract:
+            logger.error("❌ Không tạo được hợp đồng phần tử")
+            return None
+        logger.info("📐 Hợp đồng: %s phần tử, %s hàm",
+                    len(contract.get('elements', [])), len(contract.get('functions', [])))
+
+        budgets = dict(self.section_tokens)
+        budgets.setdefault('js', max(8192, int(self.generator.predictor.predict(exp_data) * 0.6)))
+        raw = self._sections(client, exp_data, contract, budgets, ('html', 'css', 'js'))
+        retried = set()
+
+        missing = [s for s in ('html', 'js') if not raw[s]]
+        if missing:
+            logger.warning("🔁 Thiếu phần %s, sinh lại theo hợp đồng", "/".join(missing))
+            raw.update(self._sections(client, exp_data, contract, budgets, missing))
+            retried.update(missing)
+            if not all(raw[s] for s in ('html', 'js')):
+                logger.error("❌ Thiếu phần HTML/JS khi sinh song song")
+                return None
+        code = {s: self.generator._clean_code_block(raw[s] or '', _LANGS[s]) for s in ('html', 'css', 'js')}
+
+        problems = check_contract(code['html'], code['js'], contract)
+        failed = [s for s in blame_sections(code['html'], code['js'], contract) if s not in retried]
+        if problems and failed:
+            logger.warning("🔁 Vi phạm hợp đồng (%s), sinh lại phần %s", "; ".join(problems), "/".join(failed))
+            for s, text in self._sections(client, exp_data, contract, budgets, failed, problems).items():
+                if text:
+                    code[s] = self.generator._clean_code_block(text, _LANGS[s])
+            retried.update(failed)
+            problems = check_contract(code['html'], code['js'], contract)
+        if problems:
+            for p in problems:
+                logger.error("❌ Vi phạm hợp đồng: %s", p)
+            return None
+        if retried:
+            self.generator.parse_stats.record_sectioned('retried')
+        return code['html'], code['css'], code['js']
@@ -0,0 +1,244 @@
+# process/store.py
+
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+OBJECTS_DIR = ".objects"
+CLAIMS_DIR = ".claims"
+
+
+def safe_filename(name, default="Unknown") -> str:
+    """Tạo tên file/thư mục an toàn từ tiêu đề bài học/chương"""
+    name = re.sub(r'[^\w\-]', '_', str(name)).strip('_')
+    return name or default
+
+
+def lesson_key(exp_data: Dict) -> str:
+    """Khóa định danh ổn định của một bài học (nguồn + chương + tên bài)"""
+    ident = "\x1f".join(str(exp_data.get(k, "")) for k in ("source_folder", "Chương", "Bài học"))
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()[:16]
+
+
+def atomic_write(path: str, data, encoding: Optional[str] = "utf-8"):
+    """Ghi file nguyên tử: ghi vào file tạm cùng thư mục rồi os.replace"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        mode = "wb" if encoding is None else "w"
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class OutputStore:
+    """
+    Kho lưu trang HTML đầu ra:
+    - Bố cục <root>/<chương>/<bài>.html, không ghi đè bài trùng tên ở chương khác
+    - Ghi nguyên tử (file tạm + rename), crash giữa chừng không để lại file cụt
+    - Trang có nội dung giống hệt được lưu 1 lần trong .objects/ và hardlink ra
+    - index.json ánh xạ bài học → file đầu ra để công cụ khác không phải quét thư mục
+    - Nhiều worker dùng chung thư mục: mỗi đường dẫn được giành bằng file .claims/<hash> (tạo nguyên tử),
+      bài khác trùng tên không ghi đè được trang đã giành dù index.json chưa kịp flush
+    """
+
+    def __init__(self, root: str, flush_every: int = 20):
+        """
+        Args:
+            root (str): Thư mục gốc chứa trang đầu ra
+            flush_every (int): Ghi lại index.json sau mỗi bấy nhiêu lần write
+        """
+        self.root = root
+        self.flush_every = max(1, flush_every)
+        self.objects_dir = os.path.join(root, OBJECTS_DIR)
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.claims_dir = os.path.join(root, CLAIMS_DIR)
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.claims_dir, exist_ok=True)
+        self.index = self._load_index()
+        self._paths = {e["path"] for e in self.index.values()}
+        self._pending = 0
+        self._dirty = set()  # khóa đã ghi từ lần flush trước
+
+    def _load_index(self) -> Dict:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning("⚠️ Không đọc được %s: %s", self.index_path, e)
+            return {}
+
+    def _acquire_file_lock(self, stale_after: float = 30.0):
+        """Khóa liên tiến trình/liên máy bằng O_EXCL (dùng được trên thư mục chia sẻ)"""
+        lock_path = os.path.join(self.root, LOCK_FILE)
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock_path
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > stale_after:
+                        os.unlink(lock_path)  # tiến trình giữ khóa đã chết
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.05)
+
+    def _save_index(self):
+        """Gộp các mục vừa ghi vào index trên đĩa (store có thể dùng chung giữa nhiều worker)"""
+        lock_path = self._acquire_file_lock()
+        try:
+            merged = self._load_index()
+            merged.update({k: self.index[k] for k in self._dirty})
+            atomic_write(self.index_path, json.dumps(merged, ensure_ascii=False, indent=2))
+        finally:
+            os.unlink(lock_path)
+        self.index = merged
+        self._paths = {e["path"] for e in merged.values()}
+        self._dirty.clear()
+
+    def _claim(self, rel: str, key: str) -> bool:
+        """Giành đường dẫn cho bài học (liên tiến trình/liên máy); True nếu đường dẫn thuộc về `key`"""
+        claim = os.path.join(self.claims_dir, hashlib.sha1(rel.encode("utf-8")).hexdigest())
+        if not os.path.exists(claim):
+            # Ghi khóa vào file tạm rồi hardlink: link thất bại nếu đã có → chỉ 1 worker thắng, không ai đọc file dở
+            fd, tmp = tempfile.mkstemp(dir=self.claims_dir, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(key)
+                os.link(tmp, claim)
+                return True
+            except FileExistsError:
+                pass
+            except OSError:
+                # Không hỗ trợ hardlink → O_EXCL
+                try:
+                    with open(claim, "x", encoding="utf-8") as f:
+                        f.write(key)
+                    return True
+                except FileExistsError:
+                    pass
+            finally:
+                os.unlink(tmp)
+        with open(claim, encoding="utf-8") as f:
+            return f.read().strip() == key
+
+    def _resolve_path(self, key: str, chapter, lesson) -> str:
+        """Chọn đường dẫn tương đối cho bài học, thêm hậu tố nếu trùng tên với bài khác"""
+        entry = self.index.get(key)
+        if entry:
+            return entry["path"]
+
+        rel = os.path.join(safe_filename(chapter, "Chung"), f"{safe_filename(lesson)}.html")
+        if rel in self._paths or not self._claim(rel, key):
+            base, ext = os.path.splitext(rel)
+            rel = f"{base}_{key[:8]}{ext}"
+            self._claim(rel, key)
+        return rel
+
+    def _store_object(self, content: bytes, digest: str) -> str:
+        """Lưu blob theo hash nội dung (chỉ ghi nếu chưa có)"""
+        obj_path = os.path.join(self.objects_dir, f"{digest}.html")
+        if not os.path.exists(obj_path):
+            atomic_write(obj_path, content, encoding=None)
+        return obj_path
+
+    def _link(self, obj_path: str, dest: str, content: bytes):
+        """Hardlink blob ra vị trí đích một cách nguyên tử, fallback sang copy"""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = os.path.join(os.path.dirname(dest), f".tmp-link-{os.getpid()}-{threading.get_ident()}")
+        try:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            os.link(obj_path, tmp)
+            os.replace(tmp, dest)
+        except OSError:
+            # Hệ thống file không hỗ trợ hardlink → ghi bản sao
+            atomic_write(dest, content, encoding=None)
+
+    def write(self, exp_data: Dict, page: str) -> str:
+        """
+        Lưu trang HTML của một bài học
+
+        Args:
+            exp_data (dict): Dữ liệu bài học (dùng Chương/Bài học để đặt tên)
+            page (str): Nội dung HTML hoàn chỉnh
+
+        Returns:
+            str: Đường dẫn file đã ghi
+        """
+        key = lesson_key(exp_data)
+        chapter = exp_data.get("Chương", "")
+        lesson = exp_data.get("Bài học", "Unknown")
+        content = page.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+
+        with self._lock:
+            rel = self._resolve_path(key, chapter, lesson)
+            dest = os.path.join(self.root, rel)
+            entry = self.index.get(key)
+            if not (entry and entry.get("sha256") == digest and os.path.exists(dest)):
+                obj_path = self._store_object(content, digest)
+                self._link(obj_path, dest, content)
+            self.index[key] = {
+                "chapter": str(chapter),
+                "lesson": str(lesson),
+                "path": rel,
+                "sha256": digest,
+            }
+            self._paths.add(rel)
+            self._dirty.add(key)
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._save_index()
+                self._pending = 0
+
+        return dest
+
+    def flush(self):
+        """Ghi index.json xuống đĩa (gọi khi kết thúc một batch)"""
+        with self._lock:
+            if self._pending:
+                self._save_index()
+                self._pending = 0
+
+    def lookup(self, exp_data: Dict) -> Optional[str]:
+        """Trả về đường dẫn file đầu ra đã lưu cho bài học (None nếu chưa có)"""
+        entry = self.index.get(lesson_key(exp_data))
+        return os.path.join(self.root, entry["path"]) if entry else None
+
+    def gc(self) -> int:
+        """Xóa các blob không còn trang nào tham chiếu. Trả về số blob đã xóa"""
+        with self._lock:
+            used = {e["sha256"] for e in self.index.values()}
+            removed = 0
+            for name in os.listdir(self.objects_dir):
+                digest, ext = os.path.splitext(name)
+                if ext == ".html" and digest not in used:
+                    os.unlink(os.path.join(self.objects_dir, name))
+                    removed += 1
+        if removed:
+            logger.info("🧹 Đã xóa %s blob không dùng", removed)
+        return removed
@@ -0,0 +1,206 @@
+# process/tracing.py
+
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+import logging
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bật bằng biến môi trường HTMLGEN_TRACE=<file.json> hoặc configure() / cờ --trace của các CLI.
+# Khi tắt, span() chỉ tốn 1 lần kiểm tra biến toàn cục và trả về đối tượng no-op dùng chung.
+# Chỉ giữ MAX_EVENTS span gần nhất (worker chạy lâu không tăng bộ nhớ vô hạn)
+MAX_EVENTS = 200_000
+_enabled = False
+_events: deque = deque(maxlen=MAX_EVENTS)
+_dropped = 0
+_dump_paths: List[str] = []
+_lock = threading.Lock()
+_local = threading.local()
+_pid = os.getpid()
+
+
+def _after_fork():
+    global _pid
+    _pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Process con (ProcessPool) ghi span với pid của chính nó
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 'start', 'children')
+
+    def __init__(self, name: str, cat: str, args: Dict):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.children = 0  # tổng thời gian các span con (ns), để tính self-time cho flamegraph
+
+    def set(self, **args):
+        """Gắn thêm thông tin vào span (vd: số token, kích thước output)"""
+        self.args.update(args)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dur = time.perf_counter_ns() - self.start
+        stack = _local.stack
+        path = ";".join(s.name for s in stack)
+        stack.pop()
+        if stack:
+            stack[-1].children += dur
+        if exc_type:
+            self.args['error'] = exc_type.__name__
+        event = {"name": self.name, "cat": self.cat, "ph": "X", "ts": self.start / 1000, "dur": dur / 1000,
+                 "pid": _pid, "tid": threading.get_ident(), "args": self.args,
+                 "_stack": path, "_self": (dur - self.children) / 1000}
+        global _dropped
+        with _lock:
+            if len(_events) == _events.maxlen:
+                _dropped += 1
+            _events.append(event)
+        return False
+
+
+def span(name: str, cat: str = "app", **args):
+    """Đo một giai đoạn: `with span("parse"): ...`"""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, cat, args)
+
+
+def traced(name: Optional[str] = None, cat: str = "app"):
+    """Decorator: bọc toàn bộ hàm trong một span"""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*a, **kw):
+            if not _enabled:
+                return func(*a, **kw)
+            with _Span(label, cat, {}):
+                return func(*a, **kw)
+        return wrapper
+    return decorator
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(flag: bool = True):
+    global _enabled
+    _enabled = flag
+
+
+def reset():
+    global _dropped
+    with _lock:
+        _events.clear()
+        _dropped = 0
+
+
+def add_events(extra: List[Dict]):
+    """Gộp span ghi ở process khác (ProcessPool) vào trace của process này"""
+    global _dropped
+    with _lock:
+        _dropped += max(0, len(_events) + len(extra) - _events.maxlen)
+        _events.extend(extra)
+
+
+def events() -> List[Dict]:
+    with _lock:
+        return list(_events)
+
+
+def export_chrome(path: str):
+    """Ghi trace-event JSON (mở bằng chrome://tracing, ui.perfetto.dev hoặc speedscope)"""
+    trace = [{k: v for k, v in e.items() if not k.startswith('_')} for e in events()]
+    trace += [{"name": "thread_name", "ph": "M", "pid": _pid, "tid": tid, "args": {"name": f"thread-{i}"}}
+              for i, tid in enumerate(sorted({e["tid"] for e in trace}))]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    logger.info("🧭 Đã ghi trace: %s", path)
+
+
+def export_folded(path: str):
+    """Ghi stack dạng 'a;b;c <self µs>' cho flamegraph.pl / speedscope"""
+    folded = defaultdict(float)
+    for e in events():
+        folded[e["_stack"]] += e["_self"]
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, us in sorted(folded.items()):
+            f.write(f"{stack} {int(us)}\n")
+
+
+def stage_table() -> str:
+    """Bảng tổng hợp theo giai đoạn: số lần, tổng / trung bình / p95 / max (ms), % self-time"""
+    by_name = defaultdict(list)
+    self_time = defaultdict(float)
+    for e in events():
+        by_name[e["name"]].append(e["dur"] / 1000)
+        self_time[e["name"]] += e["_self"] / 1000
+    total_self = sum(self_time.values()) or 1.0
+
+    lines = [f"{'Stage':<28}{'Count':>7}{'Total ms':>11}{'Mean':>9}{'p95':>9}{'Max':>9}{'Self %':>8}"]
+    for name, durs in sorted(by_name.items(), key=lambda kv: -self_time[kv[0]]):
+        durs.sort()
+        p95 = durs[min(len(durs) - 1, int(len(durs) * 0.95))]
+        lines.append(f"{name:<28}{len(durs):>7}{sum(durs):>11.1f}{sum(durs) / len(durs):>9.1f}{p95:>9.1f}"
+                     f"{durs[-1]:>9.1f}{self_time[name] / total_self * 100:>7.1f}%")
+    return "\n".join(lines)
+
+
+def _dump():
+    if not events():
+        return
+    if _dropped:
+        logger.warning("⚠️ Trace chỉ giữ %s span gần nhất, đã bỏ %s span cũ hơn", MAX_EVENTS, _dropped)
+    for path in _dump_paths:
+        export_chrome(path)
+        export_folded(os.path.splitext(path)[0] + ".folded")
+    logger.info("🧭 Thời gian theo giai đoạn:\n%s", stage_table())
+
+
+def configure(path: Optional[str]):
+    """Bật tracing và tự xuất trace + bảng tổng hợp khi tiến trình kết thúc (gọi lại với cùng path không sao)"""
+    if not path:
+        return
+    enable()
+    with _lock:
+        if path in _dump_paths:
+            return
+        if not _dump_paths:
+            atexit.register(_dump)
+        _dump_paths.append(path)
+
+
+configure(os.getenv("HTMLGEN_TRACE"))
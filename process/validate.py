@@ -1,8 +1,8 @@
 # process/validator.py
 import re
 import logging
-from bs4 import BeautifulSoup
-import esprima  # Cài: pip install esprima
+from process.tracing import traced
+# bs4 / esprima được import lười trong từng hàm (cài: pip install beautifulsoup4 esprima)
 
 logger = logging.getLogger(__name__)
 
@@ -10,9 +10,11 @@ class CodeValidator:
     """Validate HTML/CSS/JS trước khi lưu file"""
     
     @staticmethod
+    @traced("validate.html")
     def validate_html(html_code: str) -> tuple[bool, str]:
         """Kiểm tra HTML có hợp lệ không"""
         try:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(html_code, 'html.parser')
             
             # Kiểm tra không có thẻ html/head/body bọc ngoài
@@ -28,9 +30,11 @@ class CodeValidator:
             return False, f"HTML parse error: {str(e)}"
     
     @staticmethod
+    @traced("validate.js")
     def validate_js(js_code: str) -> tuple[bool, str]:
         """Kiểm tra JS syntax"""
         try:
+            import esprima
             esprima.parseScript(js_code)
             
             # Kiểm tra không dùng localStorage/sessionStorage
@@ -0,0 +1,269 @@
+# process/watch.py
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from process import tracing
+from process.fragments import rerender
+from process.logs import log_context, new_run_id
+from process.pipeline import ExcelToJsonPipeline, iter_lessons
+from process.records import LessonRecord
+from process.store import atomic_write, lesson_key
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái đầu vào lần đồng bộ trước (hash workbook / template / prompt / từng bài học)
+STATE_FILE = "watch.json"
+
+
+def file_hash(path: Optional[str]) -> Optional[str]:
+    """sha256 nội dung file (None nếu không có)"""
+    if not path or not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def lesson_hash(exp_data) -> str:
+    """Hash nội dung bài học (các cột gốc; LessonRecord đọc với verify=True có sẵn trong content_hash)"""
+    return LessonRecord.from_dict(exp_data)['content_hash']
+
+
+class PollingMonitor:
+    """
+    Phát hiện thay đổi file bằng polling mtime/kích thước (không cần thư viện ngoài,
+    chạy được trên ổ mạng). Chỉ là tín hiệu rẻ; có thật sự đổi hay không do hash quyết định.
+    """
+
+    def __init__(self, paths: List[str], suffixes: Tuple[str, ...] = ('.json', '.xlsx', '.html', '.txt')):
+        self.paths = [p for p in paths if p]
+        self.suffixes = suffixes
+        self._snapshot = self.scan()
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        stats = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                    files = [os.path.join(dirpath, n) for n in filenames
+                             if n.endswith(self.suffixes) and not n.startswith(('.', '~$'))]
+                    stats.update(self._stat(files))
+            else:
+                stats.update(self._stat([path]))
+        return stats
+
+    @staticmethod
+    def _stat(files):
+        for f in files:
+            try:
+                st = os.stat(f)
+            except FileNotFoundError:
+                continue
+            yield f, (st.st_mtime_ns, st.st_size)
+
+    def changed(self) -> List[str]:
+        """Các file thêm / sửa / xóa kể từ lần gọi trước"""
+        current = self.scan()
+        paths = [p for p in current.keys() | self._snapshot.keys() if current.get(p) != self._snapshot.get(p)]
+        self._snapshot = current
+        return sorted(paths)
+
+
+class LessonWatcher:
+    """
+    Theo dõi workbook, thư mục JSON, template và prompt đang dùng; mỗi đợt thay đổi chỉ xử lý
+    các bài bị ảnh hưởng (so hash đầu vào với trạng thái lần trước, lưu ở .fragments/watch.json):
+    - Workbook đổi → chuyển lại Excel → JSON
+    - Nội dung bài học đổi / bài mới → gọi AI sinh lại đúng các bài đó
+    - Template đổi → render lại từ fragments đã lưu (không gọi AI)
+    - Prompt đổi → chỉ sinh lại toàn bộ khi bật regenerate_on_prompt (tốn AI), mặc định chỉ cảnh báo
+    Thay đổi dồn dập (lưu file nhiều lần, chuyển Excel ghi nhiều JSON) được gộp sau `debounce` giây yên lặng.
+    """
+
+    def __init__(self, generator, json_dir: str, template_path: str, excel_path: Optional[str] = None,
+                 prompt_path: Optional[str] = None, debounce: float = 2.0, interval: float = 1.0,
+                 regenerate_on_prompt: bool = False, scheduler=None,
+                 on_sync: Optional[Callable[[Dict], None]] = None):
+        """
+        Args:
+            generator: ExperimentGenerator (có output_dir → có FragmentStore)
+            json_dir: Thư mục JSON bài học
+            template_path: Template HTML đang dùng
+            excel_path: Workbook nguồn (None = chỉ theo dõi JSON)
+            prompt_path: Prompt config đang dùng
+            debounce: Số giây yên lặng trước khi xử lý một đợt thay đổi
+            interval: Chu kỳ polling (giây)
+            regenerate_on_prompt: Prompt đổi thì sinh lại toàn bộ bài
+            scheduler: LessonScheduler cho các bài cần sinh lại
+            on_sync: Callback(stats) sau mỗi đợt (vd: GUI quét lại danh sách)
+        """
+        if not generator.fragments:
+            raise ValueError("generator cần output_dir để lưu fragments")
+        self.generator = generator
+        self.json_dir = json_dir
+        self.template_path = template_path
+        self.excel_path = excel_path
+        self.prompt_path = prompt_path
+        self.debounce = debounce
+        self.interval = interval
+        self.regenerate_on_prompt = regenerate_on_prompt
+        self.scheduler = scheduler
+        self.on_sync = on_sync
+        self.state_path = os.path.join(generator.fragments.root, STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self) -> Optional[Dict]:
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_state(self):
+        atomic_write(self.state_path, json.dumps(self.state, ensure_ascii=False, indent=1))
+
+    def _current_lessons(self) -> Dict[str, Tuple[object, str]]:
+        return {lesson_key(l): (l, lesson_hash(l)) for _, l in iter_lessons(self.json_dir, verify=True)}
+
+    def sync(self) -> Dict:
+        """
+        Đồng bộ một lần: tìm các bài bị ảnh hưởng so với trạng thái trước và xử lý
+
+        Returns:
+            dict: Thống kê {"converted", "regenerated", "failed", "rerendered", "removed"}
+        """
+        stats = {"converted": False, "regenerated": 0, "failed": 0, "rerendered": 0, "removed": 0}
+        excel = file_hash(self.excel_path)
+        if self.state and excel and excel != self.state.get('excel'):
+            logger.info("📗 Workbook thay đổi, chuyển lại sang JSON: %s", self.excel_path)
+            pipeline = ExcelToJsonPipeline(self.excel_path, self.json_dir)
+            stats["converted"] = bool(pipeline.load_excel() and pipeline.process_all())
+
+        lessons = self._current_lessons()
+        template, prompt = file_hash(self.template_path), file_hash(self.prompt_path)
+        if self.state is None:
+            # Lần đầu: chỉ ghi nhận trạng thái, không sinh lại cả thư viện
+            self.state = {'excel': excel, 'template': template, 'prompt': prompt,
+                          'lessons': {k: h for k, (_, h) in lessons.items()}}
+            self._save_state()
+            logger.info("📸 Ghi nhận trạng thái ban đầu: %s bài, theo dõi thay đổi...", len(lessons))
+            return stats
+
+        known = self.state['lessons']
+        changed = [k for k, (_, h) in lessons.items() if known.get(k) != h]
+        removed = [k for k in known if k not in lessons]
+        if prompt != self.state.get('prompt'):
+            if self.regenerate_on_prompt:
+                logger.info("📝 Prompt thay đổi → sinh lại toàn bộ %s bài", len(lessons))
+                changed = list(lessons)
+            else:
+                logger.warning("⚠️ Prompt thay đổi; các trang cũ giữ nguyên (bật sinh lại khi đổi prompt để cập nhật)")
+
+        if changed:
+            logger.info("🔁 %s bài cần sinh lại bằng AI", len(changed))
+            results = self.generator.generate_batch([lessons[k][0] for k in changed], self.template_path,
+                                                    self.prompt_path, scheduler=self.scheduler)
+            for key, filename in zip(changed, results):
+                if filename:
+                    known[key] = lessons[key][1]
+                    stats["regenerated"] += 1
+                else:
+                    stats["failed"] += 1  # giữ hash cũ → đợt sau thử lại
+
+        if template != self.state.get('template'):
+            regenerated = set(changed)
+            keys = [k for k in self.generator.fragments.keys() if k not in regenerated]
+            logger.info("🎨 Template thay đổi → render lại %s trang (không gọi AI)", len(keys))
+            stats["rerendered"] = rerender(self.template_path, self.generator.output_dir,
+                                           fragments_root=self.generator.fragments.root, keys=keys)
+
+        for key in removed:
+            # Trang cũ giữ nguyên trên đĩa; chỉ bỏ khỏi trạng thái
+            known.pop(key, None)
+        stats["removed"] = len(removed)
+        if removed:
+            logger.info("🗑️ %s bài không còn trong JSON (trang cũ được giữ lại)", len(removed))
+
+        self.state.update({'excel': excel, 'template': template, 'prompt': prompt})
+        self._save_state()
+        return stats
+
+    def run(self, stop: Optional[threading.Event] = None):
+        """Vòng theo dõi: polling, gộp thay đổi trong cửa sổ debounce rồi sync()"""
+        stop = stop or threading.Event()
+        monitor = PollingMonitor([self.json_dir, self.excel_path, self.template_path, self.prompt_path])
+        with log_context(run=new_run_id()):
+            self._sync_and_notify()
+            monitor.changed()  # bỏ qua file do chính lần sync vừa ghi (JSON sau khi chuyển Excel)
+            pending, last_change = [], 0.0
+            while not stop.wait(self.interval):
+                paths = monitor.changed()
+                if paths:
+                    pending.extend(paths)
+                    last_change = time.monotonic()
+                elif pending and time.monotonic() - last_change >= self.debounce:
+                    logger.info("👀 %s file thay đổi: %s%s", len(set(pending)),
+                                ", ".join(sorted(set(map(os.path.basename, pending)))[:5]),
+                                "..." if len(set(pending)) > 5 else "")
+                    pending = []
+                    self._sync_and_notify()
+                    monitor.changed()
+
+    def _sync_and_notify(self):
+        try:
+            stats = self.sync()
+        except Exception as e:
+            logger.error("❌ Lỗi khi đồng bộ thay đổi: %s", e)
+            return
+        if self.on_sync:
+            self.on_sync(stats)
+
+
+def main():
+    from process.generate import ExperimentGenerator
+    from process.scheduler import LessonScheduler
+    from process.workqueue import _make_router
+
+    parser = argparse.ArgumentParser(description="Theo dõi thay đổi đầu vào và chỉ sinh lại / render lại các bài bị ảnh hưởng")
+    parser.add_argument('--excel', type=str, help='Workbook nguồn (tự chuyển lại sang JSON khi đổi)')
+    parser.add_argument('--json_dir', type=str, default='json_output', help='Thư mục JSON bài học')
+    parser.add_argument('--template', type=str, default='resources/templates/modern.html')
+    parser.add_argument('--prompt', type=str, default='resources/prompts/default.txt')
+    parser.add_argument('--output_dir', type=str, default='generated_output')
+    parser.add_argument('--debounce', type=float, default=2.0, help='Số giây yên lặng trước khi xử lý')
+    parser.add_argument('--interval', type=float, default=1.0, help='Chu kỳ polling (giây)')
+    parser.add_argument('--policy', type=str, default='sjf', help='Thứ tự sinh: fifo / sjf / chapter')
+    parser.add_argument('--regenerate_on_prompt', action='store_true', help='Prompt đổi thì sinh lại toàn bộ bài')
+    parser.add_argument('--once', action='store_true', help='Đồng bộ 1 lần rồi thoát')
+    parser.add_argument('--trace', type=str, help='Ghi Chrome trace JSON + bảng thời gian theo giai đoạn')
+    args = parser.parse_args()
+    tracing.configure(args.trace)
+
+    generator = ExperimentGenerator(None, args.output_dir, router=_make_router())
+    watcher = LessonWatcher(generator, args.json_dir, args.template, excel_path=args.excel,
+                            prompt_path=args.prompt, debounce=args.debounce, interval=args.interval,
+                            regenerate_on_prompt=args.regenerate_on_prompt,
+                            scheduler=LessonScheduler(policy=args.policy))
+    if args.once:
+        print(json.dumps(watcher.sync()))
+        return
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        logger.info("👋 Dừng theo dõi")
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    main()
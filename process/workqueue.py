@@ -0,0 +1,528 @@
+# process/workqueue.py
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import tempfile
+import argparse
+import threading
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from process import tracing
+from process.logs import bind_context, log_context
+from process.records import LessonRecord
+from process.store import atomic_write, lesson_key
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Lease:
+    """Quyền xử lý tạm thời một task; hết hạn nếu worker không heartbeat"""
+    task_id: str
+    payload: Dict
+    token: str
+    owner: str
+    attempts: int
+    expires: float
+
+
+class WorkQueue(ABC):
+    """
+    Giao diện chung cho hàng đợi công việc dùng chung giữa nhiều máy:
+    - enqueue idempotent theo task_id (enqueue lại task đã có thì bỏ qua)
+    - lease với visibility timeout: task quay lại hàng đợi nếu worker chết
+    - heartbeat gia hạn lease khi đang xử lý task dài
+    - complete idempotent: hoàn thành 2 lần (do lease hết hạn rồi bị lấy lại) không sao
+    Thứ tự lấy task = thứ tự enqueue (producer tự sắp lịch trước khi enqueue).
+    """
+
+    @abstractmethod
+    def enqueue(self, task_id: str, payload: Dict) -> bool:
+        """Thêm task; False nếu task_id đã có trong hàng đợi"""
+
+    @abstractmethod
+    def lease(self, owner: str, visibility_timeout: float = 300.0) -> Optional[Lease]:
+        """Lấy task kế tiếp (None nếu hết task đang chờ)"""
+
+    @abstractmethod
+    def heartbeat(self, lease: Lease, visibility_timeout: float = 300.0) -> bool:
+        """Gia hạn lease; False nếu lease đã mất (hết hạn và bị worker khác lấy)"""
+
+    @abstractmethod
+    def complete(self, lease: Lease, result: Optional[Dict] = None) -> bool:
+        """Đánh dấu task hoàn thành"""
+
+    @abstractmethod
+    def fail(self, lease: Lease, error: str) -> bool:
+        """Trả task về hàng đợi để thử lại, hoặc chuyển sang failed nếu hết số lần thử"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Số task theo trạng thái: pending / leased / done / failed"""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    Hàng đợi trên một file SQLite (WAL). Phù hợp nhiều worker trên cùng máy hoặc
+    ổ đĩa cục bộ; với thư mục mạng (NFS/SMB) nên dùng FileSystemWorkQueue.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT UNIQUE NOT NULL,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        owner TEXT,
+        token TEXT,
+        expires REAL,
+        result TEXT,
+        error TEXT,
+        updated REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, seq);
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        """
+        Args:
+            path: Đường dẫn file SQLite
+            max_attempts: Số lần lease tối đa trước khi task bị đánh dấu failed
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Mỗi thread 1 connection; autocommit, transaction tự quản lý bằng BEGIN IMMEDIATE
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, task_id: str, payload: Dict) -> bool:
+        with self._tx() as c:
+            cur = c.execute("INSERT OR IGNORE INTO tasks (task_id, payload, updated) VALUES (?, ?, ?)",
+                            (task_id, json.dumps(payload, ensure_ascii=False), time.time()))
+            return cur.rowcount == 1
+
+    def lease(self, owner: str, visibility_timeout: float = 300.0) -> Optional[Lease]:
+        now = time.time()
+        with self._tx() as c:
+            # Lease hết hạn → worker đã chết: trả task về hàng đợi (hoặc failed nếu hết lượt)
+            c.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                      "token = NULL, error = 'lease expired', updated = ? "
+                      "WHERE state = 'leased' AND expires < ?", (self.max_attempts, now, now))
+            row = c.execute("SELECT task_id, payload, attempts FROM tasks WHERE state = 'pending' "
+                            "ORDER BY seq LIMIT 1").fetchone()
+            if not row:
+                return None
+            token = uuid.uuid4().hex
+            expires = now + visibility_timeout
+            c.execute("UPDATE tasks SET state = 'leased', owner = ?, token = ?, expires = ?, "
+                      "attempts = attempts + 1, updated = ? WHERE task_id = ?",
+                      (owner, token, expires, now, row[0]))
+        return Lease(row[0], json.loads(row[1]), token, owner, row[2] + 1, expires)
+
+    def heartbeat(self, lease: Lease, visibility_timeout: float = 300.0) -> bool:
+        expires = time.time() + visibility_timeout
+        with self._tx() as c:
+            cur = c.execute("UPDATE tasks SET expires = ?, updated = ? "
+                            "WHERE task_id = ? AND token = ? AND state = 'leased'",
+                            (expires, time.time(), lease.task_id, lease.token))
+        if cur.rowcount == 1:
+            lease.expires = expires
+            return True
+        return False
+
+    def complete(self, lease: Lease, result: Optional[Dict] = None) -> bool:
+        with self._tx() as c:
+            c.execute("UPDATE tasks SET state = 'done', token = NULL, result = ?, error = NULL, updated = ? "
+                      "WHERE task_id = ? AND state != 'done'",
+                      (json.dumps(result or {}, ensure_ascii=False), time.time(), lease.task_id))
+        return True
+
+    def fail(self, lease: Lease, error: str) -> bool:
+        with self._tx() as c:
+            cur = c.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                            "token = NULL, error = ?, updated = ? WHERE task_id = ? AND token = ?",
+                            (self.max_attempts, error, time.time(), lease.task_id, lease.token))
+        return cur.rowcount == 1
+
+    def stats(self) -> Dict[str, int]:
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for state, n in self._conn().execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"):
+            counts[state] = n
+        return counts
+
+
+class FileSystemWorkQueue(WorkQueue):
+    """
+    Hàng đợi trên thư mục dùng chung (NFS/SMB/ổ mạng), không cần dịch vụ ngoài.
+    Mọi chuyển trạng thái là một os.rename nguyên tử, worker thắng rename mới có task:
+        pending/<seq>_<id>.<attempts>.json
+        leased/<seq>_<id>.<attempts>.<token>.<expires_ms>.json
+        done/<seq>_<id>.json, failed/<seq>_<id>.json
+    Mỗi task_id có file đánh dấu ids/<id> (tạo nguyên tử, chứa <seq>_<id>) → enqueue idempotent và
+    tìm task theo tên file trực tiếp, không liệt kê done/ (thư mục lớn dần theo thời gian).
+    """
+
+    STATES = ('pending', 'leased', 'done', 'failed')
+
+    def __init__(self, root: str, max_attempts: int = 3):
+        self.root = root
+        self.max_attempts = max_attempts
+        for state in self.STATES:
+            os.makedirs(os.path.join(root, state), exist_ok=True)
+        ids = os.path.join(root, 'ids')
+        if not os.path.isdir(ids):
+            # Hàng đợi tạo trước khi có ids/: đánh dấu các task đã có (1 lần)
+            os.makedirs(ids, exist_ok=True)
+            for state in self.STATES:
+                for name in self._list(state):
+                    with open(os.path.join(ids, self._task_id(name)), 'w', encoding='utf-8') as f:
+                        f.write(name.split('.', 1)[0])
+
+    def _dir(self, state: str) -> str:
+        return os.path.join(self.root, state)
+
+    def _list(self, state: str) -> List[str]:
+        return sorted(n for n in os.listdir(self._dir(state)) if n.endswith('.json') and not n.startswith('.'))
+
+    @staticmethod
+    def _task_id(name: str) -> str:
+        return name.split('.', 1)[0].split('_', 1)[1]
+
+    def _base(self, task_id: str) -> Optional[str]:
+        """<seq>_<id> của task (phần tên file không đổi qua các trạng thái), đọc từ ids/<id>"""
+        marker = os.path.join(self.root, 'ids', task_id)
+        try:
+            with open(marker, encoding='utf-8') as f:
+                base = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if base:
+            return base
+        # Marker rỗng (phiên bản cũ chỉ tạo file): quét 1 lần rồi ghi lại
+        for state in self.STATES:
+            for name in self._list(state):
+                if self._task_id(name) == task_id:
+                    base = name.split('.', 1)[0]
+                    atomic_write(marker, base)
+                    return base
+        return None
+
+    def _find(self, task_id: str) -> Optional[Tuple[str, str]]:
+        base = self._base(task_id)
+        if not base:
+            return None
+        for state in ('done', 'failed'):
+            if os.path.exists(os.path.join(self._dir(state), f"{base}.json")):
+                return state, f"{base}.json"
+        # Chỉ pending/leased còn phải liệt kê (tên chứa số lần thử, token): số task đang chờ, không phải tổng
+        for state in ('leased', 'pending'):
+            for name in self._list(state):
+                if name.startswith(base + '.'):
+                    return state, name
+        return None
+
+    def _move(self, src_state: str, src: str, dst_state: str, dst: str) -> bool:
+        try:
+            os.rename(os.path.join(self._dir(src_state), src), os.path.join(self._dir(dst_state), dst))
+            return True
+        except OSError:
+            return False  # worker khác đã chuyển file trước
+
+    @staticmethod
+    def _parse_leased(name: str) -> Tuple[str, int, str, float]:
+        base, attempts, token, expires_ms, _ = name.split('.')
+        return base, int(attempts), token, int(expires_ms) / 1000
+
+    def enqueue(self, task_id: str, payload: Dict) -> bool:
+        marker = os.path.join(self.root, 'ids', task_id)
+        base = f"{time.time_ns():020d}_{task_id}"
+        # Ghi file tạm rồi hardlink: link thất bại nếu marker đã có (như O_EXCL), không ai đọc được marker rỗng
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.root, 'ids'), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(base)
+            os.link(tmp, marker)
+        except FileExistsError:
+            return False
+        finally:
+            os.unlink(tmp)
+        try:
+            atomic_write(os.path.join(self._dir('pending'), f"{base}.0.json"),
+                         json.dumps({'task_id': task_id, 'payload': payload}, ensure_ascii=False))
+        except OSError:
+            os.remove(marker)
+            raise
+        return True
+
+    def _reclaim_expired(self):
+        now = time.time()
+        for name in self._list('leased'):
+            base, attempts, _, expires = self._parse_leased(name)
+            if expires >= now:
+                continue
+            if attempts >= self.max_attempts:
+                self._move('leased', name, 'failed', f"{base}.json")
+            else:
+                self._move('leased', name, 'pending', f"{base}.{attempts}.json")
+
+    def lease(self, owner: str, visibility_timeout: float = 300.0) -> Optional[Lease]:
+        self._reclaim_expired()
+        for name in self._list('pending'):
+            base, attempts, _ = name.split('.')
+            token = f"{owner.replace('.', '-')}-{uuid.uuid4().hex[:8]}"
+            expires = time.time() + visibility_timeout
+            leased = f"{base}.{int(attempts) + 1}.{token}.{int(expires * 1000)}.json"
+            if not self._move('pending', name, 'leased', leased):
+                continue
+            with open(os.path.join(self._dir('leased'), leased), encoding='utf-8') as f:
+                data = json.load(f)
+            return Lease(data['task_id'], data['payload'], token, owner, int(attempts) + 1, expires)
+        return None
+
+    def _leased_name(self, lease: Lease) -> Optional[str]:
+        # Tên file lease suy ra được từ chính lease (heartbeat cập nhật lease.expires cùng lúc đổi tên)
+        base = self._base(lease.task_id)
+        name = base and f"{base}.{lease.attempts}.{lease.token}.{int(lease.expires * 1000)}.json"
+        if name and os.path.exists(os.path.join(self._dir('leased'), name)):
+            return name
+        return None
+
+    def heartbeat(self, lease: Lease, visibility_timeout: float = 300.0) -> bool:
+        name = self._leased_name(lease)
+        if not name:
+            return False
+        base, attempts, token, _ = self._parse_leased(name)
+        expires = time.time() + visibility_timeout
+        if self._move('leased', name, 'leased', f"{base}.{attempts}.{token}.{int(expires * 1000)}.json"):
+            lease.expires = expires
+            return True
+        return False
+
+    def complete(self, lease: Lease, result: Optional[Dict] = None) -> bool:
+        found = self._find(lease.task_id)
+        if not found or found[0] == 'done':
+            return True
+        state, name = found
+        base = name.split('.', 1)[0]
+        # Task đã hoàn thành thì bất kể lease còn hay mất, kết quả vẫn hợp lệ
+        if self._move(state, name, 'done', f"{base}.json"):
+            path = os.path.join(self._dir('done'), f"{base}.json")
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            data['result'] = result or {}
+            atomic_write(path, json.dumps(data, ensure_ascii=False))
+        return True
+
+    def fail(self, lease: Lease, error: str) -> bool:
+        name = self._leased_name(lease)
+        if not name:
+            return False
+        base, attempts, _, _ = self._parse_leased(name)
+        if attempts >= self.max_attempts:
+            return self._move('leased', name, 'failed', f"{base}.json")
+        return self._move('leased', name, 'pending', f"{base}.{attempts}.json")
+
+    def stats(self) -> Dict[str, int]:
+        return {state: len(self._list(state)) for state in self.STATES}
+
+
+def open_queue(uri: str, **kwargs) -> WorkQueue:
+    """'sqlite:path/queue.db' hoặc 'fs:path/to/dir' (mặc định: thư mục → fs, file .db → sqlite)"""
+    scheme, _, path = uri.partition(':')
+    if scheme == 'sqlite':
+        return SQLiteWorkQueue(path, **kwargs)
+    if scheme == 'fs':
+        return FileSystemWorkQueue(path, **kwargs)
+    return SQLiteWorkQueue(uri, **kwargs) if uri.endswith('.db') else FileSystemWorkQueue(uri, **kwargs)
+
+
+def enqueue_lessons(queue: WorkQueue, lessons: List[Dict], dedup: bool = True, scheduler=None) -> int:
+    """
+    Producer: gộp bài trùng lặp, sắp lịch rồi enqueue mỗi cụm thành 1 task
+    (payload chứa bài đại diện + các bài dùng chung kết quả)
+
+    Returns:
+        int: Số task mới được thêm
+    """
+    from process.dedup import LessonDeduplicator
+
+    clusters = LessonDeduplicator().cluster(lessons) if dedup else [[i] for i in range(len(lessons))]
+    if scheduler:
+        rank = {idx: r for r, idx in enumerate(scheduler.order(lessons))}
+        clusters.sort(key=lambda c: min(rank[i] for i in c))
+    added = sum(queue.enqueue(lesson_key(lessons[c[0]]), {'lessons': [dict(lessons[i]) for i in c]})
+                for c in clusters)
+    logger.info("📥 Enqueue %s task mới (%s đã có) cho %s bài", added, len(clusters) - added, len(lessons))
+    return added
+
+
+class QueueWorker:
+    """
+    Worker không trạng thái: lease task → sinh fragments → render từng bài vào OutputStore dùng chung
+    → complete. Mỗi task có luồng heartbeat riêng; `concurrency` task được xử lý đồng thời.
+    """
+
+    def __init__(self, queue: WorkQueue, generator, template_path: str, worker_id: Optional[str] = None,
+                 visibility_timeout: float = 300.0, concurrency: int = 4):
+        """
+        Args:
+            queue: WorkQueue dùng chung
+            generator: ExperimentGenerator (output_dir trỏ tới store dùng chung)
+            template_path: Template HTML để render
+            worker_id: Tên worker (mặc định hostname-pid)
+            visibility_timeout: Lease hết hạn sau bấy nhiêu giây nếu không heartbeat
+            concurrency: Số task xử lý song song trên worker này
+        """
+        self.queue = queue
+        self.generator = generator
+        self.template = generator._load_template(template_path)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.visibility_timeout = visibility_timeout
+        self.concurrency = max(1, concurrency)
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def _heartbeat_loop(self, lease: Lease, stop: threading.Event):
+        while not stop.wait(self.visibility_timeout / 3):
+            if not self.queue.heartbeat(lease, self.visibility_timeout):
+                logger.warning("⚠️ Mất lease của task %s", lease.task_id)
+                return
+
+    def process(self, lease: Lease) -> bool:
+        with log_context(lesson=lease.task_id[:8]):
+            return self._process(lease)
+
+    def _process(self, lease: Lease) -> bool:
+        lessons = [LessonRecord.from_dict(l) for l in lease.payload['lessons']]
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat_loop, args=(lease, stop), daemon=True)
+        beat.start()
+        try:
+            fragments = self.generator._generate_fragments(lessons[0])
+            if not fragments:
+                logger.warning("⚠️ Task %s lỗi (lần %s)", lease.task_id, lease.attempts)
+                self.queue.fail(lease, "generation failed")
+                return False
+            files = [self.generator._publish(l, self.template, fragments) for l in lessons]
+            self.generator.store.flush()
+            self.queue.complete(lease, {'files': files, 'worker': self.worker_id})
+            return True
+        except Exception as e:
+            logger.error("❌ Task %s: %s", lease.task_id, e)
+            self.queue.fail(lease, str(e))
+            return False
+        finally:
+            stop.set()
+
+    def _slot(self, idle_timeout: float, poll: float):
+        idle_since = time.monotonic()
+        while True:
+            lease = self.queue.lease(self.worker_id, self.visibility_timeout)
+            if lease is None:
+                if time.monotonic() - idle_since >= idle_timeout:
+                    return
+                time.sleep(poll)
+                continue
+            ok = self.process(lease)
+            with self._lock:
+                self.processed += ok
+                self.failed += not ok
+            idle_since = time.monotonic()
+
+    def run(self, idle_timeout: float = 30.0, poll: float = 2.0):
+        """Chạy đến khi hàng đợi rỗng liên tục `idle_timeout` giây"""
+        logger.info("👷 Worker %s: %s luồng", self.worker_id, self.concurrency)
+        with log_context(run=self.worker_id), ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+            for f in [ex.submit(bind_context(self._slot), idle_timeout, poll) for _ in range(self.concurrency)]:
+                f.result()
+        self.generator.predictor.flush()
+        logger.info("👷 Worker %s: xong %s, lỗi %s; hàng đợi %s",
+                    self.worker_id, self.processed, self.failed, self.queue.stats())
+
+
+def _make_router():
+    from dotenv import load_dotenv
+    from api.callAPI import get_vertex_ai_credentials
+    from api.router import ModelRouter
+    load_dotenv()
+    if os.getenv("VERTEX_FAKE"):
+        return ModelRouter()
+    creds = get_vertex_ai_credentials()
+    if not creds:
+        raise SystemExit("❌ Cannot create Vertex AI credentials. Check your .env file.")
+    return ModelRouter(os.getenv("PROJECT_ID"), creds)
+
+
+def main():
+    from process.pipeline import iter_lessons
+
+    parser = argparse.ArgumentParser(description="Hàng đợi công việc dùng chung: enqueue trên 1 máy, worker trên nhiều máy")
+    parser.add_argument('command', choices=['enqueue', 'worker', 'stats'])
+    parser.add_argument('--queue', type=str, default='work_queue',
+                        help="Thư mục (fs:) hoặc file SQLite (sqlite:...db) của hàng đợi")
+    parser.add_argument('--json_dir', type=str, default='json_output', help='Thư mục JSON bài học (enqueue)')
+    parser.add_argument('--no_dedup', action='store_true', help='Không gộp bài trùng lặp')
+    parser.add_argument('--policy', type=str, default='sjf', help='Thứ tự enqueue: fifo / sjf / chapter')
+    parser.add_argument('--template', type=str, default='resources/templates/modern.html')
+    parser.add_argument('--output_dir', type=str, default='generated_output', help='OutputStore dùng chung')
+    parser.add_argument('--concurrency', type=int, default=4, help='Số task song song trên worker này')
+    parser.add_argument('--visibility_timeout', type=float, default=300.0)
+    parser.add_argument('--idle_timeout', type=float, default=30.0, help='Thoát khi không có task trong bấy nhiêu giây')
+    parser.add_argument('--max_attempts', type=int, default=3)
+    parser.add_argument('--trace', type=str, help='Ghi Chrome trace JSON + bảng thời gian theo giai đoạn')
+    args = parser.parse_args()
+    tracing.configure(args.trace)
+
+    queue = open_queue(args.queue, max_attempts=args.max_attempts)
+
+    if args.command == 'enqueue':
+        from process.scheduler import LessonScheduler
+        lessons = [l for _, l in iter_lessons(args.json_dir)]
+        enqueue_lessons(queue, lessons, dedup=not args.no_dedup, scheduler=LessonScheduler(policy=args.policy))
+
+    elif args.command == 'worker':
+        from process.generate import ExperimentGenerator
+        generator = ExperimentGenerator(None, args.output_dir, router=_make_router())
+        QueueWorker(queue, generator, args.template, visibility_timeout=args.visibility_timeout,
+                    concurrency=args.concurrency).run(idle_timeout=args.idle_timeout)
+
+    print(json.dumps(queue.stats()))
+
+
+if __name__ == "__main__":
+    from process.logs import setup_logging
+    setup_logging()
+    main()
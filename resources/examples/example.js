@@ -1,70 +1,58 @@
 /** @format */
 
-const canvas = document.getElementById("mainCanvas");
-const ctx = canvas.getContext("2d");
+// Runtime Sim có sẵn trên trang: Sim.canvas, Sim.particles, Sim.loop, Sim.on, Sim.setText
+const view = Sim.canvas("mainCanvas");
+const particles = Sim.particles(200);
 
 const state = {
   running: false,
   temperature: 25,
-  particles: [],
 };
 
-function drawScene() {
-  ctx.clearRect(0, 0, canvas.width, canvas.height);
-
-  // Vẽ background
+function drawBackground(ctx, w, h) {
   ctx.fillStyle = "#1e3a8a";
-  ctx.fillRect(0, 0, canvas.width, canvas.height);
-
-  // Vẽ particles
-  state.particles.forEach(p => {
-    ctx.fillStyle = "red";
-    ctx.beginPath();
-    ctx.arc(p.x, p.y, 5, 0, Math.PI * 2);
-    ctx.fill();
-  });
+  ctx.fillRect(0, 0, w, h);
 }
 
-function updatePhysics() {
-  if (!state.running) return;
-
-  state.particles.forEach(p => {
-    p.x += p.vx;
-    p.y += p.vy;
-
-    // Bounce
-    if (p.x < 0 || p.x > canvas.width) p.vx *= -1;
-    if (p.y < 0 || p.y > canvas.height) p.vy *= -1;
-  });
-
-  drawScene();
-  requestAnimationFrame(updatePhysics);
+function update(dt) {
+  // Nhiệt độ càng cao hạt chuyển động càng nhanh
+  const speed = 1 + (state.temperature - 25) / 50;
+  particles.step(dt * speed, view.w, view.h);
+  view.invalidate();
+  view.redraw((ctx) => particles.draw(ctx, 5, "red"));
+  return state.running;
 }
 
-function init() {
-  // Tạo particles
+function spawnParticles() {
+  particles.clear();
   for (let i = 0; i < 10; i++) {
-    state.particles.push({
-      x: Math.random() * canvas.width,
-      y: Math.random() * canvas.height,
-      vx: (Math.random() - 0.5) * 2,
-      vy: (Math.random() - 0.5) * 2,
-    });
+    particles.spawn(
+      Math.random() * view.w,
+      Math.random() * view.h,
+      (Math.random() - 0.5) * 120,
+      (Math.random() - 0.5) * 120
+    );
   }
+}
+
+function init() {
+  view.setBackground(drawBackground);
+  spawnParticles();
+  view.redraw((ctx) => particles.draw(ctx, 5, "red"));
 
-  // Event listeners
-  document.getElementById("btnStart").onclick = () => {
+  Sim.on("btnStart", "click", () => {
     state.running = true;
-    updatePhysics();
-  };
+    Sim.loop.add(update);
+  });
 
-  document.getElementById("btnReset").onclick = () => {
+  Sim.on("btnReset", "click", () => {
     state.running = false;
-    state.particles = [];
-    init();
-  };
-
-  drawScene();
+    state.temperature = 25;
+    Sim.setText("tempValue", `${state.temperature}°C`);
+    spawnParticles();
+    view.invalidate();
+    view.redraw((ctx) => particles.draw(ctx, 5, "red"));
+  });
 }
 
 init();
@@ -0,0 +1,206 @@
+/** @format */
+
+// Sim - runtime dùng chung cho mọi trang thí nghiệm (được inject trước JS của bài học).
+// Dòng comment và thụt lề bị bỏ khi inject (process/fragments.py: load_runtime).
+const Sim = (() => {
+  // ======== DOM cache ========
+  const nodes = new Map();
+  function $(id) {
+    let el = nodes.get(id);
+    if (!el || !el.isConnected) {
+      el = document.getElementById(id);
+      if (el) nodes.set(id, el);
+    }
+    return el;
+  }
+  // Chỉ ghi DOM khi giá trị thật sự đổi (tránh layout/paint mỗi frame)
+  const texts = new Map();
+  function setText(id, value) {
+    const s = String(value);
+    if (texts.get(id) === s) return;
+    texts.set(id, s);
+    const el = $(id);
+    if (el) el.textContent = s;
+  }
+  function on(id, type, fn) {
+    const el = $(id);
+    if (el) el.addEventListener(type, fn);
+    return el;
+  }
+
+  // ======== Vòng animation duy nhất ========
+  // loop.add(fn(dt, t)) đăng ký; fn trả về false để tự gỡ. dt tính bằng giây, tối đa 0.05.
+  // Tự dừng khi tab ẩn hoặc không còn hàm nào, tự chạy lại khi cần.
+  const systems = [];
+  let rafId = 0;
+  let last = 0;
+  let paused = false;
+  function frame(t) {
+    const dt = last ? Math.min((t - last) / 1000, 0.05) : 0;
+    last = t;
+    for (let i = systems.length - 1; i >= 0; i--) {
+      if (systems[i](dt, t) === false) systems.splice(i, 1);
+    }
+    rafId = systems.length && !paused ? requestAnimationFrame(frame) : 0;
+    if (!rafId) last = 0;
+  }
+  function wake() {
+    if (!rafId && systems.length && !paused && !document.hidden) rafId = requestAnimationFrame(frame);
+  }
+  const loop = {
+    add(fn) {
+      if (!systems.includes(fn)) systems.push(fn);
+      wake();
+      return () => loop.remove(fn);
+    },
+    remove(fn) {
+      const i = systems.indexOf(fn);
+      if (i >= 0) systems.splice(i, 1);
+    },
+    pause() {
+      paused = true;
+      cancelAnimationFrame(rafId);
+      rafId = 0;
+      last = 0;
+    },
+    resume() {
+      paused = false;
+      wake();
+    },
+    get running() {
+      return rafId !== 0;
+    },
+  };
+  document.addEventListener("visibilitychange", () => {
+    if (document.hidden) {
+      cancelAnimationFrame(rafId);
+      rafId = 0;
+      last = 0;
+    } else wake();
+  });
+
+  // ======== Pool hạt dùng typed array (không tạo object mỗi frame) ========
+  // const p = Sim.particles(500); p.spawn(x, y, vx, vy, life); p.step(dt, w, h); p.forEach((i) => ...)
+  function particles(capacity, extra = []) {
+    const fields = ["x", "y", "vx", "vy", "life", ...extra];
+    const pool = { capacity, count: 0 };
+    for (const f of fields) pool[f] = new Float32Array(capacity);
+    pool.spawn = (x, y, vx = 0, vy = 0, life = Infinity) => {
+      if (pool.count >= capacity) return -1;
+      const i = pool.count++;
+      pool.x[i] = x;
+      pool.y[i] = y;
+      pool.vx[i] = vx;
+      pool.vy[i] = vy;
+      pool.life[i] = life;
+      for (const f of extra) pool[f][i] = 0;
+      return i;
+    };
+    // Xóa bằng cách đổi chỗ với phần tử cuối: O(1), mảng luôn liền mạch
+    pool.kill = (i) => {
+      const j = --pool.count;
+      if (i !== j) for (const f of fields) pool[f][i] = pool[f][j];
+    };
+    pool.clear = () => {
+      pool.count = 0;
+    };
+    // Di chuyển theo vận tốc, giảm life, nảy ở biên (w, h > 0) hoặc bỏ hạt ra ngoài (bounce = false)
+    pool.step = (dt, w = 0, h = 0, bounce = true) => {
+      const { x, y, vx, vy, life } = pool;
+      for (let i = pool.count - 1; i >= 0; i--) {
+        life[i] -= dt;
+        if (life[i] <= 0) {
+          pool.kill(i);
+          continue;
+        }
+        x[i] += vx[i] * dt;
+        y[i] += vy[i] * dt;
+        if (!w) continue;
+        const out = x[i] < 0 || x[i] > w || y[i] < 0 || y[i] > h;
+        if (out && !bounce) {
+          pool.kill(i);
+          continue;
+        }
+        if (x[i] < 0 || x[i] > w) {
+          vx[i] = -vx[i];
+          x[i] = x[i] < 0 ? 0 : w;
+        }
+        if (y[i] < 0 || y[i] > h) {
+          vy[i] = -vy[i];
+          y[i] = y[i] < 0 ? 0 : h;
+        }
+      }
+    };
+    pool.forEach = (fn) => {
+      for (let i = 0; i < pool.count; i++) fn(i);
+    };
+    // Vẽ mọi hạt cùng màu trong 1 path (1 lần fill thay vì N lần)
+    pool.draw = (ctx, radius, color) => {
+      ctx.fillStyle = color;
+      ctx.beginPath();
+      for (let i = 0; i < pool.count; i++) {
+        ctx.moveTo(pool.x[i] + radius, pool.y[i]);
+        ctx.arc(pool.x[i], pool.y[i], radius, 0, 6.283185307179586);
+      }
+      ctx.fill();
+    };
+    return pool;
+  }
+
+  // ======== Canvas + vẽ lại theo vùng bẩn ========
+  // const c = Sim.canvas("mainCanvas"); c.dirty.mark(x, y, w, h); c.redraw((ctx) => ...) chỉ vẽ lại vùng bẩn
+  function dirtyRect() {
+    const r = { x0: Infinity, y0: Infinity, x1: -Infinity, y1: -Infinity };
+    r.mark = (x, y, w, h) => {
+      r.x0 = Math.min(r.x0, x);
+      r.y0 = Math.min(r.y0, y);
+      r.x1 = Math.max(r.x1, x + w);
+      r.y1 = Math.max(r.y1, y + h);
+    };
+    r.markCircle = (x, y, radius) => r.mark(x - radius - 1, y - radius - 1, 2 * radius + 2, 2 * radius + 2);
+    r.empty = () => r.x1 <= r.x0 || r.y1 <= r.y0;
+    r.reset = () => {
+      r.x0 = r.y0 = Infinity;
+      r.x1 = r.y1 = -Infinity;
+    };
+    return r;
+  }
+  function canvas(id) {
+    const el = $(id);
+    const ctx = el.getContext("2d");
+    const c = { el, ctx, w: el.width, h: el.height, dirty: dirtyRect(), background: null };
+    // Nền tĩnh vẽ 1 lần vào canvas phụ, mỗi frame chỉ sao chép vùng cần
+    c.setBackground = (draw) => {
+      const bg = document.createElement("canvas");
+      bg.width = c.w;
+      bg.height = c.h;
+      draw(bg.getContext("2d"), c.w, c.h);
+      c.background = bg;
+      c.dirty.mark(0, 0, c.w, c.h);
+    };
+    c.invalidate = () => c.dirty.mark(0, 0, c.w, c.h);
+    // draw(ctx) được gọi với clip = vùng bẩn; không có vùng bẩn thì bỏ qua cả frame
+    c.redraw = (draw) => {
+      const d = c.dirty;
+      if (d.empty()) return false;
+      const x = Math.max(0, Math.floor(d.x0));
+      const y = Math.max(0, Math.floor(d.y0));
+      const w = Math.min(c.w, Math.ceil(d.x1)) - x;
+      const h = Math.min(c.h, Math.ceil(d.y1)) - y;
+      d.reset();
+      if (w <= 0 || h <= 0) return false;
+      ctx.save();
+      ctx.beginPath();
+      ctx.rect(x, y, w, h);
+      ctx.clip();
+      if (c.background) ctx.drawImage(c.background, x, y, w, h, x, y, w, h);
+      else ctx.clearRect(x, y, w, h);
+      draw(ctx);
+      ctx.restore();
+      return true;
+    };
+    return c;
+  }
+
+  return { $, setText, on, loop, particles, canvas, dirtyRect };
+})();
@@ -0,0 +1,123 @@
+# tests/test_concurrency.py
+
+import time
+import logging
+import threading
+
+import pytest
+
+from api.concurrency import AIMDLimiter, AdaptiveClient
+from api.fake import FakeVertexClient
+
+
+@pytest.fixture(autouse=True)
+def quiet_logs():
+    # FakeVertexClient log lỗi mỗi lần 429
+    logging.disable(logging.ERROR)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+def test_overload_decreases_multiplicatively():
+    limiter = AIMDLimiter(initial=8, decrease=0.5, latency_tolerance=None)
+    ticket = limiter.acquire()
+    limiter.release(ticket, 0.01, ok=False, overloaded=True)
+    assert limiter.limit == 4.0
+    assert limiter.counters['decreases'] == 1
+
+
+def test_fake_client_429_reaches_limiter():
+    backend = FakeVertexClient(latency=(0.05, 0.05), capacity=0, reject_latency=0.0)
+    client = AdaptiveClient(backend, initial=8, latency_tolerance=None)
+    assert client.send_data_to_AI("prompt") is None
+    assert '429' in client.last_call_info()['error']
+    assert client.metrics()['limit'] == 4.0
+    assert client.metrics()['overloads'] == 1
+
+
+def test_one_decrease_per_overload_episode():
+    limiter = AIMDLimiter(initial=8, decrease=0.5, latency_tolerance=None)
+    # Cả 4 request gửi trước lần giảm đầu tiên → cùng 1 đợt quá tải
+    tickets = [limiter.acquire() for _ in range(4)]
+    for ticket in tickets:
+        limiter.release(ticket, 0.01, ok=False, overloaded=True)
+    assert limiter.limit == 4.0
+    assert limiter.counters['decreases'] == 1
+
+    # Request gửi sau lần giảm mà vẫn 429 → đợt mới, giảm tiếp
+    time.sleep(0.001)
+    ticket = limiter.acquire()
+    limiter.release(ticket, 0.01, ok=False, overloaded=True)
+    assert limiter.limit == 2.0
+    assert limiter.counters['decreases'] == 2
+
+
+def test_increase_only_when_saturated():
+    limiter = AIMDLimiter(initial=4, increase=1.0, latency_tolerance=None)
+
+    # Chỉ dùng 1/4 giới hạn → không có lý do tăng
+    ticket = limiter.acquire()
+    assert not ticket.saturated
+    limiter.release(ticket, 0.01, ok=True)
+    assert limiter.limit == 4.0
+    assert limiter.counters['increases'] == 0
+
+    # Dùng hết 4 chỗ → request chiếm chỗ cuối cùng thành công thì tăng increase/limit
+    tickets = [limiter.acquire() for _ in range(4)]
+    assert [t.saturated for t in tickets] == [False, False, False, True]
+    for ticket in tickets:
+        limiter.release(ticket, 0.01, ok=True)
+    assert limiter.limit == pytest.approx(4.25)
+    assert limiter.counters['increases'] == 1
+
+
+def _hammer(client, workers=24, seconds=1.0):
+    stop = threading.Event()
+
+    def demand():
+        while not stop.is_set():
+            client.send_data_to_AI("prompt", max_output_tokens=100)
+
+    threads = [threading.Thread(target=demand) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+
+def test_in_flight_never_exceeds_slots():
+    backend = FakeVertexClient(latency=(0.005, 0.02), seed=1)
+    limiter = AIMDLimiter(initial=2, max_limit=6, latency_tolerance=None)
+    client = AdaptiveClient(backend, limiter)
+    violations = []
+    original_call = backend._call
+
+    def checked_call(*args, **kwargs):
+        # Không có 429 → giới hạn chỉ tăng, mọi request backend nhận phải nằm trong slots hiện tại
+        with limiter._cond:
+            if backend.in_flight >= limiter.slots or limiter.in_flight > limiter.slots:
+                violations.append((backend.in_flight, limiter.in_flight, limiter.slots))
+        return original_call(*args, **kwargs)
+
+    backend._call = checked_call
+    _hammer(client)
+
+    m = client.metrics()
+    assert not violations
+    assert m['in_flight'] == 0
+    assert m['max_in_flight'] <= m['slots'] <= 6
+
+
+def test_in_flight_bounded_under_overload():
+    backend = FakeVertexClient(latency=(0.005, 0.02), capacity=6, reject_latency=0.001, seed=1)
+    limiter = AIMDLimiter(initial=4, max_limit=16, latency_tolerance=None)
+    client = AdaptiveClient(backend, limiter)
+    _hammer(client)
+
+    m = client.metrics()
+    assert m['overloads'] > 0 and m['decreases'] > 0
+    assert m['in_flight'] == 0
+    # Request chỉ được cấp chỗ khi in_flight < slots → không bao giờ vượt giới hạn cao nhất từng có
+    assert m['max_in_flight'] <= max(int(h['limit']) for h in limiter.limit_history())